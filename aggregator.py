@@ -0,0 +1,60 @@
+import torch
+
+
+class FlatAggregator:
+    """把base_layers的全部参数放进一个连续向量，逐个客户端折叠进加权和，峰值内存O(模型大小)"""
+
+    def __init__(self, reference_state: dict, device):
+        self.device = device
+        self.keys = list(reference_state.keys())
+        self.shapes = [value.shape for value in reference_state.values()]
+        self.dtypes = [value.dtype for value in reference_state.values()]
+        self.numels = [value.numel() for value in reference_state.values()]
+        self.offsets = []
+        offset = 0
+        for numel in self.numels:
+            self.offsets.append(offset)
+            offset += numel
+        self.size = offset
+
+        self.buffer = torch.zeros(self.size, dtype=torch.float32, device=device)
+        self.total_weight = 0.0
+        self.count = 0
+
+    def reset(self):
+        self.buffer.zero_()
+        self.total_weight = 0.0
+        self.count = 0
+
+    def unflatten(self, flat: torch.Tensor) -> dict:
+        """把连续向量切成与state_dict同形状的视图，不拷贝数据"""
+        return {key: flat[offset:offset + numel].view(shape)
+                for key, offset, numel, shape in zip(self.keys, self.offsets, self.numels, self.shapes)}
+
+    def flatten(self, state_dict: dict) -> torch.Tensor:
+        """按缓冲区布局把state_dict拼成一个float32向量"""
+        return torch.cat([state_dict[key].detach().reshape(-1).to(self.device, torch.float32)
+                          for key in self.keys])
+
+    def add(self, state_dict: dict, weight: float = 1.0):
+        """把一个客户端的state_dict按缓冲区布局展平后按权重累加，整个模型一次向量化运算"""
+        self.add_flat(self.flatten(state_dict), weight)
+
+    def add_flat(self, flat: torch.Tensor, weight: float = 1.0):
+        """累加已经展平的更新，一次向量化运算"""
+        self.buffer.add_(flat.to(self.device, non_blocking=True), alpha=weight)
+        self.total_weight += weight
+        self.count += 1
+
+    def add_partial(self, partial: torch.Tensor, total_weight: float, count: int):
+        """累加下级聚合器已经加权求和的展平结果，partial = sum(weight_i * update_i)"""
+        self.buffer.add_(partial.to(self.device, non_blocking=True))
+        self.total_weight += total_weight
+        self.count += count
+
+    def result(self) -> dict:
+        """返回加权平均后的state_dict（一次除法加一次切分）"""
+        if self.total_weight == 0:
+            raise ValueError("没有可聚合的客户端更新")
+        mean = self.buffer / self.total_weight
+        return {key: value.to(dtype) for (key, value), dtype in zip(self.unflatten(mean).items(), self.dtypes)}
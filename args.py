@@ -14,12 +14,76 @@ def args_parser():
     parser.add_argument('--input_dim', type=int, default=784, help='输入特征维度（例如28x28=784）')
     parser.add_argument('--C', type=float, default=1.0, help='每轮参与客户端比例')
     parser.add_argument('--B', type=int, default=32, help='本地批量大小')
+    parser.add_argument('--data_cache', action='store_true',
+                        help='使用预处理好的内存映射数据分片代替逐样本transform（首次运行时写入--data_cache_dir）')
+    parser.add_argument('--data_cache_dir', type=str, default='data_cache', help='数据分片缓存目录')
+    parser.add_argument('--synthetic_data', action='store_true', help='使用同形状的随机数据代替PneumoniaMNIST（基准测试用）')
     parser.add_argument('--optimizer', type=str, default='adam', help='优化器')
     parser.add_argument('--device', default=torch.device("cuda" if torch.cuda.is_available() else "cpu"))
     parser.add_argument("--max_grad_threshold", type=float, default=1.0, help="梯度裁剪阈值")
     parser.add_argument('--weight_decay', type=float, default=1e-4, help='权重衰减')
+    parser.add_argument('--train_workers', type=int, default=1, help='并发训练的客户端数')
+    parser.add_argument('--train_mode', type=str, default='auto', choices=['auto', 'process', 'thread', 'serial'],
+                        help='并发训练方式：CPU默认多进程，GPU默认多线程')
+    parser.add_argument('--fast_train', action='store_true',
+                        help='低开销训练：每个客户端常驻优化器、设备上累计损失、锁页内存非阻塞拷贝')
+    parser.add_argument('--compile', action='store_true', help='--fast_train时用torch.compile编译模型')
+    parser.add_argument('--weighted_agg', action='store_true', help='按客户端训练样本数加权聚合')
+    parser.add_argument('--batched_val', action='store_true',
+                        help='共享base激活，一次前向验证所有客户端的personal_layers')
+    parser.add_argument('--async_server', action='store_true', help='使用asyncio服务器，更新到达即验证，达到法定数量即聚合')
+    parser.add_argument('--quorum', type=float, default=1.0, help='异步模式下每轮聚合所需的已验证更新比例')
+    parser.add_argument('--staleness_alpha', type=float, default=None,
+                        help='异步模式下迟到更新按(1+陈旧轮数)^-alpha降权后折叠进后续轮次，不设置则丢弃迟到更新')
+    parser.add_argument('--deadline_ms', type=float, default=0,
+                        help='每轮截止时间(ms)，按历史训练+签名耗时选择客户端，聚合前N个验证通过的更新，0表示关闭')
+    parser.add_argument('--over_provision', type=float, default=1.5, help='截止时间调度时超额选择的客户端倍数')
+    parser.add_argument('--edges', type=int, default=0,
+                        help='边缘聚合器进程数：各自验证本组客户端签名并对部分聚合结果签名，根节点只验证边缘签名，0表示不分层')
+    parser.add_argument('--transport', type=str, default='local', choices=['local', 'tcp'],
+                        help='客户端更新的传输方式：进程内直接传递或经本机TCP分帧发送')
+    parser.add_argument('--transport_host', type=str, default='127.0.0.1', help='TCP传输监听地址')
+    parser.add_argument('--transport_port', type=int, default=0, help='TCP传输监听端口，0表示自动分配')
+    parser.add_argument('--transport_connections', type=int, default=4,
+                        help='训练线程到服务器的持久连接数（进程模式下每个训练进程一条连接）')
+    parser.add_argument('--transport_max_frame_mb', type=int, default=64, help='服务器接收的单帧最大大小(MB)')
+    parser.add_argument('--transport_timeout', type=float, default=30,
+                        help='服务器等待本轮TCP更新的最长时间(秒)，超时未到达的客户端不参与本轮聚合')
     parser.add_argument('--use_sphincs', type=bool, default=True, help='是否使用SPHINCS+签名')
     parser.add_argument('--sphincs_security', type=int, default=128, help='SPHINCS+安全级别(128/192/256)')
+    parser.add_argument('--sphincs_params', type=str, default='',
+                        help='SPHINCS+参数集名称(如sha2-128f)，auto表示按安全级别和签名大小预算自动选择，为空使用原有参数')
+    parser.add_argument('--max_sig_size', type=int, default=0, help='自动选择参数集时的签名大小上限(字节)，0表示不限')
+    parser.add_argument('--param_profile', type=str, default='sphincs_profiles.json',
+                        help='参数集实测耗时缓存文件，按机器区分')
+    parser.add_argument('--batch_sign', action='store_true', help='每轮只对所有客户端更新的Merkle根签名一次')
+    parser.add_argument('--manifest', action='store_true', help='按张量分块构建Merkle清单并只对清单根签名')
+    parser.add_argument('--update_codec', type=str, default='none', choices=['none', 'fp16', 'int8', 'topk'],
+                        help='客户端更新编码：相对全局模型的增量按fp16/int8/top-k稀疏编码后再签名和聚合')
+    parser.add_argument('--topk_ratio', type=float, default=0.01, help='top-k编码保留的增量比例')
+    parser.add_argument('--manifest_chunk_size', type=int, default=65536, help='清单分块大小(字节)')
+    parser.add_argument('--verify_workers', type=int, default=1, help='签名验证进程数，大于1时使用进程池并行验证')
+    parser.add_argument('--keygen_workers', type=int, default=1, help='超树密钥生成/子树构建的并行进程数')
+    parser.add_argument('--fors_cache_mb', type=float, default=32,
+                        help='FORS树缓存的内存上限(MB)，相同(tree_idx, leaf_idx)再次签名时复用，0表示不缓存')
+    parser.add_argument('--hash_backend', type=str, default='hashlib', choices=['hashlib', 'numpy'],
+                        help='签名使用的哈希实现：逐条hashlib或NumPy多路SHA-256')
+    parser.add_argument('--bench_backends', type=str, default='hashlib,numpy', help='基准测试比较的哈希实现，逗号分隔')
+    parser.add_argument('--keystore_dir', type=str, default='',
+                        help='SPHINCS+密钥库目录（私钥以0600权限写入该目录），为空则每次重新生成密钥、不写入磁盘')
+    parser.add_argument('--ckpt_every', type=int, default=0, help='每隔多少轮保存一次检查点，0表示不保存')
+    parser.add_argument('--ckpt_path', type=str, default='checkpoints/fedper.ckpt', help='检查点文件路径')
+    parser.add_argument('--resume', action='store_true', help='从检查点恢复，继续未完成的轮次')
+    parser.add_argument('--metrics', action='store_true', help='记录各阶段耗时、哈希调用次数和签名字节数')
+    parser.add_argument('--metrics_jsonl', type=str, default='metrics.jsonl', help='逐事件导出的JSON lines文件')
+    parser.add_argument('--metrics_prom', type=str, default='metrics.prom', help='Prometheus文本格式导出文件')
+    parser.add_argument('--bench_levels', type=str, default='128,192,256', help='基准测试的安全级别或参数集名称，逗号分隔')
+    parser.add_argument('--bench_iters', type=int, default=5, help='每个基准项的重复次数')
+    parser.add_argument('--bench_rounds', type=int, default=1, help='端到端server_round基准的轮数，0表示跳过')
+    parser.add_argument('--bench_codecs', type=str, default='', help='逐个比较的更新编码，逗号分隔，为空则跳过')
+    parser.add_argument('--bench_output', type=str, default='bench_results.json', help='基准结果输出文件')
+    parser.add_argument('--bench_baseline', type=str, default='', help='用于回归比较的基准结果文件')
+    parser.add_argument('--bench_tolerance', type=float, default=0.2, help='p50耗时超过基线该比例即视为回归')
 
     args = parser.parse_args()
     return args
@@ -0,0 +1,179 @@
+import math
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from args import args_parser
+from client_executor import ClientExecutor
+from server import FedPer
+
+args = args_parser()
+
+
+class AsyncFedPer(FedPer):
+    """基于asyncio的服务器：每个客户端的训练、签名、验证作为独立任务并发推进
+
+    验证通过的更新一到达就折叠进聚合缓冲区，达到法定数量(quorum)后立即聚合进入下一轮；
+    没赶上本轮的更新继续在后台完成，设置了--staleness_alpha时按陈旧度加权折叠进之后的轮次
+    """
+
+    def __init__(self):
+        if args.batch_sign:
+            raise ValueError("异步模式逐个签名与验证，不支持--batch_sign")
+        if args.transport != 'local':
+            raise ValueError("异步模式目前只支持进程内传输")
+        if args.update_codec != 'none':
+            raise ValueError("异步模式的陈旧更新相对的全局模型各不相同，目前不支持--update_codec")
+        if args.edges > 0 or args.deadline_ms > 0:
+            raise ValueError("异步模式自行调度客户端，不能与--edges/--deadline_ms同时使用")
+        super().__init__()
+        if self.executor.mode == "serial":
+            # 串行模式在提交时直接训练，会阻塞事件循环，改为一个后台训练线程
+            optimizer_states = self.executor.optimizer_state_dicts()
+            self.executor = ClientExecutor(workers=1, mode="thread")
+            self.executor.load_optimizer_state_dicts(optimizer_states)
+        self._sign_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sphincs-sign")
+        """client_id -> (任务, 发起轮次)；仍在训练或验证中的客户端不会被再次选中"""
+        self.pending = {}
+
+    async def _client_update(self, client_id, round_idx) -> dict:
+        """一个客户端的完整流程：训练 -> 签名 -> 验证，各阶段都在执行器中运行，不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        model = self.client_models[client_id]
+        result = await asyncio.wrap_future(self.executor.submit(model, client_id))
+        trained_model = self.executor.apply(model, result)
+        self.tracer.record("train", result[3]['train_time_ms'], client=client_id)
+        update = {'client_id': client_id, 'round': round_idx, 'weights': trained_model.base_layers.state_dict(),
+                  'stats': result[3], 'verified': True}
+        if not self.signer:
+            return update
+
+        digest, manifest, signature, sign_time_ms, sign_size = await loop.run_in_executor(
+            self._sign_executor, self._sign_update, update['weights'], client_id)
+        [(is_valid, verify_time_ms)] = await asyncio.wrap_future(self.signer.submit_verify([digest], [signature]))
+        self.tracer.record("verify", verify_time_ms, client=client_id)
+        print(f"Client {client_id} | "
+              f"签名时间: {sign_time_ms:.2f}ms | "
+              f"验证时间: {verify_time_ms:.2f}ms | "
+              f"签名大小: {sign_size} bytes | "
+              f"验证结果: {'成功' if is_valid else '失败'}")
+        if manifest is not None:
+            is_valid, update['weights'] = self._check_manifest(client_id, trained_model, manifest, is_valid)
+
+        update.update(verified=is_valid, sign_time_ms=sign_time_ms, sign_size=sign_size,
+                      verify_time_ms=verify_time_ms)
+        return update
+
+    def _accept(self, task, round_idx, record) -> dict:
+        """处理一个已完成的任务：记录统计，验证通过则折叠（陈旧更新按(1+s)^-alpha降权）；
+        训练、签名或验证失败的客户端记入record['failed_clients']并返回None，不中断本轮"""
+        client_id = next(client_id for client_id, (pending, _) in self.pending.items() if pending is task)
+        del self.pending[client_id]
+        self.submitted_states.pop(client_id, None)
+        if task.exception() is not None:
+            record['failed_clients'].append(client_id)
+            print(f"Client {client_id} 训练/签名/验证失败: {task.exception()!r}")
+            return None
+        update = task.result()
+
+        if 'sign_time_ms' in update:
+            record['sign_times_ms'].append(update['sign_time_ms'])
+            record['sign_sizes'].append(update['sign_size'])
+            record['verify_times_ms'].append(update['verify_time_ms'])
+        record['train_stats'][client_id] = update['stats']
+        if not update['verified']:
+            return update
+
+        staleness = round_idx - update['round']
+        if staleness == 0:
+            self._fold_update(client_id, update['weights'], update['stats'])
+        elif args.staleness_alpha is not None:
+            scale = (1 + staleness) ** -args.staleness_alpha
+            self._fold_update(client_id, update['weights'], update['stats'], scale)
+            record['stale_folded'].append(client_id)
+            print(f"Client {client_id} | 陈旧更新(落后{staleness}轮) | 权重系数: {scale:.3f}")
+        else:
+            record['stale_dropped'].append(client_id)
+        return update
+
+    async def server_round_async(self, round_idx):
+        start_time = time.time()
+        self.aggregator.reset()
+        record = {'sign_times_ms': [], 'sign_sizes': [], 'verify_times_ms': [], 'train_stats': {},
+                  'stale_folded': [], 'stale_dropped': [], 'failed_clients': []}
+        self.tracer.set_round(round_idx)
+
+        if len(self.pending) >= args.K:
+            # 所有客户端都还在之前轮次的任务中，至少等一个完成
+            await asyncio.wait([task for task, _ in self.pending.values()], return_when=asyncio.FIRST_COMPLETED)
+        for task, _ in list(self.pending.values()):
+            if task.done():
+                self._accept(task, round_idx, record)
+
+        idle_clients = [client_id for client_id in range(args.K) if client_id not in self.pending]
+        num_selected = min(max(int(args.C * args.K), 1), len(idle_clients))
+        selected_clients = np.random.choice(idle_clients, num_selected, replace=False)
+        quorum = max(1, math.ceil(args.quorum * num_selected))
+        print(f"Round {round_idx + 1}: Selected clients: {selected_clients} | Quorum: {quorum}")
+
+        current = set()
+        for client_id in selected_clients.tolist():
+            self.client_models[client_id].base_layers.load_state_dict(self.global_base.state_dict())
+            if self.checkpointer is not None:
+                # 进程模式的训练结果在任务内写回，签名验证完成前也不能读取
+                self.submitted_states[client_id] = self._snapshot_client(client_id)
+            task = asyncio.create_task(self._client_update(client_id, round_idx))
+            self.pending[client_id] = (task, round_idx)
+            current.add(task)
+
+        waiting = {task for task, _ in self.pending.values()}
+        accepted = []
+        while current and len(accepted) < quorum:
+            done, waiting = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                update = self._accept(task, round_idx, record)
+                if task in current:
+                    current.discard(task)
+                    if update is not None and update['verified']:
+                        accepted.append(update['client_id'])
+
+        late_clients = sorted(client_id for client_id, (_, started) in self.pending.items() if started == round_idx)
+        if late_clients:
+            print(f"Round {round_idx + 1}: 已达到法定数量，未等待的客户端: {late_clients}")
+
+        return self._finish_round(round_idx, record, selected_clients.tolist(), {
+            'avg_update_bytes': self.aggregator.size * 4,
+            'quorum': quorum,
+            'accepted_clients': accepted,
+            'late_clients': late_clients,
+            'stale_folded': record['stale_folded'],
+            'stale_dropped': record['stale_dropped'],
+            'failed_clients': sorted(record['failed_clients']),
+            'round_time_ms': (time.time() - start_time) * 1000
+        })
+
+    def _background_clients(self) -> set:
+        # 仍在训练中的客户端模型由其任务持有
+        return set(self.pending)
+
+    async def _run_rounds_async(self):
+        # 检查点不保存仍在进行中的客户端任务及其未折叠的更新，这些客户端的个性化层和优化器状态取提交时的副本，
+        # 恢复后它们重新参与选择
+        for r in range(self.start_round, args.r):
+            print(f"\n=== Round {r + 1}/{args.r} ===")
+            with self.tracer.span("round"):
+                await self.server_round_async(r)
+            self._finish_round_metrics(r)
+            self._maybe_checkpoint(r)
+        if self.pending:
+            # 剩余更新已没有后续轮次可用，等待它们结束以便干净地关闭执行器
+            await asyncio.gather(*(task for task, _ in self.pending.values()), return_exceptions=True)
+            self.pending.clear()
+            self.submitted_states.clear()
+
+    def _run_rounds(self):
+        asyncio.run(self._run_rounds_async())
+
+    def _close(self):
+        self._sign_executor.shutdown()
+        super()._close()
@@ -0,0 +1,227 @@
+import io
+import os
+import sys
+import json
+import time
+import platform
+import contextlib
+import numpy as np
+import torch
+from args import args_parser
+from sphincs import SPHINCSPlus
+from metrics import HashCounter
+
+args = args_parser()
+
+
+def measure(fn, iters: int, setup=None) -> dict:
+    """重复执行fn，setup（不计时）为每次迭代准备参数；返回耗时分位数和平均哈希调用次数"""
+    times_ms = []
+    hash_calls = 0
+    for _ in range(iters):
+        call_args = setup() if setup is not None else ()
+        with HashCounter() as counter:
+            start_time = time.perf_counter()
+            fn(*call_args)
+            times_ms.append((time.perf_counter() - start_time) * 1000)
+        hash_calls += counter.calls
+
+    times = np.array(times_ms)
+    return {
+        'iters': iters,
+        'mean_ms': float(times.mean()),
+        'min_ms': float(times.min()),
+        'p50_ms': float(np.percentile(times, 50)),
+        'p90_ms': float(np.percentile(times, 90)),
+        'p99_ms': float(np.percentile(times, 99)),
+        'hash_calls': hash_calls // iters
+    }
+
+
+def bench_primitives(security_level, iters: int, backend: str = "hashlib") -> dict:
+    """security_level为整数安全级别或参数集名称"""
+    sphincs = SPHINCSPlus(security_level, backend=backend)
+    params, wots, fors, ht = sphincs.params, sphincs.wots, sphincs.fors, sphincs.ht
+    n = params.n
+
+    def seeds():
+        return os.urandom(n), os.urandom(n)
+
+    def wots_signed():
+        sk_seed, pk_seed = seeds()
+        msg = os.urandom(n)
+        return wots.sign(msg, sk_seed, pk_seed, 0, 0), msg, pk_seed, 0, 0
+
+    def fors_md():
+        sk_seed, pk_seed = seeds()
+        md = sphincs._h_msg(os.urandom(n), pk_seed, os.urandom(n), os.urandom(32))[0]
+        return md, sk_seed, pk_seed, 0, 0
+
+    def fors_signed():
+        md, sk_seed, pk_seed, tree_idx, leaf_idx = fors_md()
+        return fors.sign(md, sk_seed, pk_seed, tree_idx, leaf_idx), md, pk_seed, tree_idx, leaf_idx
+
+    public_key, private_key = sphincs.keygen()
+    message = os.urandom(1024)
+    signature = sphincs.sign(message, private_key)
+
+    results = {
+        'wots.compute_chain': measure(wots.compute_chain, iters,
+                                      lambda: (os.urandom(n), params.w - 1, 0, os.urandom(n), 0, 0)),
+        'wots.pk_from_sig': measure(wots.pk_from_sig, iters, wots_signed),
+        'fors.sign': measure(fors.sign, iters, fors_md),
+        'fors.pk_from_sig': measure(fors.pk_from_sig, iters, fors_signed),
+        # 每次使用新种子，避免命中子树缓存
+        'hypertree.gen_root': measure(ht.gen_root, iters, seeds),
+        'sphincs.keygen': measure(sphincs.keygen, iters),
+        'sphincs.sign': measure(sphincs.sign, iters, lambda: (message, private_key)),
+        'sphincs.verify': measure(sphincs.verify, iters, lambda: (message, signature, public_key)),
+    }
+    sphincs.close()
+    return results
+
+
+def bench_round(rounds: int) -> dict:
+    """端到端server_round（使用合成数据），训练日志重定向掉以免干扰输出"""
+    import data_process
+    from server import FedPer
+
+    data_process.args.synthetic_data = True
+    with contextlib.redirect_stdout(io.StringIO()):
+        fed_system = FedPer()
+    round_idx = iter(range(rounds))
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = measure(lambda: fed_system.server_round(next(round_idx)), rounds)
+    finally:
+        fed_system._close()
+    return result
+
+
+def bench_train(iters: int) -> dict:
+    """对比默认训练循环与--fast_train（常驻优化器、每个epoch同步一次）的单客户端吞吐"""
+    import copy
+    import data_process
+    from client import train, make_optimizer
+    from model import MedModel
+
+    data_process.args.synthetic_data = True
+    results = {}
+    for name, fast in (('fl/train', False), ('fl/train[fast]', True)):
+        train_args = copy.copy(args)
+        train_args.fast_train = fast
+        model = MedModel(name="bench").to(train_args.device)
+        optimizer = make_optimizer(train_args, model) if fast else None
+        samples_per_sec = []
+
+        def run():
+            stats = {}
+            train(train_args, model, 0, stats, optimizer)
+            samples_per_sec.append(stats['samples_per_sec'])
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            stat = measure(run, iters)
+        stat['samples_per_sec'] = float(np.median(samples_per_sec))
+        results[name] = stat
+    return results
+
+
+def bench_codecs(codecs: list, rounds: int) -> dict:
+    """逐个更新编码运行端到端轮次，除耗时外记录平均更新字节数、签名时间和最终验证准确率"""
+    import server
+
+    results = {}
+    for codec in codecs:
+        server.args.update_codec = codec
+        with contextlib.redirect_stdout(io.StringIO()):
+            fed_system = server.FedPer()
+        round_idx = iter(range(rounds))
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                stat = measure(lambda: fed_system.server_round(next(round_idx)), rounds)
+        finally:
+            fed_system._close()
+        round_stats = fed_system.round_stats
+        stat.update(update_bytes=float(np.mean([r['avg_update_bytes'] for r in round_stats])),
+                    sign_ms=float(np.mean([r['avg_sign_time_ms'] for r in round_stats])),
+                    val_acc=float(round_stats[-1]['avg_val_acc']))
+        results[codec] = stat
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """p50耗时或哈希调用次数超过基线(1+tolerance)倍即视为回归（签名/验证的链长随消息变化，哈希次数有波动）"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if current['p50_ms'] > base['p50_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p50 {base['p50_ms']:.2f}ms -> {current['p50_ms']:.2f}ms")
+        if current['hash_calls'] > base['hash_calls'] * (1 + tolerance):
+            regressions.append(f"{name}: 哈希调用 {base['hash_calls']} -> {current['hash_calls']}")
+    return regressions
+
+
+def main():
+    results = {}
+    backends = [backend for backend in args.bench_backends.split(',') if backend]
+    for level in (int(level) if level.isdigit() else level for level in args.bench_levels.split(',') if level):
+        for backend in backends:
+            print(f"=== SPHINCS+-{level} ({backend}) ===")
+            for name, stat in bench_primitives(level, args.bench_iters, backend).items():
+                # hashlib为默认实现，键名保持不变；其他后端加后缀以便与之对照
+                results[f"{level}/{name}" if backend == "hashlib" else f"{level}/{name}[{backend}]"] = stat
+                print(f"{name:22s} | p50: {stat['p50_ms']:9.2f}ms | p90: {stat['p90_ms']:9.2f}ms | "
+                      f"p99: {stat['p99_ms']:9.2f}ms | 哈希调用: {stat['hash_calls']}")
+
+    if args.bench_rounds > 0:
+        print(f"=== 本地训练 (E={args.E}, B={args.B}) ===")
+        for name, stat in bench_train(args.bench_iters).items():
+            results[name] = stat
+            print(f"{name:22s} | p50: {stat['p50_ms']:9.2f}ms | 吞吐: {stat['samples_per_sec']:.0f} samples/s")
+        stat = results['fl/server_round'] = bench_round(args.bench_rounds)
+        security = args.sphincs_params or args.sphincs_security
+        print(f"=== server_round (K={args.K}, E={args.E}, security={security}) ===")
+        print(f"p50: {stat['p50_ms']:.2f}ms | p90: {stat['p90_ms']:.2f}ms | 哈希调用: {stat['hash_calls']}")
+
+    codecs = [codec for codec in args.bench_codecs.split(',') if codec]
+    if codecs:
+        import data_process
+        data_process.args.synthetic_data = True
+        print(f"=== 更新编码 (K={args.K}, E={args.E}, rounds={max(args.bench_rounds, 1)}) ===")
+        for codec, stat in bench_codecs(codecs, max(args.bench_rounds, 1)).items():
+            results[f"fl/server_round[{codec}]"] = stat
+            print(f"{codec:6s} | p50: {stat['p50_ms']:9.2f}ms | 更新大小: {stat['update_bytes']:10.0f} bytes | "
+                  f"签名: {stat['sign_ms']:7.2f}ms | 准确率: {stat['val_acc']:.2f}%")
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'iters': args.bench_iters
+        },
+        'results': results
+    }
+    if args.bench_output:
+        with open(args.bench_output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"基准结果已写入 {args.bench_output}")
+
+    if args.bench_baseline:
+        with open(args.bench_baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.bench_tolerance)
+        if regressions:
+            print("发现性能回归:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("未发现性能回归")
+
+
+if __name__ == "__main__":
+    main()
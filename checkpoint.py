@@ -0,0 +1,164 @@
+import os
+import json
+import mmap
+import time
+import random
+import struct
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import torch
+from tensor_io import tensor_buffer
+
+MAGIC = b"FEDC"
+VERSION = 1
+
+"""文件头：magic、版本、索引(JSON)长度；索引之后是按_ALIGN对齐的张量数据"""
+_HEADER = struct.Struct(">4sHQ")
+_ALIGN = 64
+
+
+def snapshot(value: torch.Tensor) -> torch.Tensor:
+    """拷贝一份CPU上的连续张量，后台写入期间训练可以继续修改原张量"""
+    return value.detach().to("cpu", copy=True).contiguous()
+
+
+def optimizer_entries(prefix: str, state_dict: dict) -> tuple:
+    """优化器state_dict拆成(张量表, 可JSON化的其余部分)；JSON会把元组（如Adam的betas）变成列表，另记下这些字段名"""
+    tensors, scalars = {}, {}
+    for param_idx, param_state in state_dict['state'].items():
+        for key, value in param_state.items():
+            if isinstance(value, torch.Tensor):
+                tensors[f"{prefix}/{param_idx}/{key}"] = snapshot(value)
+            else:
+                scalars.setdefault(str(param_idx), {})[key] = value
+    tuple_fields = sorted({key for group in state_dict['param_groups'] for key, value in group.items()
+                           if isinstance(value, tuple)})
+    return tensors, {'param_groups': state_dict['param_groups'], 'scalars': scalars, 'tuple_fields': tuple_fields}
+
+
+def rng_state() -> tuple:
+    version, internal, gauss = random.getstate()
+    name, keys, pos, has_gauss, cached = np.random.get_state()
+    tensors = {'rng/numpy': torch.from_numpy(keys.astype(np.int64)), 'rng/torch': torch.get_rng_state()}
+    if torch.cuda.is_available():
+        tensors['rng/cuda'] = torch.cuda.get_rng_state()
+    meta = {'python': [version, list(internal), gauss], 'numpy': [name, pos, has_gauss, cached]}
+    return tensors, meta
+
+
+def write_checkpoint(path: str, tensors: dict, meta: dict) -> float:
+    """写入单个检查点文件：先写临时文件并fsync，再原子替换；返回写入耗时(ms)"""
+    start_time = time.time()
+    entries, buffers = [], []
+    offset = 0
+    for name, value in tensors.items():
+        buf = tensor_buffer(value)
+        entries.append([name, str(value.dtype).replace("torch.", ""), list(value.shape), offset, len(buf)])
+        buffers.append(buf)
+        offset += (len(buf) + _ALIGN - 1) // _ALIGN * _ALIGN
+    index = json.dumps({'tensors': entries, 'meta': meta}, default=float).encode("utf-8")
+    data_start = (_HEADER.size + len(index) + _ALIGN - 1) // _ALIGN * _ALIGN
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(index)))
+        f.write(index)
+        f.write(bytes(data_start - _HEADER.size - len(index)))
+        for buf in buffers:
+            f.write(buf)
+            f.write(bytes(-len(buf) % _ALIGN))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return (time.time() - start_time) * 1000
+
+
+class CheckpointWriter:
+    """后台写检查点，同一时刻最多一个写入任务；新的保存请求先等待上一个完成"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+        self._future = None
+        self.write_times_ms = []
+
+    def save(self, tensors: dict, meta: dict):
+        """tensors须为snapshot()得到的快照"""
+        self.wait()
+        self._future = self._executor.submit(write_checkpoint, self.path, tensors, meta)
+
+    def wait(self):
+        if self._future is not None:
+            self.write_times_ms.append(self._future.result())
+            self._future = None
+
+    def close(self):
+        self.wait()
+        self._executor.shutdown()
+
+
+class Checkpoint:
+    """只读加载检查点：整个文件做写时复制的内存映射，张量直接引用映射内存，恢复耗时取决于读取文件"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        magic, version, index_len = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"无效的检查点文件: {path}")
+        index = json.loads(self._mmap[_HEADER.size:_HEADER.size + index_len].decode("utf-8"))
+        self.meta = index['meta']
+        self._data_start = (_HEADER.size + index_len + _ALIGN - 1) // _ALIGN * _ALIGN
+        self._entries = {name: (dtype, shape, offset, nbytes)
+                         for name, dtype, shape, offset, nbytes in index['tensors']}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def tensor(self, name: str) -> torch.Tensor:
+        dtype, shape, offset, nbytes = self._entries[name]
+        dtype = getattr(torch, dtype)
+        count = nbytes // torch.empty((), dtype=dtype).element_size()
+        if not count:
+            return torch.empty(shape, dtype=dtype)
+        return torch.frombuffer(self._mmap, dtype=dtype, count=count, offset=self._data_start + offset).view(shape)
+
+    def state_dict(self, prefix: str) -> dict:
+        """取出名称以prefix/开头的张量，去掉前缀"""
+        start = len(prefix) + 1
+        return {name[start:]: self.tensor(name) for name in self._entries if name.startswith(prefix + "/")}
+
+    def optimizer_state(self, prefix: str, extra: dict) -> dict:
+        """optimizer_entries的逆过程"""
+        state = {}
+        for name, value in self.state_dict(prefix).items():
+            param_idx, key = name.split("/", 1)
+            state.setdefault(int(param_idx), {})[key] = value.clone()
+        for param_idx, scalars in extra['scalars'].items():
+            state.setdefault(int(param_idx), {}).update(scalars)
+        tuple_fields = extra.get('tuple_fields', [])
+        param_groups = [{key: tuple(value) if key in tuple_fields else value for key, value in group.items()}
+                        for group in extra['param_groups']]
+        return {'state': state, 'param_groups': param_groups}
+
+    def restore_rng(self):
+        rng = self.meta['rng']
+        version, internal, gauss = rng['python']
+        random.setstate((version, tuple(internal), gauss))
+        name, pos, has_gauss, cached = rng['numpy']
+        np.random.set_state((name, self.tensor('rng/numpy').numpy().astype(np.uint32), pos, has_gauss, cached))
+        torch.set_rng_state(self.tensor('rng/torch').clone())
+        if 'rng/cuda' in self and torch.cuda.is_available():
+            torch.cuda.set_rng_state(self.tensor('rng/cuda').clone())
+
+    def close(self):
+        try:
+            self._mmap.close()
+        except BufferError:
+            # 仍有张量引用映射内存时交给垃圾回收释放
+            pass
@@ -1,17 +1,40 @@
+import copy
+import time
+import weakref
 import torch
 from torch import nn, optim
+from torch.func import functional_call, stack_module_state
 from data_process import load_data
 
 
-def train(args, model, client_id):
-    model.train()
-    criterion = nn.CrossEntropyLoss()
-    optimizer = optim.Adam([
+"""模型 -> torch.compile后的模块；线程/串行模式下客户端模型常驻，编译结果跨轮复用"""
+_compiled_models = weakref.WeakKeyDictionary()
+
+
+def make_optimizer(args, model):
+    return optim.Adam([
         {'params': model.base_layers.parameters(), 'lr': args.lr},
         {'params': model.personal_layers.parameters(), 'lr': args.lr * 1.2}
     ], weight_decay=args.weight_decay)
 
-    train_loader, _, _ = load_data(client_id)
+
+def _compiled(model):
+    compiled = _compiled_models.get(model)
+    if compiled is None:
+        compiled = _compiled_models[model] = torch.compile(model)
+    return compiled
+
+
+def train(args, model, client_id, stats=None, optimizer=None):
+    """optimizer为空时每次新建Adam；--fast_train时由调用方传入每个客户端常驻的优化器，保留动量"""
+    start_time = time.time()
+    model.train()
+    if args.fast_train:
+        return _train_fast(args, model, client_id, stats, optimizer or make_optimizer(args, model), start_time)
+    criterion = nn.CrossEntropyLoss()
+    optimizer = make_optimizer(args, model)
+
+    train_loader, _, _ = load_data(client_id, args.fast_train)
 
     for epoch in range(args.E):
         epoch_loss = 0.0
@@ -40,6 +63,62 @@ def train(args, model, client_id):
         print(
             f"Client {client_id} Epoch {epoch + 1}/{args.E} | Loss: {epoch_loss / len(train_loader):.4f} | Acc: {accuracy:.2f}%")
 
+    if stats is not None:
+        train_time_ms = (time.time() - start_time) * 1000
+        stats.update({
+            'loss': epoch_loss / len(train_loader),
+            'acc': accuracy,
+            'samples': total,
+            'train_time_ms': train_time_ms,
+            'samples_per_sec': total * args.E / (train_time_ms / 1000)
+        })
+    return model
+
+
+def _train_fast(args, model, client_id, stats, optimizer, start_time):
+    """低开销训练循环：损失和正确数在设备上累加，每个epoch只同步一次；
+    批次从锁页内存非阻塞拷贝到GPU；可选torch.compile
+    """
+    criterion = nn.CrossEntropyLoss()
+    device = torch.device(args.device)
+    non_blocking = device.type == "cuda"
+    forward = _compiled(model) if args.compile else model
+    train_loader, _, _ = load_data(client_id, args.fast_train)
+
+    for epoch in range(args.E):
+        loss_sum = torch.zeros((), device=device)
+        correct = torch.zeros((), dtype=torch.long, device=device)
+        total = 0
+
+        for inputs, labels in train_loader:
+            inputs = inputs.to(device, non_blocking=non_blocking)
+            if labels.dim() > 1:
+                labels = labels.squeeze(1)
+            labels = labels.to(device, non_blocking=non_blocking).long()
+            optimizer.zero_grad(set_to_none=True)
+            outputs = forward(inputs)
+            loss = criterion(outputs, labels)
+            loss.backward()
+            torch.nn.utils.clip_grad_norm_(model.parameters(), args.max_grad_threshold)
+            optimizer.step()
+
+            loss_sum += loss.detach()
+            correct += (outputs.detach().argmax(dim=1) == labels).sum()
+            total += labels.size(0)
+
+        epoch_loss = loss_sum.item() / len(train_loader)
+        accuracy = 100 * correct.item() / total
+        print(f"Client {client_id} Epoch {epoch + 1}/{args.E} | Loss: {epoch_loss:.4f} | Acc: {accuracy:.2f}%")
+
+    if stats is not None:
+        train_time_ms = (time.time() - start_time) * 1000
+        stats.update({
+            'loss': epoch_loss,
+            'acc': accuracy,
+            'samples': total,
+            'train_time_ms': train_time_ms,
+            'samples_per_sec': total * args.E / (train_time_ms / 1000)
+        })
     return model
 
 
@@ -90,3 +169,31 @@ def validate(args, model, client_id):
     return 100 * correct / total
 
 
+def validate_many(args, base_layers, models, client_ids):
+    """所有客户端共享聚合后的base_layers：每个验证批次只计算一次base激活，
+    再用堆叠后的personal_layers经vmap一次前向得到所有客户端的输出，返回各客户端准确率"""
+    base_layers.eval()
+    heads = [model.personal_layers.eval() for model in models]
+    params, buffers = stack_module_state(heads)
+    template = copy.deepcopy(heads[0]).to("meta")
+
+    def head_forward(head_params, head_buffers, features):
+        return functional_call(template, (head_params, head_buffers), (features,))
+
+    batched_heads = torch.vmap(head_forward, in_dims=(0, 0, None))
+    _, val_loader, _ = load_data(client_ids[0])
+
+    total = 0
+    correct = torch.zeros(len(heads), dtype=torch.long, device=args.device)
+    with torch.no_grad():
+        for inputs, labels in val_loader:
+            inputs = inputs.to(args.device).view(-1, args.input_dim)
+            if labels.dim() > 1:
+                labels = labels.squeeze(1)
+            labels = labels.long().to(args.device)
+            features = base_layers(inputs)
+            outputs = batched_heads(params, buffers, features)  # [客户端数, B, num_classes]
+            correct += (outputs.argmax(dim=2) == labels).sum(dim=1)
+            total += labels.size(0)
+
+    return (100 * correct / total).tolist()
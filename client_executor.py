@@ -0,0 +1,180 @@
+import os
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+import torch
+from args import args_parser
+from aggregator import FlatAggregator
+from client import train, make_optimizer
+from data_process import load_data
+from codec import UpdateCodec, encoded_bytes
+from model import MedModel
+from sphincs import SPHINCSPlus
+from tensor_io import state_buffers
+from transport import ConnectionPool
+
+args = args_parser()
+
+"""进程模式下本训练进程到服务器的持久连接，由进程初始化函数建立"""
+_connections = None
+
+
+def _init_process_worker(num_threads: int, address: tuple = None):
+    """每个训练进程只使用分给它的那部分CPU线程；TCP传输时建立本进程的持久连接"""
+    global _connections
+    torch.set_num_threads(num_threads)
+    if address is not None:
+        _connections = ConnectionPool(address, 1)
+
+
+def _cpu_state(module) -> dict:
+    return {key: value.detach().cpu() for key, value in module.state_dict().items()}
+
+
+def _warm_up() -> int:
+    """在工作线程/进程中提前完成模块导入和数据集加载"""
+    load_data(0)
+    return os.getpid()
+
+
+def _train_and_upload(model, client_id: int, optimizer, connections, round_idx: int = None) -> dict:
+    """训练一个客户端；给出connections时在当前工作线程/进程内直接把（按--update_codec编码的）更新经TCP发给服务器，
+    摘要和传输统计记入stats['upload']，由服务器对摘要签名，更新本身不再经主线程转发"""
+    codec = reference = None
+    if connections is not None and args.update_codec != 'none':
+        # 训练前的base_layers就是本轮全局模型，即编码增量的参考点
+        codec = UpdateCodec(args.update_codec, FlatAggregator(model.base_layers.state_dict(), args.device),
+                            args.topk_ratio)
+        reference = codec.aggregator.flatten(model.base_layers.state_dict())
+
+    stats = {}
+    train(args, model, client_id, stats, optimizer)
+    if connections is None:
+        return stats
+
+    weights = model.base_layers.state_dict()
+    if codec is not None:
+        weights = codec.encode(weights, reference)
+    digest = SPHINCSPlus.digest(state_buffers(weights))
+    nbytes, latency_ms = connections.send_update(client_id, weights, stats, round_idx)
+    stats['upload'] = {'digest': digest, 'update_bytes': encoded_bytes(weights), 'transport_bytes': nbytes,
+                       'transport_latency_ms': latency_ms}
+    return stats
+
+
+def _train_in_process(client_id: int, model_state: dict, optimizer_state: dict = None,
+                      round_idx: int = None) -> tuple:
+    """进程中的模型每轮重建，--fast_train时优化器状态随任务传入并随结果传回；已经由本进程上传的base_state不再传回"""
+    model = MedModel(name=f"client_{client_id}").to(args.device)
+    model.load_state_dict(model_state)
+    optimizer = None
+    if args.fast_train:
+        optimizer = make_optimizer(args, model)
+        if optimizer_state is not None:
+            optimizer.load_state_dict(optimizer_state)
+    stats = _train_and_upload(model, client_id, optimizer, _connections, round_idx)
+    base_state = None if _connections is not None else _cpu_state(model.base_layers)
+    return (client_id, base_state, _cpu_state(model.personal_layers), stats,
+            optimizer.state_dict() if optimizer is not None else None)
+
+
+def _train_in_place(model, client_id: int, optimizer=None, connections=None, round_idx: int = None) -> tuple:
+    stats = _train_and_upload(model, client_id, optimizer, connections, round_idx)
+    return client_id, model.base_layers.state_dict(), model.personal_layers.state_dict(), stats, None
+
+
+class ClientExecutor:
+    """并发训练所选客户端，结果为(client_id, base_state, personal_state, stats, optimizer_state)
+
+    mode: 'process'（CPU，进程间划分torch线程）、'thread'（GPU上每设备一个线程）或'serial'；
+    --fast_train时每个客户端的Adam跨轮保留：线程/串行模式常驻优化器对象，进程模式保存其state_dict；
+    给出connections（TCP连接池）时由训练线程/进程自己上传更新：线程和串行模式共用该连接池，
+    进程模式每个进程建立一条到同一地址的连接，结果中的base_state为None
+    """
+
+    def __init__(self, workers: int = 1, mode: str = "auto", connections: ConnectionPool = None):
+        self.workers = max(1, workers)
+        if mode == "auto":
+            mode = "serial" if self.workers == 1 else (
+                "thread" if torch.device(args.device).type == "cuda" else "process")
+        self.mode = mode
+        self.connections = connections
+        self._executor = None
+        """client_id -> 常驻优化器（线程/串行模式）"""
+        self.optimizers = {}
+        """client_id -> 优化器state_dict（进程模式，或从检查点恢复后尚未创建优化器的客户端）"""
+        self.optimizer_states = {}
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.mode == "process":
+                num_threads = max(1, (os.cpu_count() or 1) // self.workers)
+                address = self.connections.address if self.connections is not None else None
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"),
+                                                     initializer=_init_process_worker,
+                                                     initargs=(num_threads, address))
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def warm_up(self):
+        """启动全部工作线程/进程并等它们完成导入和数据加载，使首轮计时不包含启动开销；串行模式无需预热"""
+        if self.mode == "serial":
+            return
+        executor = self._get_executor()
+        for future in [executor.submit(_warm_up) for _ in range(self.workers)]:
+            future.result()
+
+    def _optimizer(self, model, client_id: int):
+        if not args.fast_train:
+            return None
+        optimizer = self.optimizers.get(client_id)
+        if optimizer is None:
+            optimizer = self.optimizers[client_id] = make_optimizer(args, model)
+            state = self.optimizer_states.pop(client_id, None)
+            if state is not None:
+                optimizer.load_state_dict(state)
+        return optimizer
+
+    def submit(self, model, client_id: int, round_idx: int = None) -> Future:
+        """提交一个客户端的本地训练；进程模式下训练的是模型副本，需要调用apply写回；
+        round_idx随TCP上传的帧发送，服务器据此识别过期帧"""
+        if self.mode == "serial":
+            future = Future()
+            try:
+                future.set_result(_train_in_place(model, client_id, self._optimizer(model, client_id),
+                                                  self.connections, round_idx))
+            except Exception as exc:
+                future.set_exception(exc)
+            return future
+
+        if self.mode == "process":
+            return self._get_executor().submit(_train_in_process, client_id, _cpu_state(model),
+                                               self.optimizer_states.get(client_id), round_idx)
+        return self._get_executor().submit(_train_in_place, model, client_id, self._optimizer(model, client_id),
+                                           self.connections, round_idx)
+
+    def apply(self, model, result: tuple):
+        """把进程中训练得到的权重和优化器状态写回主进程"""
+        if self.mode == "process":
+            client_id, base_state, personal_state, _, optimizer_state = result
+            if base_state is not None:
+                model.base_layers.load_state_dict(base_state)
+            model.personal_layers.load_state_dict(personal_state)
+            if optimizer_state is not None:
+                self.optimizer_states[client_id] = optimizer_state
+        return model
+
+    def optimizer_state_dicts(self) -> dict:
+        """所有客户端当前的优化器state_dict，用于检查点"""
+        states = dict(self.optimizer_states)
+        states.update((client_id, optimizer.state_dict()) for client_id, optimizer in self.optimizers.items())
+        return states
+
+    def load_optimizer_state_dicts(self, states: dict):
+        self.optimizer_states.update(states)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
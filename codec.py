@@ -0,0 +1,55 @@
+import torch
+from aggregator import FlatAggregator
+
+CODECS = ("none", "fp16", "int8", "topk")
+
+
+def encoded_bytes(encoded: dict) -> int:
+    return sum(value.numel() * value.element_size() for value in encoded.values())
+
+
+class UpdateCodec:
+    """客户端更新编码：对相对本轮全局模型的增量做fp16、逐张量int8量化或top-k稀疏编码
+
+    编码结果是一组张量（与state_dict同样可以签名和传输），签名覆盖编码后的字节；
+    服务器端不还原完整state_dict，直接把 参考权重 + 解码后的增量 按权重累加进聚合缓冲区
+    """
+
+    def __init__(self, name: str, aggregator: FlatAggregator, topk_ratio: float = 0.01):
+        if name not in CODECS or name == "none":
+            raise ValueError(f"未知的更新编码: {name}")
+        self.name = name
+        self.aggregator = aggregator
+        self.topk = max(1, int(aggregator.size * topk_ratio))
+
+    def encode(self, state_dict: dict, reference: torch.Tensor) -> dict:
+        """reference为本轮全局模型展平后的向量"""
+        delta = self.aggregator.flatten(state_dict) - reference
+        if self.name == "fp16":
+            return {'delta': delta.half().cpu()}
+
+        if self.name == "int8":
+            scales = torch.stack([segment.abs().max() for segment in self.aggregator.unflatten(delta).values()])
+            scales = torch.where(scales > 0, scales / 127, torch.ones_like(scales))
+            expanded = torch.repeat_interleave(scales, torch.tensor(self.aggregator.numels, device=scales.device))
+            quantized = torch.round(delta / expanded).clamp_(-127, 127).to(torch.int8)
+            return {'quantized': quantized.cpu(), 'scales': scales.float().cpu()}
+
+        indices = torch.topk(delta.abs(), self.topk, sorted=False).indices.sort().values
+        return {'indices': indices.to(torch.int32).cpu(), 'values': delta[indices].cpu()}
+
+    def decode_into(self, encoded: dict, reference: torch.Tensor, weight: float = 1.0):
+        """把 reference + 增量 以weight累加进聚合缓冲区，增量部分原地加到缓冲区上"""
+        aggregator = self.aggregator
+        device = aggregator.device
+        aggregator.add_flat(reference, weight)
+        if self.name == "fp16":
+            aggregator.buffer.add_(encoded['delta'].to(device, non_blocking=True).float(), alpha=weight)
+        elif self.name == "int8":
+            expanded = torch.repeat_interleave(encoded['scales'].to(device),
+                                               torch.tensor(aggregator.numels, device=device))
+            aggregator.buffer.addcmul_(encoded['quantized'].to(device, non_blocking=True).float(), expanded,
+                                       value=weight)
+        else:
+            aggregator.buffer.index_add_(0, encoded['indices'].to(device).long(), encoded['values'].to(device),
+                                         alpha=weight)
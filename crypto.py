@@ -1,32 +1,129 @@
-import torch
 from args import args_parser
 from sphincs import SPHINCSPlus
+from verify_pool import VerifyPool
+from param_select import select_parameter_set
 import time
 
 args = args_parser()
 
 
 class SphincsCPU:
-    def __init__(self, security_level=128):
-        self.sphincs = SPHINCSPlus(security_level)
+    def __init__(self, security_level=128, key_id=None, keystore=None, verify_workers=1, workers=1,
+                 backend="hashlib", param_set=None,
+                 max_signature_size=0, profile_path=None, fors_cache_mb=32, keypair=None):
+        """param_set: 参数集名称；'auto'表示在满足security_level和签名大小预算的参数集中选本机最快的；
+        为空时按整数安全级别使用原有参数（密钥库文件名不变）。
+        keypair: (公钥, 私钥, 顶层子树叶子)，例如从检查点恢复时直接使用，不再加载或生成
+        """
+        if param_set == "auto":
+            param_set = select_parameter_set(security_level, max_signature_size, profile_path, backend)
+            print(f"自动选择SPHINCS+参数集: {param_set}")
+        if param_set:
+            security_level = param_set
+        self.sphincs = SPHINCSPlus(security_level, workers=workers, backend=backend, fors_cache_mb=fors_cache_mb)
+        if max_signature_size and self.sphincs.signature_size() > max_signature_size:
+            raise ValueError(f"参数集{self.sphincs.params.name}的签名大小{self.sphincs.signature_size()}字节"
+                             f"超过预算{max_signature_size}字节")
+        self.verify_pool = VerifyPool(security_level, workers=verify_workers)
+        self.security_level = security_level
+        self.key_id = key_id
+        self.keystore = keystore
         self.keygen_time_ms = None
-        self._generate_keys()
+        self.key_loaded = False
+        if keypair is not None:
+            self._restore_keys(*keypair)
+        elif not self._load_keys():
+            self._generate_keys()
+
+    def _load_keys(self) -> bool:
+        if self.keystore is None or self.key_id is None:
+            return False
+        start_time = time.time()
+        record = self.keystore.load(self.key_id, self.security_level)
+        if record is None:
+            return False
+        self.public_key, self.private_key = record.public_key, record.private_key
+        if not self.sphincs.import_nodes(self.public_key, record.nodes):
+            print(f"SPHINCS+缓存节点缺失或与公钥不符，已丢弃并重新生成 | key_id: {self.key_id}")
+            self._rebuild_nodes()
+        self.keygen_time_ms = (time.time() - start_time) * 1000
+        self.key_loaded = True
+        print(f"SPHINCS+密钥加载时间: {self.keygen_time_ms:.2f}ms | key_id: {self.key_id}")
+        return True
+
+    def _rebuild_nodes(self):
+        """由私钥重新生成顶层子树，确认其根与公钥一致后覆盖密钥库中的节点文件"""
+        n = self.sphincs.n
+        root = self.sphincs.ht.gen_root(self.private_key[:n], self.private_key[n:2 * n])
+        if root != self.public_key[n:]:
+            raise ValueError(f"密钥库中key_id={self.key_id}的私钥与公钥不匹配")
+        self.keystore.save(self.key_id, self.security_level, self.public_key, self.private_key,
+                           nodes=self.sphincs.export_nodes(self.public_key), n=n)
+
+    def _restore_keys(self, public_key: bytes, private_key: bytes, nodes):
+        start_time = time.time()
+        self.public_key, self.private_key = public_key, private_key
+        if nodes and not self.sphincs.import_nodes(public_key, nodes):
+            print("检查点中的SPHINCS+缓存节点与公钥不符，已丢弃，首次签名时重新生成")
+        self.keygen_time_ms = (time.time() - start_time) * 1000
+        self.key_loaded = True
 
     def _generate_keys(self):
         start_time = time.time()
         self.public_key, self.private_key = self.sphincs.keygen()
         self.keygen_time_ms = (time.time() - start_time) * 1000
         print(f"SPHINCS+密钥生成时间: {self.keygen_time_ms:.2f}ms")
+        if self.keystore is not None and self.key_id is not None:
+            self.keystore.save(self.key_id, self.security_level, self.public_key, self.private_key,
+                               nodes=self.sphincs.export_nodes(self.public_key), n=self.sphincs.n)
+
+    @staticmethod
+    def digest(data) -> bytes:
+        """流式计算摘要，data可以是bytes或一组缓冲区"""
+        return SPHINCSPlus.digest(data)
 
-    def sign(self, data: bytes) -> tuple:
+    def sign(self, data) -> tuple:
         start_time = time.time()
-        signature = self.sphincs.sign(data, self.private_key)
+        signature = self.sphincs.sign_digest(self.sphincs.digest(data), self.private_key)
         sign_time_ms = (time.time() - start_time) * 1000
         signature_size = len(signature)
         return signature, sign_time_ms, signature_size
 
-    def verify(self, data: bytes, signature: bytes) -> tuple:
+    def sign_digest(self, digest: bytes) -> tuple:
+        start_time = time.time()
+        signature = self.sphincs.sign_digest(digest, self.private_key)
+        sign_time_ms = (time.time() - start_time) * 1000
+        return signature, sign_time_ms, len(signature)
+
+    def verify(self, data, signature: bytes) -> tuple:
         start_time = time.time()
         is_valid = self.sphincs.verify(data, signature, self.public_key)
         verify_time_ms = (time.time() - start_time) * 1000
         return is_valid, verify_time_ms
+
+    def verify_many(self, digests: list, signatures: list) -> list:
+        """在进程池上并行验证多条摘要签名，按顺序返回(is_valid, verify_time_ms)"""
+        items = [(digest, signature, self.public_key) for digest, signature in zip(digests, signatures)]
+        return self.verify_pool.verify_many(items)
+
+    def submit_verify(self, digests: list, signatures: list):
+        """verify_many的异步版本，返回concurrent.futures.Future"""
+        items = [(digest, signature, self.public_key) for digest, signature in zip(digests, signatures)]
+        return self.verify_pool.submit(items)
+
+    def close(self):
+        self.verify_pool.close()
+        self.sphincs.close()
+
+    def sign_batch(self, digests: list) -> tuple:
+        start_time = time.time()
+        handles = self.sphincs.sign_batch_digests(digests, self.private_key)
+        sign_time_ms = (time.time() - start_time) * 1000
+        signature_size = len(handles[0][0]) if handles else 0
+        return handles, sign_time_ms, signature_size
+
+    def verify_batch(self, digests: list, handles: list) -> tuple:
+        start_time = time.time()
+        results = self.sphincs.verify_batch_digests(digests, handles, self.public_key)
+        verify_time_ms = (time.time() - start_time) * 1000
+        return results, verify_time_ms
@@ -0,0 +1,111 @@
+import os
+import json
+import math
+import numpy as np
+import torch
+
+CACHE_VERSION = 1
+
+
+class TensorLoader:
+    """直接对预处理好的数组切片的轻量加载器，接口与DataLoader的迭代方式一致"""
+
+    def __init__(self, inputs: np.ndarray, labels: np.ndarray, batch_size: int, shuffle: bool = False,
+                 pin_memory: bool = False):
+        self.inputs = inputs
+        self.labels = labels
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.pin_memory = pin_memory
+
+    def __len__(self) -> int:
+        return math.ceil(len(self.inputs) / self.batch_size)
+
+    def _batches(self):
+        n = len(self.inputs)
+        if self.shuffle:
+            order = np.random.permutation(n)
+            for start in range(0, n, self.batch_size):
+                idx = np.sort(order[start:start + self.batch_size])
+                yield torch.from_numpy(self.inputs[idx]), torch.from_numpy(self.labels[idx])
+        else:
+            for start in range(0, n, self.batch_size):
+                yield (torch.from_numpy(np.array(self.inputs[start:start + self.batch_size])),
+                       torch.from_numpy(np.array(self.labels[start:start + self.batch_size])))
+
+    def __iter__(self):
+        """pin_memory时批次放入锁页内存，配合non_blocking拷贝与GPU计算重叠"""
+        if not self.pin_memory:
+            yield from self._batches()
+            return
+        for inputs, labels in self._batches():
+            yield inputs.pin_memory(), labels.pin_memory()
+
+
+def normalize_images(imgs: np.ndarray) -> np.ndarray:
+    """等价于ToTensor + Grayscale(1) + Normalize(0.5, 0.5) + 展平"""
+    x = imgs.reshape(len(imgs), -1).astype(np.float32) / 255.0
+    return (x - 0.5) / 0.5
+
+
+def _save_atomic(path: str, array: np.ndarray):
+    """先写入按进程区分的临时文件再替换，多个训练进程同时构建缓存也不会读到半个文件"""
+    tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+class DatasetCache:
+    """把PneumoniaMNIST一次性转换为归一化float32数组，按客户端划分存为可内存映射的.npy分片"""
+
+    def __init__(self, root: str, num_clients: int):
+        self.root = os.path.join(root, f"K{num_clients}")
+        self.num_clients = num_clients
+        self._arrays = {}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name + ".npy")
+
+    def is_built(self) -> bool:
+        meta_path = os.path.join(self.root, "meta.json")
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path) as f:
+            meta = json.load(f)
+        return meta.get("version") == CACHE_VERSION and meta.get("num_clients") == self.num_clients
+
+    def build(self, splits: dict):
+        """splits: split名 -> (uint8图像数组, 标签数组)"""
+        os.makedirs(self.root, exist_ok=True)
+        train_imgs, train_labels = splits['train']
+        samples_per_client = len(train_imgs) // self.num_clients
+        for client_id in range(self.num_clients):
+            lo, hi = client_id * samples_per_client, (client_id + 1) * samples_per_client
+            _save_atomic(self._path(f"train_{client_id}_x"), normalize_images(train_imgs[lo:hi]))
+            _save_atomic(self._path(f"train_{client_id}_y"), train_labels[lo:hi].astype(np.int64))
+
+        for split in ('val', 'test'):
+            imgs, labels = splits[split]
+            _save_atomic(self._path(f"{split}_x"), normalize_images(imgs))
+            _save_atomic(self._path(f"{split}_y"), labels.astype(np.int64))
+
+        meta_path = os.path.join(self.root, "meta.json")
+        tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": CACHE_VERSION, "num_clients": self.num_clients}, f)
+        os.replace(tmp_path, meta_path)
+
+    def arrays(self, name: str) -> tuple:
+        """按需内存映射分片，同一进程内所有客户端共用一份映射"""
+        if name not in self._arrays:
+            self._arrays[name] = (np.load(self._path(name + "_x"), mmap_mode="r"),
+                                  np.load(self._path(name + "_y"), mmap_mode="r"))
+        return self._arrays[name]
+
+    def loaders(self, client_id: int, batch_size: int, pin_memory: bool = False) -> tuple:
+        train_x, train_y = self.arrays(f"train_{client_id}")
+        val_x, val_y = self.arrays("val")
+        test_x, test_y = self.arrays("test")
+        return (TensorLoader(train_x, train_y, batch_size, shuffle=True, pin_memory=pin_memory),
+                TensorLoader(val_x, val_y, batch_size),
+                TensorLoader(test_x, test_y, batch_size))
@@ -1,7 +1,12 @@
+import os
+import threading
+import numpy as np
+import torch
 from torchvision import transforms
 from torch.utils.data import DataLoader, Subset  # subset加载数据子集
 from medmnist import PneumoniaMNIST
 from args import args_parser
+from data_cache import DatasetCache
 
 args = args_parser()
 
@@ -12,13 +17,60 @@ transform = transforms.Compose([
     transforms.Lambda(lambda x: x.view(-1))
 ])
 
-train_dataset = PneumoniaMNIST(split='train', transform=transform, download=True)
-val_dataset = PneumoniaMNIST(split='val', transform=transform, download=True)
-test_dataset = PneumoniaMNIST(split='test', transform=transform, download=True)
+_datasets = {}
+_dataset_cache = None
+_dataset_cache_lock = threading.Lock()
 
 
-def load_data(client_id):
+def get_dataset(split, transform=transform):
+    """按需加载数据集，同一进程内只构建一次"""
+    key = (split, transform is not None)
+    if key not in _datasets:
+        _datasets[key] = PneumoniaMNIST(split=split, transform=transform, download=True)
+    return _datasets[key]
+
+
+def synthetic_splits(seed=0):
+    """与PneumoniaMNIST同形状的随机数据，用于基准测试等无需真实数据集的场景"""
+    rng = np.random.default_rng(seed)
+    splits = {}
+    for split, size in (('train', 4708), ('val', 524), ('test', 624)):
+        imgs = rng.integers(0, 256, size=(size, args.img_size, args.img_size), dtype=np.uint8)
+        labels = rng.integers(0, args.num_classes, size=(size, 1))
+        splits[split] = (imgs, labels)
+    return splits
+
+
+def get_dataset_cache():
+    """首次调用时把原始数据一次性转换为按客户端划分的.npy分片，之后直接内存映射"""
+    global _dataset_cache
+    # 多个训练线程可能同时首次调用，只允许一个线程构建缓存
+    with _dataset_cache_lock:
+        if _dataset_cache is None:
+            if args.synthetic_data:
+                cache = DatasetCache(os.path.join(args.data_cache_dir, "synthetic"), args.K)
+                if not cache.is_built():
+                    cache.build(synthetic_splits())
+            else:
+                cache = DatasetCache(args.data_cache_dir, args.K)
+                if not cache.is_built():
+                    raw = {split: get_dataset(split, None) for split in ('train', 'val', 'test')}
+                    cache.build({split: (dataset.imgs, dataset.labels) for split, dataset in raw.items()})
+            _dataset_cache = cache
+    return _dataset_cache
+
+
+def load_data(client_id, fast_train: bool = None):
+    """fast_train为空时按命令行的--fast_train决定加载器设置；调用方使用另一组参数训练时应显式传入"""
+    if fast_train is None:
+        fast_train = args.fast_train
+    # 只有GPU训练时锁页内存才有意义
+    pin_memory = fast_train and torch.cuda.is_available()
+    if args.data_cache or args.synthetic_data:
+        return get_dataset_cache().loaders(client_id, args.B, pin_memory)
+
     # 均匀划分训练集给各客户端（IID划分）
+    train_dataset = get_dataset('train')
     total_samples = len(train_dataset)
     samples_per_client = total_samples // args.K
     indices = list(range(client_id * samples_per_client, (client_id + 1) * samples_per_client))
@@ -26,11 +78,12 @@ def load_data(client_id):
     train_loader = DataLoader(
         Subset(train_dataset, indices),
         batch_size=args.B,
-        shuffle=True
+        shuffle=True,
+        pin_memory=pin_memory
     )
 
-    val_loader = DataLoader(val_dataset, batch_size=args.B, shuffle=False)
-    test_loader = DataLoader(test_dataset, batch_size=args.B, shuffle=False)
+    val_loader = DataLoader(get_dataset('val'), batch_size=args.B, shuffle=False)
+    test_loader = DataLoader(get_dataset('test'), batch_size=args.B, shuffle=False)
 
     # print(inputs.shape in loader)  # [32, 1, 28, 28]
     # print(labels.shape)  # [B,1]数据加载器错误加载了维度，在后续标签处理时需要将标签压缩为一维
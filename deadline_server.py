@@ -0,0 +1,193 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait, TimeoutError as FuturesTimeout
+from args import args_parser
+from client_executor import ClientExecutor
+from codec import encoded_bytes
+from scheduler import DeadlineScheduler
+from server import FedPer
+
+args = args_parser()
+
+
+class DeadlineFedPer(FedPer):
+    """按截止时间调度的服务器：根据历史训练+签名耗时超额选择客户端，
+    按完成顺序签名验证，折叠前N个验证通过的更新后立即结束本轮
+
+    截止后才完成或仍未完成的客户端记为late；截止前已完成、但本轮已够数（或来不及处理）的超额客户端记为dropped，
+    其base更新不签名也不聚合，但本地训练得到的个性化层和优化器状态在线程/进程模式下都一样保留
+    （线程模式本就在原模型上训练，进程模式在训练完成后写回）；仍在后台训练的客户端在训练完成前不会被再次选中，
+    所有客户端或所有训练线程/进程都被它们占着时，本轮先等其中一个训练完再开始计时，不产生空轮
+    """
+
+    def __init__(self):
+        if args.batch_sign:
+            raise ValueError("截止时间调度逐个签名与验证，不支持--batch_sign")
+        if args.transport != 'local':
+            raise ValueError("截止时间调度目前只支持进程内传输")
+        if args.async_server or args.edges > 0:
+            raise ValueError("截止时间调度不能与--async_server/--edges同时使用")
+        super().__init__()
+        if self.executor.mode == "serial":
+            # 串行模式在提交时就训练完所有客户端，无法在截止时间结束本轮，改为一个后台训练线程
+            optimizer_states = self.executor.optimizer_state_dicts()
+            self.executor = ClientExecutor(workers=1, mode="thread")
+            self.executor.load_optimizer_state_dicts(optimizer_states)
+        self.scheduler = DeadlineScheduler(args.deadline_ms, args.over_provision)
+        """client_id -> 训练任务；之前轮次结束时仍在后台训练的客户端"""
+        self.busy = {}
+        # 训练进程的启动、导入和数据加载不计入首轮截止时间
+        self.executor.warm_up()
+
+    def _keep_local_training(self, client_id, result):
+        """未聚合的客户端也保留本地训练的个性化层和优化器状态，进程模式下写回（线程模式已在原模型上训练）"""
+        self.executor.apply(self.client_models[client_id], result)
+        self.scheduler.observe_train(client_id, result[3]['train_time_ms'])
+
+    def _reap_busy(self):
+        """回收已在后台训练完的迟到客户端，用实际耗时更新估计（base更新已过期，不聚合）"""
+        for client_id, future in list(self.busy.items()):
+            if future.done():
+                del self.busy[client_id]
+                self.submitted_states.pop(client_id, None)
+                if future.exception() is None:
+                    self._keep_local_training(client_id, future.result())
+
+    def _wait_for_busy(self, round_idx) -> float:
+        """没有空闲客户端或空闲训练线程/进程时，等至少一个迟到客户端训练完，返回等待耗时ms"""
+        start_time = time.time()
+        while self.busy and len(self.busy) >= min(args.K, self.executor.workers):
+            print(f"Round {round_idx + 1}: 等待仍在后台训练的客户端 {sorted(self.busy)}")
+            wait(list(self.busy.values()), return_when=FIRST_COMPLETED)
+            self._reap_busy()
+        return (time.time() - start_time) * 1000
+
+    def _process_update(self, client_id, result, record) -> bool:
+        """对一个按时完成的客户端：写回权重、编码、签名、验证，通过则折叠；返回是否通过验证"""
+        trained_model = self.executor.apply(self.client_models[client_id], result)
+        stats = result[3]
+        record['train_stats'][client_id] = stats
+        self.scheduler.observe_train(client_id, stats['train_time_ms'])
+        self.tracer.record("train", stats['train_time_ms'], client=client_id)
+
+        weights = trained_model.base_layers.state_dict()
+        if self.codec is not None:
+            with self.tracer.span("encode", client=client_id):
+                weights = self.codec.encode(weights, self.reference)
+        record['update_bytes'].append(encoded_bytes(weights))
+        if not self.signer:
+            self._fold_update(client_id, weights, stats)
+            return True
+
+        if self.tracer.enabled:
+            self.tracer.count("bytes_signed", record['update_bytes'][-1])
+        digest, manifest, signature, sign_time_ms, sign_size = self._sign_update(weights, client_id)
+        self.scheduler.observe_sign(sign_time_ms)
+        with self.tracer.span("verify", client=client_id):
+            [(is_valid, verify_time_ms)] = self.signer.verify_many([digest], [signature])
+        record['sign_times_ms'].append(sign_time_ms)
+        record['sign_sizes'].append(sign_size)
+        record['verify_times_ms'].append(verify_time_ms)
+        print(f"Client {client_id} | "
+              f"签名时间: {sign_time_ms:.2f}ms | "
+              f"验证时间: {verify_time_ms:.2f}ms | "
+              f"签名大小: {sign_size} bytes | "
+              f"验证结果: {'成功' if is_valid else '失败'}")
+        if manifest is not None:
+            is_valid, weights = self._check_manifest(client_id, trained_model, manifest, is_valid)
+        if is_valid:
+            self._fold_update(client_id, weights, stats)
+        return is_valid
+
+    def server_round(self, round_idx):
+        self.tracer.set_round(round_idx)
+        self._reap_busy()
+        wait_ms = self._wait_for_busy(round_idx)
+        start_time = time.time()
+        deadline = start_time + args.deadline_ms / 1000
+        self.aggregator.reset()
+        if self.codec is not None:
+            self.reference = self.aggregator.flatten(self.global_base.state_dict())
+
+        idle_clients = [client_id for client_id in range(args.K) if client_id not in self.busy]
+        target = min(max(int(args.C * args.K), 1), len(idle_clients))
+        # 仍在后台训练的迟到客户端占着训练线程/进程，等待后至少剩一个空闲
+        free_workers = self.executor.workers - len(self.busy)
+        selected_clients = self.scheduler.select(idle_clients, target, free_workers)
+        print(f"Round {round_idx + 1}: Selected clients: {selected_clients} | "
+              f"目标聚合数: {target} | 截止时间: {args.deadline_ms:.0f}ms")
+
+        futures = {}
+        # 训练任务 -> 主进程得知其完成的时间，用于区分截止前后完成
+        finished_at = {}
+        for client_id in selected_clients:
+            model = self.client_models[client_id]
+            model.base_layers.load_state_dict(self.global_base.state_dict())
+            if self.checkpointer is not None and self.executor.mode != "process":
+                self.submitted_states[client_id] = self._snapshot_client(client_id)
+            future = self.executor.submit(model, client_id)
+            future.add_done_callback(lambda done: finished_at.setdefault(done, time.time()))
+            futures[future] = client_id
+
+        record = {'sign_times_ms': [], 'sign_sizes': [], 'verify_times_ms': [], 'update_bytes': [],
+                  'train_stats': {}}
+        accepted, rejected, dropped, failed = [], [], [], []
+        remaining = set(futures)
+        timed_out = False
+        try:
+            for future in as_completed(futures, timeout=max(0.0, deadline - time.time())):
+                remaining.discard(future)
+                client_id = futures[future]
+                if future.exception() is not None:
+                    failed.append(client_id)
+                    print(f"Client {client_id} 训练失败: {future.exception()!r}")
+                    continue
+                if self._process_update(client_id, future.result(), record):
+                    accepted.append(client_id)
+                else:
+                    rejected.append(client_id)
+                if len(accepted) >= target:
+                    break
+        except FuturesTimeout:
+            timed_out = True
+
+        # 已完成但未处理的按完成时间区分：截止前完成的是超额未用（dropped），截止后完成的是迟到（late）；
+        # 仍未完成的在超时时记为late，已够数提前结束时记为dropped；它们都不再签名和聚合
+        late = []
+        elapsed_ms = (time.time() - start_time) * 1000
+        for future in remaining:
+            client_id = futures[future]
+            if future.done():
+                if future.exception() is not None:
+                    failed.append(client_id)
+                    print(f"Client {client_id} 训练失败: {future.exception()!r}")
+                    continue
+                (dropped if finished_at.get(future, time.time()) <= deadline else late).append(client_id)
+                self._keep_local_training(client_id, future.result())
+                continue
+            (late if timed_out else dropped).append(client_id)
+            if not future.cancel():
+                if timed_out:
+                    self.scheduler.observe_late(client_id, elapsed_ms)
+                self.busy[client_id] = future
+        dropped.sort()
+        late.sort()
+        failed.sort()
+        if dropped or late or failed:
+            print(f"Round {round_idx + 1}: 已聚合{len(accepted)}个更新 | 超额未用: {dropped} | 未按时完成: {late}"
+                  + (f" | 训练失败: {failed}" if failed else ""))
+
+        return self._finish_round(round_idx, record, selected_clients, {
+            'deadline_ms': args.deadline_ms,
+            'target': target,
+            'selected_clients': selected_clients,
+            'accepted_clients': accepted,
+            'rejected_clients': rejected,
+            'dropped_clients': dropped,
+            'late_clients': late,
+            'failed_clients': failed,
+            'busy_wait_ms': wait_ms,
+            'round_time_ms': elapsed_ms
+        })
+
+    def _background_clients(self) -> set:
+        return set(self.busy)
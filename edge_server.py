@@ -0,0 +1,256 @@
+import math
+import struct
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+import numpy as np
+import torch
+from args import args_parser
+from aggregator import FlatAggregator
+from codec import UpdateCodec, encoded_bytes
+from crypto import SphincsCPU
+from keystore import KeyStore
+from server import FedPer
+from tensor_io import state_buffers, tensor_buffer
+
+args = args_parser()
+
+"""部分聚合结果签名覆盖的头部：轮次、边缘聚合器编号、更新数、总权重，防止部分和被挪到其他轮次或聚合器"""
+_PARTIAL_HEADER = struct.Struct(">IIQd")
+
+
+def partial_digest(round_idx: int, edge_id: int, partial: torch.Tensor, total_weight: float, count: int) -> bytes:
+    header = _PARTIAL_HEADER.pack(round_idx, edge_id, count, total_weight)
+    return SphincsCPU.digest([header, tensor_buffer(partial)])
+
+
+class EdgeAggregator:
+    """边缘聚合器（运行在独立进程中）：验证本组客户端的签名，按权重折叠进部分和，再用自己的密钥对部分和签名"""
+
+    def __init__(self, edge_id: int, client_public_key: bytes, security_level, reference_state: dict):
+        self.edge_id = edge_id
+        self.client_public_key = client_public_key
+        self.aggregator = FlatAggregator(reference_state, "cpu")
+        self.codec = None
+        if args.update_codec != 'none':
+            self.codec = UpdateCodec(args.update_codec, self.aggregator, args.topk_ratio)
+        self.reference = None
+        self.signer = None
+        if args.use_sphincs:
+            keystore = KeyStore(args.keystore_dir) if args.keystore_dir else None
+            self.signer = SphincsCPU(security_level=security_level, key_id=f"edge_{edge_id}", keystore=keystore,
+                                     backend=args.hash_backend, fors_cache_mb=args.fors_cache_mb)
+
+    def public_key(self) -> bytes:
+        return self.signer.public_key if self.signer else b""
+
+    def begin(self, reference: torch.Tensor = None):
+        """开始新一轮；reference为本轮全局模型展平后的向量，解码编码更新时使用"""
+        self.aggregator.reset()
+        self.reference = reference
+
+    def add(self, client_id: int, weights: dict, signature: bytes, weight: float) -> tuple:
+        """针对收到的字节重新计算摘要并验证客户端签名，通过则按权重折叠；返回(client_id, 是否通过, 验证时间ms)"""
+        is_valid, verify_time_ms = True, 0.0
+        if self.signer:
+            digest = self.signer.digest(state_buffers(weights))
+            [(is_valid, verify_time_ms)] = self.signer.verify_pool.verify_many(
+                [(digest, signature, self.client_public_key)])
+        if is_valid:
+            if self.codec is not None:
+                self.codec.decode_into(weights, self.reference, weight)
+            else:
+                self.aggregator.add(weights, weight)
+        return client_id, is_valid, verify_time_ms
+
+    def finish(self, round_idx: int) -> dict:
+        """对本轮部分和 sum(weight_i * update_i) 连同总权重、更新数签名"""
+        partial = self.aggregator.buffer
+        total_weight, count = self.aggregator.total_weight, self.aggregator.count
+        signature, sign_time_ms = b"", 0.0
+        if self.signer and count:
+            digest = partial_digest(round_idx, self.edge_id, partial, total_weight, count)
+            signature, sign_time_ms, _ = self.signer.sign_digest(digest)
+        return {'edge_id': self.edge_id, 'partial': partial, 'total_weight': total_weight, 'count': count,
+                'signature': signature, 'sign_time_ms': sign_time_ms}
+
+    def close(self):
+        if self.signer:
+            self.signer.close()
+
+
+_edge = None
+
+
+def _init_edge(edge_id: int, client_public_key: bytes, security_level, reference_state: dict):
+    """进程池初始化：每个边缘进程只构造一次聚合器并加载（或生成）自己的密钥"""
+    global _edge
+    _edge = EdgeAggregator(edge_id, client_public_key, security_level, reference_state)
+
+
+def _edge_call(method: str, *call_args):
+    return getattr(_edge, method)(*call_args)
+
+
+class EdgeProcess:
+    """父进程中的边缘聚合器句柄：单个工作进程的进程池，调用按提交顺序执行"""
+
+    def __init__(self, edge_id: int, client_public_key: bytes, security_level, reference_state: dict):
+        self.edge_id = edge_id
+        self.public_key = None
+        self._executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_edge,
+                                             initargs=(edge_id, client_public_key, security_level, reference_state))
+
+    def call(self, method: str, *call_args) -> Future:
+        return self._executor.submit(_edge_call, method, *call_args)
+
+    def close(self):
+        self.call("close").result()
+        self._executor.shutdown()
+
+
+class HierarchicalFedPer(FedPer):
+    """两级聚合：客户端按client_id % edges分组，边缘聚合器进程验证本组签名并计算加权部分和，
+    服务器只验证各边缘聚合器对部分和的签名，每轮根节点验证次数为O(边缘聚合器数)而不是O(K)
+
+    只有验证被分摊：本模拟中客户端更新的签名仍由根进程在主循环中逐个生成，根节点签名工作量仍为O(K)，
+    次数记在round_stats的root_client_signatures中
+    """
+
+    def __init__(self):
+        if args.batch_sign or args.manifest:
+            raise ValueError("分层聚合由边缘聚合器逐个验证客户端签名，不支持--batch_sign/--manifest")
+        if args.transport != 'local':
+            raise ValueError("分层聚合目前只支持进程内传输")
+        if args.async_server or args.deadline_ms > 0:
+            raise ValueError("分层聚合按组同步等待所有客户端，不能与--async_server/--deadline_ms同时使用")
+        super().__init__()
+        client_public_key = self.signer.public_key if self.signer else b""
+        security_level = self.signer.security_level if self.signer else args.sphincs_security
+        reference_state = {key: value.detach().cpu() for key, value in self.global_base.state_dict().items()}
+        self.edges = [EdgeProcess(edge_id, client_public_key, security_level, reference_state)
+                      for edge_id in range(args.edges)]
+        # 各边缘进程并行启动并加载密钥
+        for edge, future in [(edge, edge.call("public_key")) for edge in self.edges]:
+            edge.public_key = future.result()
+        print(f"边缘聚合器: {len(self.edges)} | 每个聚合器最多负责{math.ceil(args.K / len(self.edges))}个客户端")
+
+    def _edge_of(self, client_id) -> EdgeProcess:
+        return self.edges[int(client_id) % len(self.edges)]
+
+    def server_round(self, round_idx):
+        num_selected = max(int(args.C * args.K), 1)
+        selected_clients = np.random.choice(range(args.K), num_selected, replace=False)
+        print(f"Round {round_idx + 1}: Selected clients: {selected_clients}")
+        self.tracer.set_round(round_idx)
+
+        self.aggregator.reset()
+        if self.codec is not None:
+            self.reference = self.aggregator.flatten(self.global_base.state_dict())
+        reference = self.reference.cpu() if self.codec is not None else None
+        for edge in self.edges:
+            edge.call("begin", reference)
+
+        futures = []
+        for client_id in selected_clients:
+            model = self.client_models[client_id]
+            model.base_layers.load_state_dict(self.global_base.state_dict())
+            futures.append(self.executor.submit(model, client_id))
+
+        round_train_stats = {}
+        round_sign_times_ms = []
+        round_sign_sizes = []
+        round_verify_times_ms = []
+        round_update_bytes = []
+        signed = {}
+        add_futures = []
+        # 先完成训练的客户端先签名并发往所属边缘聚合器，边缘验证与其余客户端的训练重叠
+        for future in as_completed(futures):
+            result = future.result()
+            client_id = result[0]
+            trained_model = self.executor.apply(self.client_models[client_id], result)
+            round_train_stats[client_id] = stats = result[3]
+            self.tracer.record("train", stats['train_time_ms'], client=int(client_id))
+            weights = trained_model.base_layers.state_dict()
+            if self.codec is not None:
+                with self.tracer.span("encode", client=int(client_id)):
+                    weights = self.codec.encode(weights, self.reference)
+            round_update_bytes.append(encoded_bytes(weights))
+
+            signature = b""
+            if self.signer:
+                if self.tracer.enabled:
+                    self.tracer.count("bytes_signed", round_update_bytes[-1])
+                _, _, signature, sign_time_ms, sign_size = self._sign_update(weights, client_id)
+                round_sign_times_ms.append(sign_time_ms)
+                round_sign_sizes.append(sign_size)
+                signed[client_id] = (sign_time_ms, sign_size)
+            weight = stats['samples'] if args.weighted_agg else 1.0
+            with self.tracer.span("dispatch", client=int(client_id)):
+                add_futures.append(self._edge_of(client_id).call("add", client_id, weights, signature, weight))
+
+        edge_rejected = []
+        for add_future in add_futures:
+            client_id, is_valid, verify_time_ms = add_future.result()
+            if not is_valid:
+                edge_rejected.append(int(client_id))
+            if self.signer:
+                sign_time_ms, sign_size = signed[client_id]
+                round_verify_times_ms.append(verify_time_ms)
+                print(f"Client {client_id} | "
+                      f"签名时间: {sign_time_ms:.2f}ms | "
+                      f"边缘{self._edge_of(client_id).edge_id}验证时间: {verify_time_ms:.2f}ms | "
+                      f"签名大小: {sign_size} bytes | "
+                      f"验证结果: {'成功' if is_valid else '失败'}")
+
+        with self.tracer.span("edge_finish", edges=len(self.edges)):
+            partials = [future.result() for future in [edge.call("finish", round_idx) for edge in self.edges]]
+        partials = [partial for partial in partials if partial['count']]
+
+        # 根节点只验证每个边缘聚合器的一个签名，并针对收到的部分和重新计算摘要
+        root_results = [(True, 0.0)] * len(partials)
+        if self.signer and partials:
+            items = [(partial_digest(round_idx, partial['edge_id'], partial['partial'], partial['total_weight'],
+                                     partial['count']), partial['signature'], self.edges[partial['edge_id']].public_key)
+                     for partial in partials]
+            with self.tracer.span("verify", clients=len(items)):
+                root_results = self.signer.verify_pool.verify_many(items)
+        edge_sign_times_ms, root_verify_times_ms, edge_accepted = [], [], []
+        for partial, (is_valid, verify_time_ms) in zip(partials, root_results):
+            edge_sign_times_ms.append(partial['sign_time_ms'])
+            root_verify_times_ms.append(verify_time_ms)
+            if is_valid:
+                edge_accepted.append(partial['edge_id'])
+                with self.tracer.span("aggregate", edge=partial['edge_id']):
+                    self.aggregator.add_partial(partial['partial'], partial['total_weight'], partial['count'])
+            if self.signer:
+                print(f"Edge {partial['edge_id']} | "
+                      f"部分和更新数: {partial['count']} | "
+                      f"签名时间: {partial['sign_time_ms']:.2f}ms | "
+                      f"根节点验证时间: {verify_time_ms:.2f}ms | "
+                      f"验证结果: {'成功' if is_valid else '失败'}")
+
+        record = {'sign_times_ms': round_sign_times_ms, 'sign_sizes': round_sign_sizes,
+                  'verify_times_ms': round_verify_times_ms, 'update_bytes': round_update_bytes,
+                  'train_stats': round_train_stats}
+        return self._finish_round(round_idx, record, selected_clients, {
+            'edges': len(self.edges),
+            'edge_accepted': edge_accepted,
+            'edge_rejected_clients': edge_rejected,
+            'avg_edge_sign_time_ms': np.mean(edge_sign_times_ms) if edge_sign_times_ms else 0,
+            # 客户端更新的签名仍由根进程代为生成，根节点签名次数为O(K)
+            'root_client_signatures': len(round_sign_times_ms),
+            'root_verifications': len(root_verify_times_ms) if self.signer else 0,
+            'avg_root_verify_time_ms': np.mean(root_verify_times_ms) if root_verify_times_ms else 0
+        })
+
+    def _print_round_extra(self, round_stat):
+        print(f"客户端签名由边缘聚合器验证 | 根节点代客户端签名: {round_stat['root_client_signatures']}次")
+        print(f"根节点验证: {round_stat['root_verifications']}次 | "
+              f"平均验证时间: {round_stat['avg_root_verify_time_ms']:.2f}ms | "
+              f"边缘平均签名时间: {round_stat['avg_edge_sign_time_ms']:.2f}ms")
+
+    def _close(self):
+        for edge in self.edges:
+            edge.close()
+        super()._close()
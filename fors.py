@@ -1,50 +1,168 @@
-import struct
-import hashlib
+import numpy as np
+from collections import OrderedDict
 from sphincs_params import SphincsParams
+from thash import ADRS, get_thash, FORS_TREE, FORS_ROOTS, FORS_PRF
+from thash_np import get_batch_thash, adrs_rows, set_rows_field
 
 
 class FORS:
-    def __init__(self, params: SphincsParams):
+    def __init__(self, params: SphincsParams, backend: str = "hashlib", cache_bytes: int = 32 * 2 ** 20):
+        """k棵高度为a的FORS树；cache_bytes为已生成树层缓存的内存上限，0表示不缓存"""
+        self.backend = backend
         self.params = params
         self.n = params.n
         self.k = params.k
         self.t = params.t
         self.a = params.a
+        self.cache_bytes = cache_bytes
+        """(pk_seed, tree_idx, leaf_idx) -> k棵树的全部层，按LRU淘汰，总字节数不超过cache_bytes"""
+        self.tree_cache = OrderedDict()
+        self.cached_bytes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
 
-    def sign(self, md: bytes, sk_seed: bytes, pk_seed: bytes, tree_idx: int, leaf_idx: int) -> bytes:
-        """生成FORS签名"""
-        sig = b""
-        for i in range(self.k):
-            offset = (i * self.a) // 8
-            bits_offset = (i * self.a) % 8
-            idx_bits = (md[offset] >> bits_offset) & (2 ** min(8 - bits_offset, self.a) - 1)
+    def _adrs(self, addr_type: int, tree_idx: int, leaf_idx: int) -> ADRS:
+        return ADRS().set_tree(tree_idx).set_type(addr_type).set_keypair(leaf_idx)
+
+    def _rows(self, addr_type: int, tree_idx: int, leaf_idx: int, indices, height: int = 0) -> np.ndarray:
+        rows = adrs_rows(self._adrs(addr_type, tree_idx, leaf_idx), len(indices))
+        set_rows_field(rows, 24, height)
+        return set_rows_field(rows, 28, indices)
+
+    def signature_size(self) -> int:
+        """每棵树一个私钥元素加a个认证路径节点"""
+        return self.k * (self.a + 1) * self.n
+
+    def _indices(self, md: bytes) -> list:
+        """把消息按大端位串切成k个a位的叶子索引"""
+        value = int.from_bytes(md, "big") >> (len(md) * 8 - self.k * self.a)
+        return [(value >> ((self.k - 1 - i) * self.a)) & (self.t - 1) for i in range(self.k)]
+
+    def _build_levels(self, sk_seed: bytes, pk_seed: bytes, tree_idx: int, leaf_idx: int) -> list:
+        """生成k棵树的全部层，levels[h]形状为(k, t >> h, n)；第h层第j个节点的树索引为i * (t >> h) + j"""
+        total = self.k * self.t
+        if self.backend == "numpy":
+            bth = get_batch_thash(pk_seed)
+            sks = bth.prf_many(sk_seed, self._rows(FORS_PRF, tree_idx, leaf_idx, range(total)))
+            nodes = bth.thash_many(sks, self._rows(FORS_TREE, tree_idx, leaf_idx, range(total)))
+        else:
+            th = get_thash(pk_seed)
+            prf_adrs = self._adrs(FORS_PRF, tree_idx, leaf_idx)
+            adrs = self._adrs(FORS_TREE, tree_idx, leaf_idx)
+            nodes = b"".join(th.thash(th.prf(sk_seed, prf_adrs.set_tree_index(idx)), adrs.set_tree_index(idx))
+                             for idx in range(total))
+            nodes = np.frombuffer(nodes, dtype=np.uint8)
+
+        levels = [np.ascontiguousarray(nodes).reshape(self.k, self.t, self.n)]
+        for height in range(1, self.a + 1):
+            count = self.t >> height
+            pairs = levels[-1].reshape(self.k * count, 2 * self.n)
+            if self.backend == "numpy":
+                rows = self._rows(FORS_TREE, tree_idx, leaf_idx, range(self.k * count), height)
+                nodes = get_batch_thash(pk_seed).thash_many(pairs, rows)
+            else:
+                th = get_thash(pk_seed)
+                adrs = self._adrs(FORS_TREE, tree_idx, leaf_idx).set_tree_height(height)
+                nodes = np.frombuffer(b"".join(th.thash(pair.tobytes(), adrs.set_tree_index(idx))
+                                               for idx, pair in enumerate(pairs)), dtype=np.uint8)
+            levels.append(np.ascontiguousarray(nodes).reshape(self.k, count, self.n))
+        return levels
+
+    def _get_levels(self, sk_seed: bytes, pk_seed: bytes, tree_idx: int, leaf_idx: int) -> list:
+        """取k棵树的全部层，(tree_idx, leaf_idx)重复出现时直接复用缓存"""
+        key = (pk_seed, tree_idx, leaf_idx)
+        levels = self.tree_cache.get(key)
+        if levels is not None:
+            self.tree_cache.move_to_end(key)
+            self.cache_hits += 1
+            return levels
 
-            sk = self.gen_sk(sk_seed, i, tree_idx, leaf_idx)
+        self.cache_misses += 1
+        levels = self._build_levels(sk_seed, pk_seed, tree_idx, leaf_idx)
+        size = sum(level.nbytes for level in levels)
+        if size <= self.cache_bytes:
+            self.tree_cache[key] = levels
+            self.cached_bytes += size
+            while self.cached_bytes > self.cache_bytes:
+                _, evicted = self.tree_cache.popitem(last=False)
+                self.cached_bytes -= sum(level.nbytes for level in evicted)
+        return levels
 
-            sig += sk
-        return sig
+    def _compress_roots(self, roots: bytes, pk_seed: bytes, tree_idx: int, leaf_idx: int) -> bytes:
+        adrs = self._adrs(FORS_ROOTS, tree_idx, leaf_idx)
+        return get_thash(pk_seed).thash(roots, adrs)
 
-    def gen_sk(self, sk_seed: bytes, idx: int, tree_idx: int, leaf_idx: int) -> bytes:
+    def sign_with_pk(self, md: bytes, sk_seed: bytes, pk_seed: bytes, tree_idx: int, leaf_idx: int) -> tuple:
+        """生成FORS签名并直接由树根得到FORS公钥，省去签名后再从签名恢复公钥"""
+        levels = self._get_levels(sk_seed, pk_seed, tree_idx, leaf_idx)
+        indices = self._indices(md)
+        if self.backend == "numpy":
+            rows = self._rows(FORS_PRF, tree_idx, leaf_idx, [i * self.t + idx for i, idx in enumerate(indices)])
+            sks = get_batch_thash(pk_seed).prf_many(sk_seed, rows)
+        else:
+            sks = [self.gen_sk(sk_seed, pk_seed, i * self.t + idx, tree_idx, leaf_idx)
+                   for i, idx in enumerate(indices)]
+
+        sig = []
+        for i, idx in enumerate(indices):
+            sig.append(bytes(sks[i]))
+            for height in range(self.a):
+                sig.append(levels[height][i, (idx >> height) ^ 1].tobytes())
+        roots = levels[-1].tobytes()
+        return b"".join(sig), self._compress_roots(roots, pk_seed, tree_idx, leaf_idx)
+
+    def sign(self, md: bytes, sk_seed: bytes, pk_seed: bytes, tree_idx: int, leaf_idx: int) -> bytes:
+        """生成FORS签名：每棵树给出所选叶子的私钥元素和认证路径"""
+        return self.sign_with_pk(md, sk_seed, pk_seed, tree_idx, leaf_idx)[0]
+
+    def gen_sk(self, sk_seed: bytes, pk_seed: bytes, idx: int, tree_idx: int, leaf_idx: int) -> bytes:
         """生成FORS私钥"""
-        addr_bytes = struct.pack(">I", tree_idx) + struct.pack(">I", leaf_idx) + struct.pack(">H", idx)
-        return hashlib.sha256(sk_seed + b'\x00' + addr_bytes).digest()
+        adrs = self._adrs(FORS_PRF, tree_idx, leaf_idx).set_tree_index(idx)
+        return get_thash(pk_seed).prf(sk_seed, adrs)
 
     def pk_from_sig(self, sig: bytes, md: bytes, pk_seed: bytes, tree_idx: int, leaf_idx: int) -> bytes:
-        """从签名恢复FORS公钥"""
-        roots = []
-        for i in range(self.k):
-            offset = (i * self.a) // 8
-            bits_offset = (i * self.a) % 8
-            leaf_idx = (md[offset] >> bits_offset) & (2 ** min(8 - bits_offset, self.a) - 1)
-
-            sk = sig[i * self.n: (i + 1) * self.n]
+        """从签名恢复FORS公钥：由私钥元素计算叶子，沿认证路径求出各树根后压缩"""
+        indices = self._indices(md)
+        step = (self.a + 1) * self.n
+        sks = [sig[i * step:i * step + self.n] for i in range(self.k)]
+        paths = [[sig[i * step + (j + 1) * self.n:i * step + (j + 2) * self.n] for j in range(self.a)]
+                 for i in range(self.k)]
 
-            node = self.compute_leaf_node(sk, i, tree_idx, leaf_idx, pk_seed)
-            roots.append(node)
+        if self.backend == "numpy":
+            bth = get_batch_thash(pk_seed)
+            positions = np.array([i * self.t + idx for i, idx in enumerate(indices)], dtype=np.int64)
+            sk_nodes = np.frombuffer(b"".join(sks), dtype=np.uint8).reshape(self.k, self.n)
+            nodes = bth.thash_many(sk_nodes, self._rows(FORS_TREE, tree_idx, leaf_idx, positions))
+            for height in range(self.a):
+                siblings = np.frombuffer(b"".join(path[height] for path in paths),
+                                         dtype=np.uint8).reshape(self.k, self.n)
+                right = ((positions >> height) & 1).astype(bool).reshape(-1, 1)
+                pairs = np.where(right, np.concatenate([siblings, nodes], axis=1),
+                                 np.concatenate([nodes, siblings], axis=1))
+                rows = self._rows(FORS_TREE, tree_idx, leaf_idx, positions >> (height + 1), height + 1)
+                nodes = bth.thash_many(pairs, rows)
+            roots = nodes.tobytes()
+        else:
+            roots = b"".join(self.compute_root(sks[i], paths[i], i * self.t + idx, tree_idx, leaf_idx, pk_seed)
+                             for i, idx in enumerate(indices))
 
-        return hashlib.sha256(b''.join(roots)).digest()
+        return self._compress_roots(roots, pk_seed, tree_idx, leaf_idx)
 
     def compute_leaf_node(self, sk: bytes, idx: int, tree_idx: int, leaf_idx: int, pk_seed: bytes) -> bytes:
         """计算叶子节点"""
-        return hashlib.sha256(
-            sk + pk_seed + struct.pack(">I", tree_idx) + struct.pack(">I", leaf_idx) + struct.pack(">H", idx)).digest()
+        adrs = self._adrs(FORS_TREE, tree_idx, leaf_idx).set_tree_index(idx)
+        return get_thash(pk_seed).thash(sk, adrs)
+
+    def compute_root(self, sk: bytes, auth_path: list, idx: int, tree_idx: int, leaf_idx: int,
+                     pk_seed: bytes) -> bytes:
+        """由私钥元素和认证路径计算一棵FORS树的根，idx为全局叶子索引i * t + j"""
+        th = get_thash(pk_seed)
+        adrs = self._adrs(FORS_TREE, tree_idx, leaf_idx)
+        node = self.compute_leaf_node(sk, idx, tree_idx, leaf_idx, pk_seed)
+        for height, sibling in enumerate(auth_path, start=1):
+            adrs.set_tree_height(height).set_tree_index(idx >> height)
+            if (idx >> (height - 1)) & 1:
+                node = th.thash(sibling + node, adrs)
+            else:
+                node = th.thash(node + sibling, adrs)
+        return node
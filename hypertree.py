@@ -1,65 +1,260 @@
-import struct
-import hashlib
+import math
+import multiprocessing
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from sphincs_params import SphincsParams
 from wots import WOTS
-import torch
+from thash import ADRS, get_thash, TREE
+from thash_np import get_batch_thash, adrs_rows, set_rows_field
+
+
+def _leaf_range_worker(params: SphincsParams, backend: str, sk_seed: bytes, pk_seed: bytes, layer: int,
+                       tree_idx: int, start: int, stop: int) -> list:
+    """进程池任务：计算子树中[start, stop)范围的叶子"""
+    return Hypertree(params, cache_size=0, backend=backend)._gen_leaf_range(sk_seed, pk_seed, layer, tree_idx,
+                                                                           start, stop)
 
 
 class Hypertree:
-    def __init__(self, params: SphincsParams):
+    def __init__(self, params: SphincsParams, cache_size: int = 64, workers: int = 1, backend: str = "hashlib"):
         self.params = params
         self.n = params.n
+        self.d = params.d
+        self.h_prime = params.h // params.d
+        self.backend = backend
+        self.wots = WOTS(params, backend)
+        self.cache_size = cache_size
+        """(pk_seed, layer, tree_idx) -> 子树各层节点，按LRU淘汰"""
+        self.subtree_cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        """(pk_seed, layer, tree_idx) -> 叶子节点列表，可由密钥库的内存映射缓存填充"""
+        self.leaf_cache = {}
+        self.workers = workers
+        self._executor = None
 
-    def compute_leaf(self, wots_pk: bytes, pk_seed: bytes, tree_idx: int, leaf_idx: int) -> bytes:
+    def compute_leaf(self, wots_pk: bytes, pk_seed: bytes, tree_idx: int, leaf_idx: int, layer: int = 0) -> bytes:
         """计算叶子节点"""
-        addr_bytes = struct.pack(">I", tree_idx) + struct.pack(">I", leaf_idx)
-        return hashlib.sha256(wots_pk + pk_seed + addr_bytes).digest()
+        adrs = self._tree_adrs(tree_idx, layer).set_tree_index(leaf_idx)
+        return get_thash(pk_seed).thash(wots_pk, adrs)
+
+    def gen_root(self, sk_seed: bytes, pk_seed: bytes) -> bytes:
+        """生成超树的根（顶层子树的根）"""
+        levels = self.build_subtree(sk_seed, pk_seed, self.d - 1, 0)
+        return levels[-1][0]
 
-    def gen_root(self, sk_seed: bytes, pk_seed: bytes, layers: int, layer_idx: int) -> bytes:
-        """生成超树的根"""
+    def _gen_leaf_range(self, sk_seed: bytes, pk_seed: bytes, layer: int, tree_idx: int, start: int,
+                        stop: int) -> list:
+        if self.backend == "numpy":
+            # 整个区间所有叶子的所有链作为lanes同步推进，再一次性计算叶子节点
+            wots_pks = self.wots.gen_pks(sk_seed, pk_seed, tree_idx, range(start, stop), layer)
+            data = np.frombuffer(b"".join(wots_pks), dtype=np.uint8).reshape(len(wots_pks), self.n)
+            rows = set_rows_field(adrs_rows(self._tree_adrs(tree_idx, layer), len(wots_pks)), 28, range(start, stop))
+            return [bytes(node) for node in get_batch_thash(pk_seed).thash_many(data, rows)]
 
-        leaf_count = 2 ** layers
         leaves = []
+        for i in range(start, stop):
+            wots_pk = self.wots.gen_pk(sk_seed, pk_seed, tree_idx, i, layer)
+            leaves.append(self.compute_leaf(wots_pk, pk_seed, tree_idx, i, layer))
+        return leaves
 
-        for i in range(leaf_count):
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # 子树可能在训练/传输线程运行后才首次并行生成，fork多线程进程可能死锁，改用spawn
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
 
-            wots = WOTS(self.params)
-            wots_nodes = []
-            for j in range(wots.len):
-                sk = wots.gen_sk(sk_seed, j, layer_idx, i)
+    def gen_leaves(self, sk_seed: bytes, pk_seed: bytes, layer: int, tree_idx: int) -> list:
+        """生成子树的全部叶子节点，优先使用已缓存的叶子"""
+        return self.gen_leaves_many(sk_seed, pk_seed, [(layer, tree_idx)])[0]
 
-                node = wots.compute_chain(sk, wots.w - 1, j, pk_seed, layer_idx, i)
-                wots_nodes.append(node)
+    def gen_leaves_many(self, sk_seed: bytes, pk_seed: bytes, trees: list) -> list:
+        """生成多棵子树的叶子；workers>1时把所有叶子按区间分给进程池，结果与串行计算一致"""
+        leaf_count = 2 ** self.h_prime
+        results = [None] * len(trees)
+        missing = []
+        for pos, (layer, tree_idx) in enumerate(trees):
+            cached = self.leaf_cache.get((pk_seed, layer, tree_idx))
+            if cached is not None and len(cached) == leaf_count:
+                results[pos] = list(cached)
+            else:
+                missing.append(pos)
 
-            wots_pk = wots._l_tree(wots_nodes, pk_seed, layer_idx, i)
+        if not missing:
+            return results
 
-            leaf = self.compute_leaf(wots_pk, pk_seed, layer_idx, i)
-            leaves.append(leaf)
+        if self.workers <= 1:
+            for pos in missing:
+                layer, tree_idx = trees[pos]
+                results[pos] = self._gen_leaf_range(sk_seed, pk_seed, layer, tree_idx, 0, leaf_count)
+            return results
 
-        return self._mt_treehash(leaves, pk_seed, layer_idx)
+        chunks_per_tree = max(1, math.ceil(self.workers / len(missing)))
+        chunk_size = max(1, math.ceil(leaf_count / chunks_per_tree))
+        executor = self._get_executor()
+        futures = []
+        for pos in missing:
+            layer, tree_idx = trees[pos]
+            futures.append([executor.submit(_leaf_range_worker, self.params, self.backend, sk_seed, pk_seed, layer,
+                                            tree_idx, start, min(start + chunk_size, leaf_count))
+                            for start in range(0, leaf_count, chunk_size)])
 
-    def _mt_treehash(self, leaves: list, pk_seed: bytes, tree_idx: int) -> bytes:
-        """构建Merkle树并返回根"""
-        if len(leaves) == 1:
-            return leaves[0]
-
-        new_level = []
-        for i in range(0, len(leaves), 2):
-            if i + 1 < len(leaves):
-                combined = leaves[i] + leaves[i + 1]
-                addr_bytes = struct.pack(">I", tree_idx) + struct.pack(">H", i // 2)
-                new_level.append(hashlib.sha256(combined + pk_seed + addr_bytes).digest())
+        for pos, tree_futures in zip(missing, futures):
+            leaves = []
+            for future in tree_futures:
+                leaves.extend(future.result())
+            results[pos] = leaves
+        return results
+
+    def build_subtree(self, sk_seed: bytes, pk_seed: bytes, layer: int, tree_idx: int) -> list:
+        """构建子树并返回各层节点（levels[0]为叶子，levels[-1]为根），命中缓存时跳过WOTS+计算"""
+        return self.build_subtrees(sk_seed, pk_seed, [(layer, tree_idx)])[0]
+
+    def build_subtrees(self, sk_seed: bytes, pk_seed: bytes, trees: list) -> list:
+        """批量构建子树，未命中缓存的子树一起并行生成叶子"""
+        results = [None] * len(trees)
+        missing = []
+        for pos, (layer, tree_idx) in enumerate(trees):
+            key = (pk_seed, layer, tree_idx)
+            levels = self.subtree_cache.get(key)
+            if levels is not None:
+                self.subtree_cache.move_to_end(key)
+                self.cache_hits += 1
+                results[pos] = levels
             else:
-                new_level.append(leaves[i])
+                self.cache_misses += 1
+                missing.append(pos)
+
+        if missing:
+            all_leaves = self.gen_leaves_many(sk_seed, pk_seed, [trees[pos] for pos in missing])
+            for pos, leaves in zip(missing, all_leaves):
+                layer, tree_idx = trees[pos]
+                levels = self._mt_levels(leaves, pk_seed, tree_idx, layer)
+                results[pos] = levels
+                if self.cache_size > 0:
+                    self.subtree_cache[(pk_seed, layer, tree_idx)] = levels
+                    while len(self.subtree_cache) > self.cache_size:
+                        self.subtree_cache.popitem(last=False)
+        return results
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
 
-        return self._mt_treehash(new_level, pk_seed, tree_idx)
+    def _tree_adrs(self, tree_idx: int, layer: int) -> ADRS:
+        return ADRS().set_layer(layer).set_tree(tree_idx).set_type(TREE)
+
+    def _mt_levels(self, leaves: list, pk_seed: bytes, tree_idx: int, layer: int = 0) -> list:
+        """构建Merkle树，返回自底向上的全部层"""
+        th = get_thash(pk_seed)
+        adrs = self._tree_adrs(tree_idx, layer)
+        levels = [list(leaves)]
+        height = 0
+        while len(levels[-1]) > 1:
+            nodes = levels[-1]
+            height += 1
+            adrs.set_tree_height(height)
+            new_level = []
+            for i in range(0, len(nodes), 2):
+                if i + 1 < len(nodes):
+                    adrs.set_tree_index(i // 2)
+                    new_level.append(th.thash(nodes[i] + nodes[i + 1], adrs))
+                else:
+                    new_level.append(nodes[i])
+            levels.append(new_level)
+        return levels
+
+    def _mt_treehash(self, leaves: list, pk_seed: bytes, tree_idx: int, layer: int = 0) -> bytes:
+        """构建Merkle树并返回根"""
+        return self._mt_levels(leaves, pk_seed, tree_idx, layer)[-1][0]
 
-    def generate_auth_path(self, leaf_idx: int, tree_idx: int, leaf_count: int, leaves: list, pk_seed: bytes) -> list:
+    def generate_auth_path(self, levels: list, leaf_idx: int) -> list:
         """生成Merkle树认证路径"""
+        auth_path = []
+        idx = leaf_idx
+        for level in levels[:-1]:
+            auth_path.append(level[idx ^ 1])
+            idx >>= 1
+        return auth_path
 
-        return [b'\x00' * self.n] * (self.params.h // self.params.d)
+    def compute_root(self, leaf: bytes, auth_path: list, leaf_idx: int, pk_seed: bytes, tree_idx: int,
+                     layer: int = 0) -> bytes:
+        """由叶子和认证路径计算子树根"""
+        th = get_thash(pk_seed)
+        adrs = self._tree_adrs(tree_idx, layer)
+        node = leaf
+        idx = leaf_idx
+        for height, sibling in enumerate(auth_path, start=1):
+            adrs.set_tree_height(height).set_tree_index(idx >> 1)
+            if idx & 1:
+                node = th.thash(sibling + node, adrs)
+            else:
+                node = th.thash(node + sibling, adrs)
+            idx >>= 1
+        return node
 
     def verify_auth_path(self, leaf: bytes, auth_path: list, root: bytes, leaf_idx: int, pk_seed: bytes,
-                         tree_idx: int) -> bool:
+                         tree_idx: int, layer: int = 0) -> bool:
         """验证认证路径"""
-        return True
+        return self.compute_root(leaf, auth_path, leaf_idx, pk_seed, tree_idx, layer) == root
+
+    def _path(self, tree_idx: int, leaf_idx: int) -> list:
+        """第0层到顶层每层的(layer, tree_idx, leaf_idx)"""
+        mask = (1 << self.h_prime) - 1
+        path = []
+        for layer in range(self.d):
+            path.append((layer, tree_idx, leaf_idx))
+            leaf_idx = tree_idx & mask
+            tree_idx >>= self.h_prime
+        return path
+
+    def _layer_sig(self, node: bytes, levels: list, sk_seed: bytes, pk_seed: bytes, layer: int, tree_idx: int,
+                   leaf_idx: int) -> bytes:
+        """一层的签名：对node的WOTS+签名加所在子树的认证路径"""
+        wots_sig = self.wots.sign(node, sk_seed, pk_seed, tree_idx, leaf_idx, layer)
+        return wots_sig + b"".join(self.generate_auth_path(levels, leaf_idx))
+
+    def sign(self, msg: bytes, sk_seed: bytes, pk_seed: bytes, tree_idx: int, leaf_idx: int) -> bytes:
+        """逐层生成WOTS+签名和认证路径，每层签名下一层子树的根；各层未缓存的子树一起并行生成叶子
+
+        不做离线预计算：位置由H_msg随消息决定，耗时的下层子树在签名前无从得知；与消息无关且会重复的
+        只有位置数很少的几个顶层，它们的子树已由subtree_cache复用，剩下的WOTS+签名只占签名耗时的百分之一左右
+        """
+        path = self._path(tree_idx, leaf_idx)
+        all_levels = self.build_subtrees(sk_seed, pk_seed, [(layer, tree_idx) for layer, tree_idx, _ in path])
+
+        sig = []
+        node = msg
+        for (layer, tree_idx, leaf_idx), levels in zip(path, all_levels):
+            sig.append(self._layer_sig(node, levels, sk_seed, pk_seed, layer, tree_idx, leaf_idx))
+            node = levels[-1][0]
+        return b"".join(sig)
+
+    def signature_size(self) -> int:
+        return self.d * (self.wots.len + self.h_prime) * self.n
+
+    def verify(self, msg: bytes, sig: bytes, pk_seed: bytes, tree_idx: int, leaf_idx: int, root: bytes) -> bool:
+        """验证超树签名"""
+        if len(sig) != self.signature_size():
+            return False
+
+        mask = (1 << self.h_prime) - 1
+        wots_sig_len = self.wots.len * self.n
+        offset = 0
+        node = msg
+        for layer in range(self.d):
+            wots_sig = sig[offset:offset + wots_sig_len]
+            offset += wots_sig_len
+            auth_path = [sig[offset + j * self.n:offset + (j + 1) * self.n] for j in range(self.h_prime)]
+            offset += self.h_prime * self.n
+
+            wots_pk = self.wots.pk_from_sig(wots_sig, node, pk_seed, tree_idx, leaf_idx, layer)
+            leaf = self.compute_leaf(wots_pk, pk_seed, tree_idx, leaf_idx, layer)
+            node = self.compute_root(leaf, auth_path, leaf_idx, pk_seed, tree_idx, layer)
+
+            leaf_idx = tree_idx & mask
+            tree_idx >>= self.h_prime
+        return node == root
@@ -0,0 +1,168 @@
+import os
+import mmap
+import struct
+import hashlib
+from sphincs_params import SphincsParams
+
+
+class NodeCache:
+    """内存映射的树节点缓存（只读，按需打开）"""
+
+    def __init__(self, path: str, n: int):
+        self.path = path
+        self.n = n
+        self._file = None
+        self._mmap = None
+
+    def _open(self):
+        if self._mmap is None:
+            self._file = open(self.path, "rb")
+            if os.fstat(self._file.fileno()).st_size == 0:
+                self._mmap = b""
+            else:
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def __len__(self) -> int:
+        return len(self._open()) // self.n
+
+    def __getitem__(self, idx: int) -> bytes:
+        buf = self._open()
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError(idx)
+        return bytes(buf[idx * self.n:(idx + 1) * self.n])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        if self._file is not None:
+            self._file.close()
+        self._mmap = None
+        self._file = None
+
+
+class KeyRecord:
+    """单个密钥对及其缓存节点"""
+
+    def __init__(self, public_key: bytes, private_key: bytes, nodes_path: str, n: int):
+        self.public_key = public_key
+        self.private_key = private_key
+        self._nodes_path = nodes_path
+        self._n = n
+        self._nodes = None
+
+    @property
+    def nodes(self):
+        """首次访问时才映射节点文件，不存在则返回None"""
+        if self._nodes is None and os.path.exists(self._nodes_path):
+            self._nodes = NodeCache(self._nodes_path, self._n)
+        return self._nodes
+
+    def close(self):
+        if self._nodes is not None:
+            self._nodes.close()
+            self._nodes = None
+
+
+class KeyStore:
+    """SPHINCS+密钥持久化存储，每个key_id对应一个密钥对
+
+    security_level为整数安全级别或参数集名称，文件名按它区分，头部记录其安全级别和n
+    """
+
+    MAGIC = b"SPXK"
+    VERSION = 3
+    _HEADER = struct.Struct(">4sHHHHH")
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._records = {}
+
+    def _base(self, key_id: str, security_level: int) -> str:
+        return os.path.join(self.root, f"{key_id}_{security_level}")
+
+    def _write_atomic(self, path: str, data_parts: list, mode: int):
+        tmp_path = path + ".tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+        with os.fdopen(fd, "wb") as f:
+            for part in data_parts:
+                f.write(part)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def exists(self, key_id: str, security_level: int) -> bool:
+        return os.path.exists(self._base(key_id, security_level) + ".key")
+
+    def save(self, key_id: str, security_level: int, public_key: bytes, private_key: bytes,
+             nodes: list = None, n: int = 32):
+        """保存密钥对，nodes为可选的树节点列表"""
+        base = self._base(key_id, security_level)
+        header = self._HEADER.pack(self.MAGIC, self.VERSION, SphincsParams(security_level).security_level, n,
+                                   len(public_key), len(private_key))
+        body = header + public_key + private_key
+        self._write_atomic(base + ".key", [body, hashlib.sha256(body).digest()], 0o600)
+
+        old = self._records.pop((key_id, security_level), None)
+        if old is not None:
+            old.close()
+
+        if nodes:
+            self._write_atomic(base + ".nodes", nodes, 0o600)
+        elif os.path.exists(base + ".nodes"):
+            os.remove(base + ".nodes")
+
+    def load(self, key_id: str, security_level: int):
+        """加载密钥对，不存在、损坏或版本不符时返回None"""
+        cached = self._records.get((key_id, security_level))
+        if cached is not None:
+            return cached
+
+        base = self._base(key_id, security_level)
+        try:
+            with open(base + ".key", "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return None
+
+        if len(raw) < self._HEADER.size + 32:
+            return None
+        body, checksum = raw[:-32], raw[-32:]
+        if hashlib.sha256(body).digest() != checksum:
+            return None
+
+        magic, version, level, n, pk_len, sk_len = self._HEADER.unpack_from(body)
+        params = SphincsParams(security_level)
+        if magic != self.MAGIC or version != self.VERSION or level != params.security_level or n != params.n:
+            return None
+        if len(body) != self._HEADER.size + pk_len + sk_len:
+            return None
+
+        offset = self._HEADER.size
+        public_key = body[offset:offset + pk_len]
+        private_key = body[offset + pk_len:offset + pk_len + sk_len]
+
+        record = KeyRecord(public_key, private_key, base + ".nodes", n)
+        self._records[(key_id, security_level)] = record
+        return record
+
+    def delete(self, key_id: str, security_level: int):
+        record = self._records.pop((key_id, security_level), None)
+        if record is not None:
+            record.close()
+        base = self._base(key_id, security_level)
+        for suffix in (".key", ".nodes"):
+            if os.path.exists(base + suffix):
+                os.remove(base + suffix)
+
+    def close(self):
+        for record in self._records.values():
+            record.close()
+        self._records.clear()
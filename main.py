@@ -1,8 +1,20 @@
+from args import args_parser
 from server import FedPer
+from async_server import AsyncFedPer
+from deadline_server import DeadlineFedPer
+from edge_server import HierarchicalFedPer
 
 
 def main():
-    fed_system = FedPer()
+    args = args_parser()
+    if args.async_server:
+        fed_system = AsyncFedPer()
+    elif args.edges > 0:
+        fed_system = HierarchicalFedPer()
+    elif args.deadline_ms > 0:
+        fed_system = DeadlineFedPer()
+    else:
+        fed_system = FedPer()
     fed_system.run()
 
 
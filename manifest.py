@@ -0,0 +1,100 @@
+import struct
+import hashlib
+from merkle import MerkleTree
+from tensor_io import tensor_buffer
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+
+def _leaf_data(name: str, chunk_idx: int, digest: bytes) -> bytes:
+    """把张量名、分块序号和分块摘要绑定为Merkle叶子"""
+    name_bytes = name.encode("utf-8")
+    return struct.pack(">H", len(name_bytes)) + name_bytes + struct.pack(">I", chunk_idx) + digest
+
+
+def iter_chunks(state_dict: dict, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """按state_dict顺序产出(name, chunk_idx, memoryview)，不拷贝张量数据"""
+    for name, value in state_dict.items():
+        buf = tensor_buffer(value)
+        if len(buf) == 0:
+            yield name, 0, buf
+            continue
+        for chunk_idx, offset in enumerate(range(0, len(buf), chunk_size)):
+            yield name, chunk_idx, buf[offset:offset + chunk_size]
+
+
+class Manifest:
+    """state_dict的分块Merkle清单，只需对根签名一次"""
+
+    def __init__(self, entries: list, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.entries = entries
+        self.chunk_size = chunk_size
+        self._index = {(name, chunk_idx): pos for pos, (name, chunk_idx, _) in enumerate(entries)}
+        """张量名 -> 按分块顺序的摘要列表"""
+        self._chunks = {}
+        for name, _, digest in entries:
+            self._chunks.setdefault(name, []).append(digest)
+        self._tree = MerkleTree([_leaf_data(*entry) for entry in entries])
+
+    @classmethod
+    def from_state_dict(cls, state_dict: dict, chunk_size: int = DEFAULT_CHUNK_SIZE) -> "Manifest":
+        entries = [(name, chunk_idx, hashlib.sha256(chunk).digest())
+                   for name, chunk_idx, chunk in iter_chunks(state_dict, chunk_size)]
+        return cls(entries, chunk_size)
+
+    @property
+    def root(self) -> bytes:
+        return self._tree.root
+
+    def digest_of(self, name: str, chunk_idx: int):
+        pos = self._index.get((name, chunk_idx))
+        return None if pos is None else self.entries[pos][2]
+
+    def names(self) -> list:
+        return list(self._chunks)
+
+    def changed(self, previous: "Manifest") -> list:
+        """相对上一份清单发生变化的张量名"""
+        return [name for name, chunks in self._chunks.items() if previous._chunks.get(name) != chunks]
+
+
+class ManifestVerifier:
+    """在清单签名验证通过后，逐块校验收到的数据，遇到损坏立即拒绝"""
+
+    def __init__(self, manifest: Manifest, root_valid: bool):
+        self.manifest = manifest
+        self.valid = root_valid
+        self.bad_chunks = []
+
+    def verify_chunk(self, name: str, chunk_idx: int, chunk) -> bool:
+        if not self.valid:
+            return False
+        expected = self.manifest.digest_of(name, chunk_idx)
+        if expected is None or hashlib.sha256(chunk).digest() != expected:
+            self.bad_chunks.append((name, chunk_idx))
+            self.valid = False
+        return self.valid
+
+    def verify_state_dict(self, state_dict: dict, names: list = None) -> bool:
+        """校验state_dict（或其中names指定的张量），第一个损坏分块处即停止"""
+        if names is not None:
+            state_dict = {name: state_dict[name] for name in names if name in state_dict}
+        received = set()
+        for name, chunk_idx, chunk in iter_chunks(state_dict, self.manifest.chunk_size):
+            if not self.verify_chunk(name, chunk_idx, chunk):
+                return False
+            received.add((name, chunk_idx))
+
+        expected = {(name, chunk_idx) for name, chunk_idx, _ in self.manifest.entries
+                    if names is None or name in names}
+        if received != expected:
+            self.valid = False
+        return self.valid
+
+    def verify_delta(self, previous: Manifest, state_dict: dict) -> tuple:
+        """增量重发时只重新校验变化的张量，返回(是否通过, 变化的张量名)
+
+        未变化的张量不会与收到的数据比对，调用方必须改用上次已验证的数据，不能使用state_dict中的对应张量
+        """
+        changed = self.manifest.changed(previous)
+        return self.verify_state_dict(state_dict, changed), changed
@@ -0,0 +1,78 @@
+import struct
+import hashlib
+
+
+def hash_leaf(data: bytes) -> bytes:
+    """叶子节点哈希（与内部节点做域分离）"""
+    return hashlib.sha256(b'\x00' + data).digest()
+
+
+def hash_node(left: bytes, right: bytes) -> bytes:
+    """内部节点哈希"""
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def bind_count(root: bytes, count: int) -> bytes:
+    """将叶子数量绑定到根上，防止不同规模的树之间混用证明"""
+    return hashlib.sha256(b'\x02' + struct.pack(">I", count) + root).digest()
+
+
+class MerkleTree:
+    """SHA-256二叉Merkle树，奇数节点直接上提"""
+
+    def __init__(self, leaf_digests: list):
+        if not leaf_digests:
+            raise ValueError("Merkle树至少需要一个叶子")
+        self.count = len(leaf_digests)
+        self.levels = [[hash_leaf(d) for d in leaf_digests]]
+        while len(self.levels[-1]) > 1:
+            nodes = self.levels[-1]
+            new_level = []
+            for i in range(0, len(nodes), 2):
+                if i + 1 < len(nodes):
+                    new_level.append(hash_node(nodes[i], nodes[i + 1]))
+                else:
+                    new_level.append(nodes[i])
+            self.levels.append(new_level)
+
+    @property
+    def root(self) -> bytes:
+        return bind_count(self.levels[-1][0], self.count)
+
+    def proof(self, index: int) -> bytes:
+        """生成包含证明：索引、叶子数量和兄弟节点序列"""
+        if index < 0 or index >= self.count:
+            raise IndexError(index)
+        path = []
+        idx = index
+        for level in self.levels[:-1]:
+            if idx ^ 1 < len(level):
+                path.append(level[idx ^ 1])
+            idx >>= 1
+        return struct.pack(">II", index, self.count) + b"".join(path)
+
+
+def root_from_proof(leaf_digest: bytes, proof: bytes):
+    """由叶子摘要和包含证明恢复根，证明格式错误时返回None"""
+    if len(proof) < 8 or (len(proof) - 8) % 32 != 0:
+        return None
+    index, count = struct.unpack(">II", proof[:8])
+    if index >= count:
+        return None
+
+    path = [proof[i:i + 32] for i in range(8, len(proof), 32)]
+    node = hash_leaf(leaf_digest)
+    idx = index
+    width = count
+    while width > 1:
+        if idx ^ 1 < width:
+            if not path:
+                return None
+            sibling = path.pop(0)
+            node = hash_node(sibling, node) if idx & 1 else hash_node(node, sibling)
+        idx >>= 1
+        width = (width + 1) // 2
+
+    if path:
+        return None
+    return bind_count(node, count)
@@ -0,0 +1,175 @@
+import json
+import time
+import threading
+import contextlib
+from thash import TweakableHash
+from thash_np import BatchTweakableHash
+
+_NOOP_SPAN = contextlib.nullcontext()
+
+
+class HashCounter:
+    """临时替换TweakableHash的方法以统计可调哈希调用次数（chain按实际迭代步数计数，
+    NumPy后端按每次调用的lanes数计数）
+
+    只统计当前进程，进程池中的验证/训练不计入
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self._originals = {}
+
+    def __enter__(self):
+        counter = self
+        thash, chain, prf = TweakableHash.thash, TweakableHash.chain, TweakableHash.prf
+        hash_many = BatchTweakableHash.hash_many
+        self._originals = {'thash': thash, 'chain': chain, 'prf': prf, 'hash_many': hash_many}
+
+        def counted_thash(th, data, adrs):
+            counter.calls += 1
+            return thash(th, data, adrs)
+
+        def counted_chain(th, node, adrs, chain_start, steps):
+            counter.calls += steps
+            return chain(th, node, adrs, chain_start, steps)
+
+        def counted_prf(th, sk_seed, adrs):
+            counter.calls += 1
+            return prf(th, sk_seed, adrs)
+
+        def counted_hash_many(bth, suffixes):
+            counter.calls += len(suffixes)
+            return hash_many(bth, suffixes)
+
+        TweakableHash.thash, TweakableHash.chain, TweakableHash.prf = counted_thash, counted_chain, counted_prf
+        BatchTweakableHash.hash_many = counted_hash_many
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for name, method in self._originals.items():
+            setattr(BatchTweakableHash if name == 'hash_many' else TweakableHash, name, method)
+
+
+def _label_text(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class _Span:
+    def __init__(self, tracer: "Tracer", name: str, labels: dict):
+        self.tracer = tracer
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self._hash_start = self.tracer.hash_calls()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        duration_ms = (time.perf_counter() - self._start) * 1000
+        self.tracer.record(self.name, duration_ms, hash_calls=self.tracer.hash_calls() - self._hash_start,
+                           **self.labels)
+
+
+class Tracer:
+    """按阶段记录耗时（span）和计数器，可导出为JSON lines和Prometheus文本格式
+
+    关闭时span返回共享的空上下文、计数直接返回，开销只有一次属性判断。
+    开启哈希计数时在进程内全局替换可调哈希方法，span内的哈希次数为该时间段内的全局增量，
+    与其他线程（如异步模式的签名线程）并发时会包含它们的调用。
+    """
+
+    def __init__(self, enabled: bool = False, count_hashes: bool = True, jsonl_path: str = None,
+                 prom_path: str = None):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.round = None
+        self._events = []
+        self._phases = {}
+        self._round_phases = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._hash_counter = None
+        if enabled and count_hashes:
+            self._hash_counter = HashCounter().__enter__()
+
+    def hash_calls(self) -> int:
+        return self._hash_counter.calls if self._hash_counter is not None else 0
+
+    def set_round(self, round_idx: int):
+        self.round = round_idx
+
+    def span(self, name: str, **labels):
+        """with tracer.span("sign", client=3): ...；关闭时不做任何记录"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name, labels)
+
+    def record(self, name: str, duration_ms: float, hash_calls: int = 0, **labels):
+        """记录一个在别处测得的阶段耗时（例如训练进程返回的train_time_ms）"""
+        if not self.enabled:
+            return
+        event = {'type': 'span', 'name': name, 'round': self.round, 'duration_ms': duration_ms,
+                 'hash_calls': hash_calls, 'time': time.time()}
+        event.update(labels)
+        with self._lock:
+            self._events.append(event)
+            for phases in (self._phases, self._round_phases.setdefault(self.round, {})):
+                total = phases.setdefault(name, {'count': 0, 'total_ms': 0.0, 'hash_calls': 0})
+                total['count'] += 1
+                total['total_ms'] += duration_ms
+                total['hash_calls'] += hash_calls
+            if hash_calls:
+                key = ('hash_calls', (('phase', name),))
+                self._counters[key] = self._counters.get(key, 0) + hash_calls
+
+    def count(self, name: str, value: int = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._events.append({'type': 'counter', 'name': name, 'round': self.round, 'value': value,
+                                 'time': time.time(), **labels})
+
+    def round_summary(self, round_idx: int) -> dict:
+        """某一轮各阶段的总耗时、次数和哈希调用数"""
+        with self._lock:
+            return {name: dict(total) for name, total in self._round_phases.get(round_idx, {}).items()}
+
+    def prometheus_text(self) -> str:
+        lines = ["# TYPE fedper_phase_duration_ms summary"]
+        with self._lock:
+            for name, total in sorted(self._phases.items()):
+                lines.append(f'fedper_phase_duration_ms_sum{{phase="{name}"}} {total["total_ms"]:.3f}')
+                lines.append(f'fedper_phase_duration_ms_count{{phase="{name}"}} {total["count"]}')
+            seen = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE fedper_{name}_total counter")
+                    seen.add(name)
+                lines.append(f"fedper_{name}_total{_label_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        """把未导出的事件追加到JSONL文件，并重写Prometheus文本文件（累计值）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            events, self._events = self._events, []
+        if self.jsonl_path:
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                for event in events:
+                    f.write(json.dumps(event, default=str) + "\n")
+        if self.prom_path:
+            with open(self.prom_path, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+
+    def close(self):
+        self.flush()
+        if self._hash_counter is not None:
+            self._hash_counter.__exit__(None, None, None)
+            self._hash_counter = None
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import platform
+import numpy as np
+from sphincs import SPHINCSPlus
+from sphincs_params import LEGACY_SETS, PARAMETER_SETS, SphincsParams
+
+"""开销模型估算的每轮开销超过最便宜候选该倍数的参数集不再实测"""
+MEASURE_RATIO = 4.0
+
+"""签名实现的开销变化时递增，使旧的实测结果失效"""
+PROFILE_VERSION = 2
+
+
+def machine_key(backend: str = "hashlib") -> str:
+    """实测结果只在同一类机器、同一哈希后端之间复用"""
+    return f"v{PROFILE_VERSION}-{platform.machine()}-{os.cpu_count()}-{platform.python_version()}-{backend}"
+
+
+def profile_parameter_set(name: str, iters: int = 1, backend: str = "hashlib") -> dict:
+    """快速实测一个参数集的密钥生成/签名/验证耗时（取中位数），每次签名使用新的随机索引，包含下层子树重建"""
+    sphincs = SPHINCSPlus(name, backend=backend)
+    try:
+        start_time = time.perf_counter()
+        public_key, private_key = sphincs.keygen()
+        keygen_ms = (time.perf_counter() - start_time) * 1000
+
+        sign_times, verify_times = [], []
+        for _ in range(iters):
+            message = os.urandom(32)
+            start_time = time.perf_counter()
+            signature = sphincs.sign(message, private_key)
+            sign_times.append((time.perf_counter() - start_time) * 1000)
+            start_time = time.perf_counter()
+            if not sphincs.verify(message, signature, public_key):
+                raise RuntimeError(f"参数集{name}自检失败")
+            verify_times.append((time.perf_counter() - start_time) * 1000)
+    finally:
+        sphincs.close()
+
+    return {
+        'keygen_ms': keygen_ms,
+        'sign_ms': float(np.median(sign_times)),
+        'verify_ms': float(np.median(verify_times)),
+        'signature_size': sphincs.signature_size()
+    }
+
+
+def load_profiles(path: str, backend: str = "hashlib") -> dict:
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f).get(machine_key(backend), {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_profiles(path: str, profiles: dict, backend: str = "hashlib"):
+    """合并写回本机的实测结果，先写临时文件再替换"""
+    data = {}
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+    data[machine_key(backend)] = profiles
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def candidates(security_level: int, max_signature_size: int = 0) -> list:
+    """安全级别不低于要求、签名大小不超过预算的参数集，按开销模型（每轮一次签名加一次验证）排序
+
+    fedsign-*只是名义安全级别（FORS强度远低于标注值），不参与自动选择，只能显式指定
+    """
+    result = []
+    for name in PARAMETER_SETS:
+        if name in LEGACY_SETS.values():
+            continue
+        params = SphincsParams(name)
+        if params.security_level < security_level:
+            continue
+        if max_signature_size and params.signature_size() > max_signature_size:
+            continue
+        cost = params.hash_cost()
+        result.append((cost['sign'] + cost['verify'], name))
+    return [name for _, name in sorted(result)]
+
+
+def select_parameter_set(security_level: int, max_signature_size: int = 0, profile_path: str = None,
+                         backend: str = "hashlib", measure: bool = True) -> str:
+    """选出满足安全级别和签名大小预算、每轮签名加验证最快的参数集
+
+    先用开销模型筛掉明显更慢的候选，其余在本机实测（结果缓存到profile_path，同一机器下次直接复用）；
+    measure=False时只按开销模型选择
+    """
+    names = candidates(security_level, max_signature_size)
+    if not names:
+        raise ValueError(f"没有满足安全级别{security_level}且签名不超过{max_signature_size}字节的参数集")
+    if not measure:
+        return names[0]
+
+    costs = {name: sum(SphincsParams(name).hash_cost()[op] for op in ('sign', 'verify')) for name in names}
+    cheapest = costs[names[0]]
+    profiles = load_profiles(profile_path, backend)
+    measured = False
+    for name in names:
+        if name not in profiles and costs[name] <= cheapest * MEASURE_RATIO:
+            profiles[name] = profile_parameter_set(name, backend=backend)
+            measured = True
+    if measured and profile_path:
+        save_profiles(profile_path, profiles, backend)
+
+    timed = [name for name in names if name in profiles]
+    return min(timed, key=lambda name: profiles[name]['sign_ms'] + profiles[name]['verify_ms'])
@@ -0,0 +1,55 @@
+import heapq
+import math
+import numpy as np
+
+
+class DeadlineScheduler:
+    """按历史耗时选择能在截止时间内完成的客户端
+
+    每个客户端的训练耗时用指数滑动平均估计，签名在服务器端串行进行，所有客户端共用一个签名耗时估计；
+    没有历史记录的客户端估计为0，保证新客户端会被尝试
+    """
+
+    def __init__(self, deadline_ms: float, over_provision: float = 1.5, alpha: float = 0.3):
+        self.deadline_ms = deadline_ms
+        self.over_provision = over_provision
+        self.alpha = alpha
+        self.train_ms = {}
+        self.sign_ms = 0.0
+
+    def _ema(self, old, new: float) -> float:
+        return new if old is None else (1 - self.alpha) * old + self.alpha * new
+
+    def observe_train(self, client_id: int, train_ms: float):
+        self.train_ms[client_id] = self._ema(self.train_ms.get(client_id), train_ms)
+
+    def observe_late(self, client_id: int, elapsed_ms: float):
+        """截止时仍未完成的客户端，至少已经用了elapsed_ms，估计值不低于它"""
+        self.train_ms[client_id] = max(self.train_ms.get(client_id, 0.0), elapsed_ms)
+
+    def observe_sign(self, sign_ms: float):
+        self.sign_ms = self._ema(self.sign_ms or None, sign_ms)
+
+    def estimate(self, client_id: int) -> float:
+        return self.train_ms.get(client_id, 0.0) + self.sign_ms
+
+    def select(self, clients: list, target: int, workers: int = 1) -> list:
+        """在随机顺序的候选中模拟workers路并行训练，选出预计在截止时间内完成的客户端，
+        最多选target * over_provision个；不足target个时再补上估计最快的客户端
+        """
+        order = [int(client_id) for client_id in np.random.permutation(clients)]
+        limit = min(len(order), math.ceil(target * self.over_provision))
+        free_at = [0.0] * max(1, workers)
+        selected = []
+        for client_id in order:
+            if len(selected) >= limit:
+                break
+            finish = free_at[0] + self.estimate(client_id)
+            if finish <= self.deadline_ms:
+                heapq.heapreplace(free_at, finish)
+                selected.append(client_id)
+
+        if len(selected) < target:
+            rest = sorted((client_id for client_id in order if client_id not in selected), key=self.estimate)
+            selected.extend(rest[:target - len(selected)])
+        return selected
@@ -1,8 +1,20 @@
 from model import MedModel
 from args import args_parser
-from client import train, validate
+from client import validate, validate_many
 import torch.nn as nn
 from crypto import SphincsCPU
+from keystore import KeyStore
+from tensor_io import state_buffers
+from manifest import Manifest, ManifestVerifier
+from client_executor import ClientExecutor
+from aggregator import FlatAggregator
+from codec import UpdateCodec, encoded_bytes
+from transport import ConnectionPool, UpdateListener
+from metrics import Tracer
+from checkpoint import Checkpoint, CheckpointWriter, snapshot, optimizer_entries, rng_state
+from concurrent.futures import as_completed
+import os
+import copy
 import torch
 import numpy as np
 import time
@@ -13,9 +25,21 @@ args = args_parser()
 class FedPer:
     def __init__(self):
         self.args = args
+        resumed = self._open_checkpoint()
 
         if args.use_sphincs:
-            self.signer = SphincsCPU(security_level=args.sphincs_security)
+            param_set, keypair = args.sphincs_params, None
+            if resumed is not None and 'signer/public_key' in resumed:
+                param_set = resumed.meta['sphincs_params']
+                keypair = (resumed.tensor('signer/public_key').numpy().tobytes(),
+                           resumed.tensor('signer/private_key').numpy().tobytes(),
+                           [row.tobytes() for row in resumed.tensor('signer/nodes').numpy()])
+            keystore = KeyStore(args.keystore_dir) if args.keystore_dir else None
+            self.signer = SphincsCPU(security_level=args.sphincs_security, key_id="server", keystore=keystore,
+                                     verify_workers=args.verify_workers, workers=args.keygen_workers,
+                                     backend=args.hash_backend, param_set=param_set,
+                                     max_signature_size=args.max_sig_size, profile_path=args.param_profile,
+                                     fors_cache_mb=args.fors_cache_mb, keypair=keypair)
         else:
             self.signer = None
 
@@ -37,54 +61,311 @@ class FedPer:
             'verify_times_ms': []
         }
         self.round_stats = []
-
-    def aggregate(self, client_models):
-        """联邦聚合"""
-        global_dict = self.global_base.state_dict()
-
-        for key in global_dict:
-            global_dict[key] = torch.zeros_like(global_dict[key])
-
-        for model in client_models:
-            model_dict = model.base_layers.state_dict()
-            for key in global_dict:
-                if key in model_dict:
-                    global_dict[key] += model_dict[key].to(args.device)
-
-        for key in global_dict:
-            global_dict[key] = global_dict[key] / len(client_models)
-
-        return global_dict
+        self.aggregator = FlatAggregator(self.global_base.state_dict(), args.device)
+        """client_id -> 上一次验证通过的权重清单，用于增量校验"""
+        self.client_manifests = {}
+        """client_id -> 上一次验证通过的权重副本，清单声明未变化的张量从这里取，不使用收到的数据"""
+        self.client_verified_weights = {}
+        self.codec = None
+        """本轮全局模型展平后的向量，编码增量的参考点"""
+        self.reference = None
+        if args.update_codec != 'none':
+            if args.manifest:
+                raise ValueError("--manifest按原始张量分块校验，不能与--update_codec同时使用")
+            self.codec = UpdateCodec(args.update_codec, self.aggregator, args.topk_ratio)
+
+        self.tracer = Tracer(args.metrics, jsonl_path=args.metrics_jsonl, prom_path=args.metrics_prom)
+        self.listener = None
+        self.connections = None
+        self.transport_latencies_ms = []
+        if args.transport == 'tcp':
+            if args.batch_sign or args.manifest:
+                raise ValueError("TCP传输目前只支持逐个客户端签名的更新，不能与--batch_sign/--manifest同时使用")
+            self.listener = UpdateListener(args.transport_host, args.transport_port,
+                                           args.transport_max_frame_mb << 20).start()
+            self.connections = ConnectionPool(self.listener.address, args.transport_connections)
+        # TCP传输时由训练线程/进程在训练完成后直接上传更新
+        self.executor = ClientExecutor(workers=args.train_workers, mode=args.train_mode, connections=self.connections)
+
+        """client_id -> 提交训练时的(个性化层, 优化器state_dict)副本；后台训练的客户端模型由训练任务修改，
+        检查点对仍在后台的客户端保存这份副本，不读取训练到一半的模型"""
+        self.submitted_states = {}
+        self.start_round = 0
+        self.checkpointer = CheckpointWriter(args.ckpt_path) if args.ckpt_every > 0 else None
+        if resumed is not None:
+            self._restore_checkpoint(resumed)
+
+    def _open_checkpoint(self):
+        if not args.resume:
+            return None
+        if not os.path.exists(args.ckpt_path):
+            print(f"未找到检查点 {args.ckpt_path}，从头开始训练")
+            return None
+        return Checkpoint(args.ckpt_path)
+
+    def _restore_checkpoint(self, ckpt):
+        """恢复全局模型、各客户端个性化层和优化器状态、统计数据与随机数状态，从下一轮继续"""
+        start_time = time.time()
+        meta = ckpt.meta
+        if meta['K'] != args.K:
+            raise ValueError(f"检查点的客户端数K={meta['K']}与当前参数K={args.K}不一致")
+
+        self.global_base.load_state_dict(ckpt.state_dict("global_base"))
+        for client_id, model in enumerate(self.client_models):
+            model.base_layers.load_state_dict(self.global_base.state_dict())
+            model.personal_layers.load_state_dict(ckpt.state_dict(f"client/{client_id}"))
+        self.executor.load_optimizer_state_dicts({int(client_id): ckpt.optimizer_state(f"optimizer/{client_id}", extra)
+                                                  for client_id, extra in meta['optimizers'].items()})
+        self.sign_stats = meta['sign_stats']
+        self.round_stats = meta['round_stats']
+        self.start_round = meta['round']
+        ckpt.restore_rng()
+        ckpt.close()
+        print(f"已从检查点恢复 {args.ckpt_path} | 已完成轮次: {self.start_round} | "
+              f"耗时: {(time.time() - start_time) * 1000:.2f}ms")
+
+    def _snapshot_client(self, client_id) -> tuple:
+        """在提交训练前拷贝客户端的个性化层和优化器状态（此时没有线程在修改它们）"""
+        personal = {key: value.detach().clone()
+                    for key, value in self.client_models[client_id].personal_layers.state_dict().items()}
+        optimizer = self.executor.optimizers.get(client_id)
+        optimizer_state = copy.deepcopy(optimizer.state_dict()) if optimizer is not None else \
+            self.executor.optimizer_states.get(client_id)
+        return personal, optimizer_state
+
+    def _checkpoint_client_states(self) -> tuple:
+        """检查点保存的(client_id -> 个性化层state_dict, client_id -> 优化器state_dict)；
+        仍在后台训练的客户端使用submitted_states中提交时的副本"""
+        personal_states = {client_id: model.personal_layers.state_dict()
+                           for client_id, model in enumerate(self.client_models)}
+        optimizer_states = self.executor.optimizer_state_dicts()
+        for client_id in self._background_clients():
+            if client_id in self.submitted_states:
+                personal_states[client_id], optimizer_state = self.submitted_states[client_id]
+                if optimizer_state is None:
+                    optimizer_states.pop(client_id, None)
+                else:
+                    optimizer_states[client_id] = optimizer_state
+        return personal_states, optimizer_states
+
+    def _save_checkpoint(self, completed_rounds):
+        """在主线程拷贝快照后交给后台线程写入，训练不等待磁盘"""
+        start_time = time.time()
+        tensors = {f"global_base/{key}": snapshot(value) for key, value in self.global_base.state_dict().items()}
+        personal_states, optimizer_states = self._checkpoint_client_states()
+        for client_id, state in personal_states.items():
+            tensors.update({f"client/{client_id}/{key}": snapshot(value) for key, value in state.items()})
+        optimizers = {}
+        for client_id, state in optimizer_states.items():
+            optimizer_tensors, optimizers[str(client_id)] = optimizer_entries(f"optimizer/{client_id}", state)
+            tensors.update(optimizer_tensors)
+        rng_tensors, rng_meta = rng_state()
+        tensors.update(rng_tensors)
+
+        meta = copy.deepcopy({'round': completed_rounds, 'K': args.K, 'rng': rng_meta, 'optimizers': optimizers,
+                              'sign_stats': self.sign_stats, 'round_stats': self.round_stats})
+        if self.signer:
+            n = self.signer.sphincs.n
+            nodes = b"".join(self.signer.sphincs.export_nodes(self.signer.public_key))
+            meta['sphincs_params'] = self.signer.sphincs.params.name
+            tensors['signer/public_key'] = torch.frombuffer(bytearray(self.signer.public_key), dtype=torch.uint8)
+            tensors['signer/private_key'] = torch.frombuffer(bytearray(self.signer.private_key), dtype=torch.uint8)
+            tensors['signer/nodes'] = torch.frombuffer(bytearray(nodes), dtype=torch.uint8).view(-1, n) if nodes \
+                else torch.empty((0, n), dtype=torch.uint8)
+
+        self.checkpointer.save(tensors, meta)
+        print(f"Round {completed_rounds}: 检查点快照 {(time.time() - start_time) * 1000:.2f}ms | "
+              f"后台写入 {args.ckpt_path}")
+
+    def _maybe_checkpoint(self, round_idx):
+        if self.checkpointer is not None and ((round_idx + 1) % args.ckpt_every == 0 or round_idx + 1 == args.r):
+            self._save_checkpoint(round_idx + 1)
+
+    def _fold_update(self, client_id, weights, stats, scale=1.0):
+        """验证通过的更新立即折叠进聚合缓冲区，scale用于按陈旧度降低权重；编码后的更新直接解码进缓冲区"""
+        weight = stats['samples'] if args.weighted_agg else 1.0
+        with self.tracer.span("aggregate", client=int(client_id)):
+            if self.codec is not None:
+                self.codec.decode_into(weights, self.reference, weight * scale)
+            else:
+                self.aggregator.add(weights, weight * scale)
+
+    def _update_digest(self, weights, client_id=None) -> tuple:
+        """计算一个更新的摘要，--manifest时为清单根，返回(摘要, 清单)"""
+        labels = {} if client_id is None else {'client': int(client_id)}
+        manifest = None
+        with self.tracer.span("serialize", **labels):
+            if args.manifest:
+                manifest = Manifest.from_state_dict(weights, args.manifest_chunk_size)
+                digest = manifest.root
+            else:
+                digest = self.signer.digest(state_buffers(weights))
+        return digest, manifest
+
+    def _sign_update(self, weights, client_id=None) -> tuple:
+        """计算一个更新的摘要（或清单根）并签名，返回(摘要, 清单, 签名, 签名时间ms, 签名大小)"""
+        digest, manifest = self._update_digest(weights, client_id)
+        labels = {} if client_id is None else {'client': int(client_id)}
+        with self.tracer.span("sign", **labels):
+            signature, sign_time_ms, sign_size = self.signer.sign_digest(digest)
+        return digest, manifest, signature, sign_time_ms, sign_size
+
+    def _check_manifest(self, client_id, trained_model, manifest, root_valid) -> tuple:
+        """根签名验证通过后逐块校验权重，返回(是否通过, 用于聚合的权重)
+
+        已有上一轮清单的客户端只重新校验变化的张量，未变化的张量改用上次验证通过的副本，收到的这部分数据不参与聚合
+        """
+        weights = trained_model.base_layers.state_dict()
+        verifier = ManifestVerifier(manifest, root_valid)
+
+        with self.tracer.span("verify_manifest", client=int(client_id)):
+            previous = self.client_manifests.get(client_id)
+            if previous is not None:
+                is_valid, changed = verifier.verify_delta(previous, weights)
+                verified_weights = self.client_verified_weights[client_id]
+                weights = {name: value.detach().clone() if name in changed else verified_weights[name]
+                           for name, value in weights.items()}
+            else:
+                is_valid, changed = verifier.verify_state_dict(weights), manifest.names()
+                weights = {name: value.detach().clone() for name, value in weights.items()}
+
+        if is_valid:
+            self.client_manifests[client_id] = manifest
+            self.client_verified_weights[client_id] = weights
+        print(f"Client {client_id} | "
+              f"清单校验: {'成功' if is_valid else '失败'} | "
+              f"分块数: {len(manifest.entries)} | "
+              f"重新校验张量: {len(changed)}/{len(manifest.names())}")
+        return is_valid, weights
+
+    def _verify_manifests(self, client_ids, trained_models, round_manifests, verified, train_stats):
+        for client_id, trained_model in zip(client_ids, trained_models):
+            is_valid, weights = self._check_manifest(client_id, trained_model, round_manifests[client_id],
+                                                     verified.get(client_id, False))
+            verified[client_id] = is_valid
+            if is_valid:
+                self._fold_update(client_id, weights, train_stats[client_id])
+
+    def _receive_updates(self, round_idx, client_ids, signed_updates, update_states, train_stats) -> tuple:
+        """从监听器取回训练线程/进程经TCP上传的更新：聚合使用收到的张量，
+        并针对收到的字节重新计算摘要，验证对上传前摘要的签名
+
+        最多等待--transport_timeout秒，返回(待验证的签名更新, 未收到更新的客户端)，未收到的客户端不参与本轮聚合；
+        之前轮次超时后才到达的帧由监听器按轮次丢弃
+        """
+        messages = self.listener.receive(len(client_ids), args.transport_timeout, round_idx, client_ids)
+        for client_id, message in messages.items():
+            update_states[client_id] = message.state_dict()
+            train_stats[client_id] = message.meta['stats']
+        missing = sorted(int(client_id) for client_id in client_ids if client_id not in messages)
+        if missing:
+            print(f"等待{args.transport_timeout:.0f}s后仍未收到以下客户端的更新: {missing}")
+
+        if not self.signer:
+            for client_id in client_ids:
+                if client_id in messages:
+                    self._fold_update(client_id, update_states[client_id], train_stats[client_id])
+            return signed_updates, missing
+        return [(client_id, self.signer.digest(state_buffers(update_states[client_id])), signature, sign_time_ms,
+                 sign_size)
+                for client_id, _, signature, sign_time_ms, sign_size in signed_updates
+                if client_id in messages], missing
 
     def server_round(self, round_idx):
         num_selected = max(int(args.C * args.K), 1)
         selected_clients = np.random.choice(range(args.K), num_selected, replace=False)
         print(f"Round {round_idx + 1}: Selected clients: {selected_clients}")
+        self.tracer.set_round(round_idx)
 
         trained_models = []
+        trained_clients = []
+        round_train_stats = {}
         round_sign_times_ms = []
         round_sign_sizes = []
         round_verify_times_ms = []
-
+        batch_digests = []
+        signed_updates = []
+        round_manifests = {}
+        verified = {}
+        update_states = {}
+        round_transport_bytes = []
+        round_transport_latency_ms = []
+        round_update_bytes = []
+
+        self.aggregator.reset()
+        if self.codec is not None:
+            self.reference = self.aggregator.flatten(self.global_base.state_dict())
+        futures = []
         for client_id in selected_clients:
             model = self.client_models[client_id]
             model.base_layers.load_state_dict(self.global_base.state_dict())
+            futures.append(self.executor.submit(model, client_id, round_idx))
 
-            trained_model = train(args, model, client_id)
+        # 先完成训练的客户端先签名，与其余客户端的训练重叠
+        for future in as_completed(futures):
+            result = future.result()
+            client_id = result[0]
+            trained_model = self.executor.apply(self.client_models[client_id], result)
             trained_models.append(trained_model)
-
-            if self.signer:
-                weight_data = b''
-                weights = trained_model.base_layers.state_dict()
-                for key, value in weights.items():
-                    weight_data += value.cpu().numpy().tobytes()
-
-                signature, sign_time_ms, sign_size = self.signer.sign(weight_data)
+            trained_clients.append(client_id)
+            round_train_stats[client_id] = result[3]
+            self.tracer.record("train", result[3]['train_time_ms'], client=int(client_id))
+            if self.connections is not None:
+                # 更新已由训练线程/进程编码并上传，这里只对它上传前的摘要签名
+                upload = result[3]['upload']
+                round_update_bytes.append(upload['update_bytes'])
+                round_transport_bytes.append(upload['transport_bytes'])
+                round_transport_latency_ms.append(upload['transport_latency_ms'])
+                self.transport_latencies_ms.append(upload['transport_latency_ms'])
+                self.tracer.record("transport", upload['transport_latency_ms'], client=int(client_id))
+                if self.signer:
+                    if self.tracer.enabled:
+                        self.tracer.count("bytes_signed", upload['update_bytes'])
+                    with self.tracer.span("sign", client=int(client_id)):
+                        signature, sign_time_ms, sign_size = self.signer.sign_digest(upload['digest'])
+                    round_sign_times_ms.append(sign_time_ms)
+                    round_sign_sizes.append(sign_size)
+                    signed_updates.append((client_id, upload['digest'], signature, sign_time_ms, sign_size))
+                continue
+
+            weights = update_states[client_id] = trained_model.base_layers.state_dict()
+            if self.codec is not None:
+                with self.tracer.span("encode", client=int(client_id)):
+                    weights = update_states[client_id] = self.codec.encode(weights, self.reference)
+            round_update_bytes.append(encoded_bytes(weights))
+
+            if not self.signer:
+                self._fold_update(client_id, weights, result[3])
+                continue
+
+            if self.tracer.enabled:
+                self.tracer.count("bytes_signed", round_update_bytes[-1])
+            if args.batch_sign:
+                digest, manifest = self._update_digest(weights, client_id)
+                batch_digests.append(digest)
+            else:
+                digest, manifest, signature, sign_time_ms, sign_size = self._sign_update(weights, client_id)
                 round_sign_times_ms.append(sign_time_ms)
                 round_sign_sizes.append(sign_size)
-
-                is_valid, verify_time_ms = self.signer.verify(weight_data, signature)
+                signed_updates.append((client_id, digest, signature, sign_time_ms, sign_size))
+            if manifest is not None:
+                round_manifests[client_id] = manifest
+
+        missing_clients = []
+        if self.listener is not None:
+            signed_updates, missing_clients = self._receive_updates(round_idx, trained_clients, signed_updates,
+                                                                    update_states, round_train_stats)
+
+        if signed_updates:
+            with self.tracer.span("verify", clients=len(signed_updates)):
+                verify_results = self.signer.verify_many([update[1] for update in signed_updates],
+                                                         [update[2] for update in signed_updates])
+            for (client_id, _, _, sign_time_ms, sign_size), (is_valid, verify_time_ms) in zip(signed_updates,
+                                                                                             verify_results):
                 round_verify_times_ms.append(verify_time_ms)
+                verified[client_id] = is_valid
+                if is_valid and not args.manifest:
+                    self._fold_update(client_id, update_states[client_id], round_train_stats[client_id])
 
                 print(f"Client {client_id} | "
                       f"签名时间: {sign_time_ms:.2f}ms | "
@@ -92,36 +373,114 @@ class FedPer:
                       f"签名大小: {sign_size} bytes | "
                       f"验证结果: {'成功' if is_valid else '失败'}")
 
-        self.sign_stats['times_ms'].extend(round_sign_times_ms)
-        self.sign_stats['sizes'].extend(round_sign_sizes)
-        self.sign_stats['verify_times_ms'].extend(round_verify_times_ms)
-
+        if self.signer and args.batch_sign:
+            with self.tracer.span("sign", clients=len(batch_digests)):
+                handles, sign_time_ms, sign_size = self.signer.sign_batch(batch_digests)
+            with self.tracer.span("verify", clients=len(batch_digests)):
+                results, verify_time_ms = self.signer.verify_batch(batch_digests, handles)
+            round_sign_times_ms.append(sign_time_ms)
+            round_verify_times_ms.append(verify_time_ms)
+
+            for client_id, (signature, proof), is_valid in zip(trained_clients, handles, results):
+                round_sign_sizes.append(len(signature) + len(proof))
+                verified[client_id] = is_valid
+                if is_valid and not args.manifest:
+                    self._fold_update(client_id, update_states[client_id], round_train_stats[client_id])
+                print(f"Client {client_id} | "
+                      f"包含证明大小: {len(proof)} bytes | "
+                      f"验证结果: {'成功' if is_valid else '失败'}")
+            print(f"批量签名 | 客户端数: {len(batch_digests)} | "
+                  f"签名时间: {sign_time_ms:.2f}ms | "
+                  f"验证时间: {verify_time_ms:.2f}ms | "
+                  f"共享签名大小: {sign_size} bytes")
+
+        if round_manifests:
+            self._verify_manifests(trained_clients, trained_models, round_manifests, verified, round_train_stats)
+
+        record = {'sign_times_ms': round_sign_times_ms, 'sign_sizes': round_sign_sizes,
+                  'verify_times_ms': round_verify_times_ms, 'update_bytes': round_update_bytes,
+                  'train_stats': round_train_stats}
+        return self._finish_round(round_idx, record, selected_clients, {
+            'transport_bytes': sum(round_transport_bytes),
+            'avg_transport_latency_ms': np.mean(round_transport_latency_ms) if round_transport_latency_ms else 0,
+            'missing_clients': missing_clients
+        })
+
+    def _background_clients(self) -> set:
+        """仍在后台训练、模型由训练任务持有的客户端；轮次收尾时不覆盖也不验证它们的模型"""
+        return set()
+
+    def _print_round_extra(self, round_stat):
+        """各服务器模式在本轮SPHINCS+统计后追加的输出"""
+        if self.connections is not None:
+            print(f"传输字节数: {round_stat['transport_bytes']} | "
+                  f"平均传输延迟: {round_stat['avg_transport_latency_ms']:.2f}ms")
+        if 'round_time_ms' in round_stat:
+            print(f"本轮耗时: {round_stat['round_time_ms']:.2f}ms")
+
+    def _finish_round(self, round_idx, record, val_clients, extra_stats=None) -> float:
+        """各服务器模式共用的轮次收尾：累计签名统计、写入round_stats并打印，聚合出新的全局模型，
+        把它下发给不在后台训练的客户端，再验证val_clients，返回平均验证准确率
+
+        record包含本轮的sign_times_ms、sign_sizes、verify_times_ms、train_stats和可选的update_bytes，
+        extra_stats为各模式特有的统计项（可覆盖通用项）
+        """
+        self.sign_stats['times_ms'].extend(record['sign_times_ms'])
+        self.sign_stats['sizes'].extend(record['sign_sizes'])
+        self.sign_stats['verify_times_ms'].extend(record['verify_times_ms'])
+
+        train_stats = record['train_stats']
+        update_bytes = record.get('update_bytes')
         round_stat = {
             'round': round_idx + 1,
-            'avg_sign_time_ms': np.mean(round_sign_times_ms) if round_sign_times_ms else 0,
-            'avg_verify_time_ms': np.mean(round_verify_times_ms) if round_verify_times_ms else 0,
-            'avg_sign_size': np.mean(round_sign_sizes) if round_sign_sizes else 0
+            'avg_sign_time_ms': np.mean(record['sign_times_ms']) if record['sign_times_ms'] else 0,
+            'avg_verify_time_ms': np.mean(record['verify_times_ms']) if record['verify_times_ms'] else 0,
+            'avg_sign_size': np.mean(record['sign_sizes']) if record['sign_sizes'] else 0,
+            'avg_train_time_ms': np.mean([stats['train_time_ms'] for stats in train_stats.values()])
+            if train_stats else 0,
+            'avg_samples_per_sec': np.mean([stats['samples_per_sec'] for stats in train_stats.values()])
+            if train_stats else 0,
+            'codec': args.update_codec,
+            'avg_update_bytes': np.mean(update_bytes) if update_bytes else 0
         }
+        round_stat.update(extra_stats or {})
         self.round_stats.append(round_stat)
 
         print(f"\nRound {round_idx + 1} SPHINCS+ 统计:")
         print(f"平均签名时间: {round_stat['avg_sign_time_ms']:.2f}ms")
         print(f"平均验证时间: {round_stat['avg_verify_time_ms']:.2f}ms")
         print(f"平均签名大小: {round_stat['avg_sign_size']:.2f} bytes")
-
-        global_weights = self.aggregate(trained_models)
-        self.global_base.load_state_dict(global_weights)
-
-        for model in self.client_models:
-            model.base_layers.load_state_dict(self.global_base.state_dict())
-
-        val_accs = []
-        for client_id in selected_clients:
-            acc = validate(args, self.client_models[client_id], client_id)
-            val_accs.append(acc)
+        print(f"平均训练吞吐: {round_stat['avg_samples_per_sec']:.0f} samples/s")
+        if self.codec is not None:
+            print(f"更新编码: {args.update_codec} | 平均更新大小: {round_stat['avg_update_bytes']:.0f} bytes "
+                  f"(原始 {self.aggregator.size * 4} bytes)")
+        self._print_round_extra(round_stat)
+
+        if self.aggregator.count:
+            with self.tracer.span("aggregate"):
+                self.global_base.load_state_dict(self.aggregator.result())
+        else:
+            print(f"Round {round_idx + 1}: 没有通过验证的客户端更新，保留上一轮全局模型")
+
+        background = self._background_clients()
+        for client_id, model in enumerate(self.client_models):
+            if client_id not in background:
+                model.base_layers.load_state_dict(self.global_base.state_dict())
+
+        val_clients = [client_id for client_id in val_clients if client_id not in background]
+        if not val_clients:
+            return 0.0
+        with self.tracer.span("validate", clients=len(val_clients)):
+            if args.batched_val:
+                val_accs = validate_many(args, self.global_base,
+                                         [self.client_models[client_id] for client_id in val_clients], val_clients)
+            else:
+                val_accs = [validate(args, self.client_models[client_id], client_id) for client_id in val_clients]
+        for client_id, acc in zip(val_clients, val_accs):
             print(f"Client {client_id} Val Acc: {acc:.2f}%")
 
         avg_acc = sum(val_accs) / len(val_accs)
+        round_stat['avg_val_acc'] = avg_acc
         print(f"Round {round_idx + 1} Average Val Acc: {avg_acc:.2f}%")
         return avg_acc
 
@@ -139,6 +498,17 @@ class FedPer:
         print(f"最小签名时间: {np.min(self.sign_stats['times_ms']):.2f}ms")
         print(f"最大签名大小: {np.max(self.sign_stats['sizes'])} bytes")
         print(f"最小签名大小: {np.min(self.sign_stats['sizes'])} bytes")
+        if self.connections is not None:
+            # 更新由训练线程/进程各自的连接发送，发送侧统计取自各轮记录
+            print(f"传输消息数: {self.listener.messages} | "
+                  f"发送字节数: {sum(stat.get('transport_bytes', 0) for stat in self.round_stats)} | "
+                  f"接收字节数: {self.listener.bytes_received} | "
+                  f"平均往返延迟: {np.mean(self.transport_latencies_ms):.2f}ms")
+        update_bytes = [stat['avg_update_bytes'] for stat in self.round_stats]
+        print(f"更新编码: {args.update_codec} | "
+              f"平均更新大小: {np.mean(update_bytes):.0f} bytes | "
+              f"压缩比: {self.aggregator.size * 4 / max(np.mean(update_bytes), 1):.1f}x | "
+              f"最终验证准确率: {self.round_stats[-1].get('avg_val_acc', 0):.2f}%")
         print("=" * 50 + "\n")
 
         print("每轮详细统计:")
@@ -151,11 +521,40 @@ class FedPer:
 
     def run(self):
         if self.signer:
-            print(f"\nSPHINCS+初始化完成 | 安全级别: {args.sphincs_security} | "
-                  f"密钥生成时间: {self.signer.keygen_time_ms:.2f}ms")
+            key_source = "密钥加载时间" if self.signer.key_loaded else "密钥生成时间"
+            params = self.signer.sphincs.params
+            print(f"\nSPHINCS+初始化完成 | 参数集: {params.name} | 安全级别: {params.security_level} | "
+                  f"{key_source}: {self.signer.keygen_time_ms:.2f}ms")
+
+        try:
+            self._run_rounds()
+        finally:
+            self._close()
+        self._print_final_stats()
 
-        for r in range(args.r):
+    def _run_rounds(self):
+        for r in range(self.start_round, args.r):
             print(f"\n=== Round {r + 1}/{args.r} ===")
-            self.server_round(r)
-        self._print_final_stats()
+            with self.tracer.span("round"):
+                self.server_round(r)
+            self._finish_round_metrics(r)
+            self._maybe_checkpoint(r)
+
+    def _finish_round_metrics(self, round_idx):
+        """把本轮各阶段耗时汇总写入round_stats并导出"""
+        if not self.tracer.enabled:
+            return
+        self.round_stats[-1]['phases'] = self.tracer.round_summary(round_idx)
+        self.tracer.flush()
+
+    def _close(self):
+        if self.checkpointer is not None:
+            self.checkpointer.close()
+        self.tracer.close()
+        self.executor.close()
+        if self.signer:
+            self.signer.close()
+        if self.connections is not None:
+            self.connections.close()
+            self.listener.close()
 
@@ -2,6 +2,7 @@ from sphincs_params import SphincsParams
 from fors import FORS
 from wots import WOTS
 from hypertree import Hypertree
+from merkle import MerkleTree, root_from_proof
 import os
 import struct
 import hashlib
@@ -10,12 +11,16 @@ import torch
 
 
 class SPHINCSPlus:
-    def __init__(self, security_level=128):
+    def __init__(self, security_level=128, ht_cache_size=64, workers=1, backend="hashlib", fors_cache_mb=32):
+        """backend选择哈希实现：'hashlib'逐条计算，'numpy'多路并行推进WOTS+链/FORS叶子/子树叶子；
+        fors_cache_mb为FORS树缓存的内存上限(MB)
+        """
         self.params = SphincsParams(security_level)
         self.n = self.params.n
-        self.fors = FORS(self.params)
-        self.wots = WOTS(self.params)
-        self.ht = Hypertree(self.params)
+        self.backend = backend
+        self.fors = FORS(self.params, backend, cache_bytes=int(fors_cache_mb * 2 ** 20))
+        self.wots = WOTS(self.params, backend)
+        self.ht = Hypertree(self.params, cache_size=ht_cache_size, workers=workers, backend=backend)
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
     def keygen(self) -> tuple[bytes, bytes]:
@@ -23,14 +28,76 @@ class SPHINCSPlus:
         sk_seed = os.urandom(self.n)
         pk_seed = os.urandom(self.n)
 
-        root = self.ht.gen_root(sk_seed, pk_seed, self.params.d, 0)
+        root = self.ht.gen_root(sk_seed, pk_seed)
 
         public_key = pk_seed + root
         private_key = sk_seed + public_key
         return public_key, private_key
 
-    def sign(self, message: bytes, private_key: bytes) -> bytes:
+    def close(self):
+        """释放超树生成使用的进程池"""
+        self.ht.close()
+
+    def export_nodes(self, public_key: bytes) -> list:
+        """导出密钥对应的缓存树节点（顶层子树叶子）"""
+        levels = self.ht.subtree_cache.get((public_key[:self.n], self.params.d - 1, 0))
+        return list(levels[0]) if levels else []
+
+    def import_nodes(self, public_key: bytes, nodes) -> bool:
+        """导入缓存树节点，nodes可为内存映射的惰性序列
+
+        先由这些叶子重建顶层子树的根并与公钥中的根比较；数量不符或根不一致（写入中断、其他密钥留下的旧文件、
+        位损坏）时不导入并返回False，避免之后的签名全部无法验证
+        """
+        if nodes is None or len(nodes) != 2 ** (self.params.h // self.params.d):
+            return False
+        pk_seed = public_key[:self.n]
+        levels = self.ht._mt_levels(list(nodes), pk_seed, 0, self.params.d - 1)
+        if levels[-1][0] != public_key[self.n:]:
+            return False
+        self.ht.leaf_cache[(pk_seed, self.params.d - 1, 0)] = levels[0]
+        return True
+
+    def _h_msg(self, rand: bytes, pk_seed: bytes, root: bytes, digest: bytes) -> tuple[bytes, int, int]:
+        """H_msg(R, PK.seed, root, M)：同时导出FORS消息、子树索引和叶子索引，签名位置由消息决定"""
+        h_prime = self.params.h // self.params.d
+        tree_bits = (self.params.d - 1) * h_prime
+        md_len = (self.params.k * self.params.a + 7) // 8
+        tree_len = (tree_bits + 7) // 8
+        leaf_len = (h_prime + 7) // 8
+
+        seed = hashlib.sha256(rand + pk_seed + root + digest).digest()
+        out = b""
+        counter = 0
+        while len(out) < md_len + tree_len + leaf_len:
+            out += hashlib.sha256(rand + pk_seed + seed + struct.pack(">I", counter)).digest()
+            counter += 1
+
+        md = out[:md_len]
+        tree_idx = int.from_bytes(out[md_len:md_len + tree_len], "big") & ((1 << tree_bits) - 1)
+        leaf_idx = int.from_bytes(out[md_len + tree_len:md_len + tree_len + leaf_len], "big") & ((1 << h_prime) - 1)
+        return md, tree_idx, leaf_idx
+
+    def signature_size(self) -> int:
+        return self.params.signature_size()
+
+    @staticmethod
+    def digest(message) -> bytes:
+        """计算消息摘要，message可以是bytes或一组缓冲区（如张量的memoryview），逐块增量哈希"""
+        h = hashlib.sha256()
+        if isinstance(message, (bytes, bytearray, memoryview)):
+            h.update(message)
+        else:
+            for buf in message:
+                h.update(buf)
+        return h.digest()
+
+    def sign(self, message, private_key: bytes) -> bytes:
         """生成签名"""
+        return self.sign_digest(self.digest(message), private_key)
+
+    def sign_digest(self, digest: bytes, private_key: bytes) -> bytes:
+        """对预先计算好的消息摘要生成签名"""
 
         if len(private_key) < 3 * self.n:
             raise ValueError("无效私钥长度")
@@ -40,55 +107,68 @@ class SPHINCSPlus:
         root = private_key[2 * self.n:3 * self.n]
 
         rand = os.urandom(self.n)
-        msg_hash = hashlib.sha256(rand + root + message).digest()
-
-        idx = struct.unpack(">I", msg_hash[:4])[0]
-        tree_idx = idx % (2 ** (self.params.h // self.params.d))
-        leaf_idx = (idx >> (self.params.h // self.params.d)) % (2 ** (self.params.h // self.params.d))
+        fors_md, tree_idx, leaf_idx = self._h_msg(rand, pk_seed, root, digest)
 
-        fors_start = self.params.k * self.params.a // 8
-        fors_md = msg_hash[self.n // 2: self.n // 2 + fors_start]
-        fors_sig = self.fors.sign(fors_md, sk_seed, pk_seed, tree_idx, leaf_idx)
-
-        fors_pk = self.fors.pk_from_sig(fors_sig, fors_md, pk_seed, tree_idx, leaf_idx)
-
-        wots_sig = self.wots.sign(fors_pk, sk_seed, pk_seed, tree_idx, leaf_idx)
+        fors_sig, fors_pk = self.fors.sign_with_pk(fors_md, sk_seed, pk_seed, tree_idx, leaf_idx)
+        ht_sig = self.ht.sign(fors_pk, sk_seed, pk_seed, tree_idx, leaf_idx)
 
         return (rand +
-                struct.pack(">I", tree_idx) +
-                struct.pack(">I", leaf_idx) +
+                struct.pack(">QI", tree_idx, leaf_idx) +
                 fors_sig +
-                wots_sig)
+                ht_sig)
 
-    def verify(self, message: bytes, signature: bytes, public_key: bytes) -> bool:
+    def verify(self, message, signature: bytes, public_key: bytes) -> bool:
         """验证签名"""
+        return self.verify_digest(self.digest(message), signature, public_key)
+
+    def verify_digest(self, digest: bytes, signature: bytes, public_key: bytes) -> bool:
+        """对预先计算好的消息摘要验证签名"""
         if len(public_key) != 2 * self.n:
             return False
 
-        if len(signature) < 3 * self.n:
+        if len(signature) != self.signature_size():
             return False
 
         pk_seed = public_key[:self.n]
         root = public_key[self.n:]
 
         rand = signature[:self.n]
-        tree_idx = struct.unpack(">I", signature[self.n:self.n + 4])[0]
-        leaf_idx = struct.unpack(">I", signature[self.n + 4:self.n + 8])[0]
+        tree_idx, leaf_idx = struct.unpack(">QI", signature[self.n:self.n + 12])
 
-        fors_sig_len = self.params.k * self.n
-        fors_sig = signature[self.n + 8:self.n + 8 + fors_sig_len]
-        wots_sig = signature[self.n + 8 + fors_sig_len:]
+        fors_sig_len = self.fors.signature_size()
+        fors_sig = signature[self.n + 12:self.n + 12 + fors_sig_len]
+        ht_sig = signature[self.n + 12 + fors_sig_len:]
 
-        msg_hash = hashlib.sha256(rand + root + message).digest()
+        fors_md, expected_tree, expected_leaf = self._h_msg(rand, pk_seed, root, digest)
+        if (tree_idx, leaf_idx) != (expected_tree, expected_leaf):
+            return False
 
-        fors_start = self.params.k * self.params.a // 8
-        fors_md = msg_hash[self.n // 2: self.n // 2 + fors_start]
         fors_pk = self.fors.pk_from_sig(fors_sig, fors_md, pk_seed, tree_idx, leaf_idx)
 
-        wots_pk = self.wots.pk_from_sig(wots_sig, fors_pk, pk_seed, tree_idx, leaf_idx)
-
-        leaf = self.ht.compute_leaf(wots_pk, pk_seed, tree_idx, leaf_idx)
-
-        auth_path = self.ht.generate_auth_path(leaf_idx, tree_idx, 2 ** (self.params.h // self.params.d), [leaf],
-                                               pk_seed)
-        return self.ht.verify_auth_path(leaf, auth_path, root, leaf_idx, pk_seed, tree_idx)
+        return self.ht.verify(fors_pk, ht_sig, pk_seed, tree_idx, leaf_idx, root)
+
+    def sign_batch(self, messages: list, private_key: bytes) -> list:
+        """对一批消息构建Merkle树，只签名根，返回每条消息的(共享签名, 包含证明)"""
+        return self.sign_batch_digests([self.digest(m) for m in messages], private_key)
+
+    def sign_batch_digests(self, digests: list, private_key: bytes) -> list:
+        tree = MerkleTree(digests)
+        signature = self.sign_digest(tree.root, private_key)
+        return [(signature, tree.proof(i)) for i in range(len(digests))]
+
+    def verify_batch(self, messages: list, handles: list, public_key: bytes) -> list:
+        """验证批量签名，每个不同的(根, 签名)只做一次SPHINCS+验证"""
+        return self.verify_batch_digests([self.digest(m) for m in messages], handles, public_key)
+
+    def verify_batch_digests(self, digests: list, handles: list, public_key: bytes) -> list:
+        verified = {}
+        results = []
+        for digest, (signature, proof) in zip(digests, handles):
+            root = root_from_proof(digest, proof)
+            if root is None:
+                results.append(False)
+                continue
+            if (root, signature) not in verified:
+                verified[(root, signature)] = self.verify_digest(root, signature, public_key)
+            results.append(verified[(root, signature)])
+        return results
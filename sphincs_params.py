@@ -1,31 +1,63 @@
 import math
 
+"""具名参数集：名称 -> (安全级别, n, h, d, k, t, w)
+
+sha2-*s/f为SPHINCS+第三轮规范的small/fast参数（n随安全级别取16/24/32字节），
+fedsign-*为本项目原有的三组参数，按整数安全级别构造时仍使用它们；
+其安全级别只是名义值（例如fedsign-128的FORS只有k*a=16比特），--sphincs_params auto不会选择它们
+"""
+PARAMETER_SETS = {
+    "fedsign-128": (128, 32, 12, 2, 4, 16, 4),
+    "fedsign-192": (192, 32, 60, 8, 24, 256, 16),
+    "fedsign-256": (256, 32, 60, 12, 30, 256, 16),
+    "sha2-128s": (128, 16, 63, 7, 14, 4096, 16),
+    "sha2-128f": (128, 16, 66, 22, 33, 64, 16),
+    "sha2-192s": (192, 24, 63, 7, 17, 16384, 16),
+    "sha2-192f": (192, 24, 66, 22, 33, 256, 16),
+    "sha2-256s": (256, 32, 64, 8, 22, 16384, 16),
+    "sha2-256f": (256, 32, 68, 17, 35, 512, 16),
+}
+
+LEGACY_SETS = {128: "fedsign-128", 192: "fedsign-192", 256: "fedsign-256"}
+
 
 class SphincsParams:
-    def __init__(self, security_level: int = 128):
-        self.n = 32
-        if security_level == 128:
-            self.h = 12
-            self.d = 2
-            self.k = 4
-            """FORS树叶子节点数"""
-            self.t = 16
-            self.w = 4
-        elif security_level == 192:
-            self.h = 60
-            self.d = 8
-            self.k = 24
-            self.t = 256
-            self.w = 16
-        else:             # security_level == 256
-            self.h = 60
-            self.d = 12
-            self.k = 30
-            self.t = 256
-            self.w = 16
+    def __init__(self, security_level=128):
+        """security_level为整数安全级别（对应fedsign-*参数，其他值按256处理）或PARAMETER_SETS中的名称"""
+        if isinstance(security_level, str):
+            if security_level not in PARAMETER_SETS:
+                raise ValueError(f"未知的SPHINCS+参数集: {security_level}")
+            self.name = security_level
+        else:
+            self.name = LEGACY_SETS.get(security_level, "fedsign-256")
+        self.security_level, self.n, self.h, self.d, self.k, self.t, self.w = PARAMETER_SETS[self.name]
+        """FORS树叶子节点数为t"""
 
         self.len1 = math.ceil((8 * self.n) / math.log2(self.w))
         self.len2 = math.floor(math.log2(self.len1 * (self.w - 1)) / math.log2(self.w)) + 1
         self.len = self.len1 + self.len2
 
         self.a = math.floor(math.log2(self.t))
+        self.h_prime = self.h // self.d
+
+    def signature_size(self) -> int:
+        """本实现的签名字节数：随机数 | 索引(12) | FORS(k个私钥元素 + 认证路径) | d层(WOTS+签名 + 认证路径)"""
+        return self.n + 12 + self.k * (self.a + 1) * self.n + self.d * (self.len + self.h_prime) * self.n
+
+    def hash_cost(self) -> dict:
+        """按可调哈希调用次数估算的开销模型
+
+        叶子 = len个PRF + len*(w-1)步链 + T_len压缩 + 叶子哈希；子树 = 2^h'个叶子 + 2^h'-1个内部节点。
+        签名按稳态估算：顶层子树已缓存，其余d-1层子树随机命中几乎总需重建，WOTS+链平均走(w-1)/2步；
+        FORS每次签名生成k棵树（k*t个PRF和叶子、k*(t-1)个内部节点）再为所选叶子重算k个PRF
+        """
+        leaf = self.len * self.w + 2
+        subtree = 2 ** self.h_prime * leaf + 2 ** self.h_prime - 1
+        avg_chain = self.len * (self.w - 1) / 2
+        fors_sign = self.k * (3 * self.t - 1) + self.k + 1
+        fors_verify = self.k * (self.a + 1) + 1
+        return {
+            'keygen': subtree,
+            'sign': int((self.d - 1) * subtree + self.d * (self.len + avg_chain) + fors_sign),
+            'verify': int(self.d * (avg_chain + 2 + self.h_prime) + fors_verify)
+        }
@@ -0,0 +1,19 @@
+import torch
+
+
+def tensor_buffer(value: torch.Tensor) -> memoryview:
+    """返回张量的字节视图；CPU上的连续张量不发生拷贝"""
+    value = value.detach()
+    if value.device.type != "cpu":
+        value = value.cpu()
+    if not value.numel():
+        return memoryview(b"")
+    if not value.is_contiguous():
+        value = value.contiguous()
+    return memoryview(value.numpy()).cast("B")
+
+
+def state_buffers(state_dict: dict):
+    """按state_dict顺序逐个产出张量的字节视图，拼接结果等同于逐个tobytes()"""
+    for value in state_dict.values():
+        yield tensor_buffer(value)
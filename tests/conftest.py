@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 各模块位于仓库根目录而不是包内，测试从任意目录运行时都能直接导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
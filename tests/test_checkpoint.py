@@ -0,0 +1,94 @@
+import random
+import pytest
+import numpy as np
+import torch
+from checkpoint import Checkpoint, CheckpointWriter, optimizer_entries, rng_state, snapshot, write_checkpoint
+
+
+def test_tensor_and_meta_round_trip(tmp_path):
+    path = str(tmp_path / "nested" / "fedper.ckpt")
+    tensors = {'global/weight': torch.randn(5, 3), 'global/bias': torch.arange(7, dtype=torch.int64),
+               'global/empty': torch.empty(0, 4), 'global/flag': torch.tensor([True, False])}
+    meta = {'round': 3, 'clients': [0, 1, 2]}
+    write_checkpoint(path, tensors, meta)
+
+    checkpoint = Checkpoint(path)
+    assert checkpoint.meta == meta
+    assert 'global/weight' in checkpoint and 'global/missing' not in checkpoint
+    restored = checkpoint.state_dict('global')
+    assert set(restored) == {'weight', 'bias', 'empty', 'flag'}
+    for name, value in tensors.items():
+        assert restored[name.split("/", 1)[1]].dtype == value.dtype
+        assert torch.equal(restored[name.split("/", 1)[1]], value)
+    checkpoint.close()
+
+
+def test_optimizer_state_round_trip(tmp_path):
+    model = torch.nn.Linear(4, 2)
+    optimizer = torch.optim.Adam(model.parameters(), lr=0.01)
+    for _ in range(2):
+        optimizer.zero_grad()
+        model(torch.randn(8, 4)).sum().backward()
+        optimizer.step()
+
+    tensors, extra = optimizer_entries('optimizer/0', optimizer.state_dict())
+    write_checkpoint(str(tmp_path / "opt.ckpt"), tensors, {'optimizer': extra})
+    checkpoint = Checkpoint(str(tmp_path / "opt.ckpt"))
+    state = checkpoint.optimizer_state('optimizer/0', checkpoint.meta['optimizer'])
+
+    resumed = torch.optim.Adam(torch.nn.Linear(4, 2).parameters(), lr=0.5)
+    resumed.load_state_dict(state)
+    expected = optimizer.state_dict()
+    assert resumed.state_dict()['param_groups'] == expected['param_groups']
+    for param_idx, param_state in expected['state'].items():
+        for key, value in param_state.items():
+            restored = resumed.state_dict()['state'][param_idx][key]
+            assert torch.equal(torch.as_tensor(restored), torch.as_tensor(value))
+    checkpoint.close()
+
+
+def test_rng_restore_reproduces_draws(tmp_path):
+    tensors, meta = rng_state()
+    expected = (random.random(), np.random.rand(3).tolist(), torch.rand(3))
+    write_checkpoint(str(tmp_path / "rng.ckpt"), tensors, {'rng': meta})
+
+    random.random(), np.random.rand(5), torch.rand(5)
+    checkpoint = Checkpoint(str(tmp_path / "rng.ckpt"))
+    checkpoint.restore_rng()
+    assert random.random() == expected[0]
+    assert np.random.rand(3).tolist() == expected[1]
+    assert torch.equal(torch.rand(3), expected[2])
+    checkpoint.close()
+
+
+def test_background_writer_saves_snapshot(tmp_path):
+    path = str(tmp_path / "bg.ckpt")
+    weight = torch.ones(64)
+    writer = CheckpointWriter(path)
+    writer.save({'global/weight': snapshot(weight)}, {'round': 1})
+    # 后台写入期间继续修改原张量，不影响已保存的快照
+    weight.add_(1)
+    writer.wait()
+    writer.save({'global/weight': snapshot(weight)}, {'round': 2})
+    writer.close()
+    assert len(writer.write_times_ms) == 2
+
+    checkpoint = Checkpoint(path)
+    assert checkpoint.meta['round'] == 2
+    assert torch.equal(checkpoint.tensor('global/weight'), torch.full((64,), 2.0))
+    checkpoint.close()
+
+
+def test_snapshot_is_independent_copy():
+    value = torch.randn(4, 4).t()
+    copy = snapshot(value)
+    assert copy.is_contiguous()
+    value.zero_()
+    assert torch.count_nonzero(copy) > 0
+
+
+def test_invalid_file_rejected(tmp_path):
+    path = tmp_path / "bad.ckpt"
+    path.write_bytes(b"NOPE" + bytes(60))
+    with pytest.raises(ValueError):
+        Checkpoint(str(path))
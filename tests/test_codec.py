@@ -0,0 +1,79 @@
+import pytest
+import torch
+from aggregator import FlatAggregator
+from codec import UpdateCodec, encoded_bytes
+
+
+def _states():
+    generator = torch.Generator().manual_seed(0)
+    reference = {'0.weight': torch.randn(16, 8, generator=generator), '0.bias': torch.randn(16, generator=generator)}
+    client = {key: value + 0.01 * torch.randn(value.shape, generator=generator) for key, value in reference.items()}
+    return reference, client
+
+
+def _decode(name: str, topk_ratio: float = 0.01) -> tuple:
+    """编码client相对reference的增量，再解码进一个新的聚合器，返回(编码结果, 聚合结果, client)"""
+    reference, client = _states()
+    aggregator = FlatAggregator(reference, "cpu")
+    codec = UpdateCodec(name, aggregator, topk_ratio)
+    flat_reference = aggregator.flatten(reference)
+    encoded = codec.encode(client, flat_reference)
+    codec.decode_into(encoded, flat_reference)
+    return encoded, aggregator.result(), client
+
+
+def test_fp16_round_trip():
+    encoded, result, client = _decode("fp16")
+    assert encoded_bytes(encoded) == sum(value.numel() for value in client.values()) * 2
+    for key, value in client.items():
+        torch.testing.assert_close(result[key], value, atol=1e-4, rtol=0)
+
+
+def test_int8_round_trip_within_one_step_per_tensor():
+    encoded, result, client = _decode("int8")
+    reference, _ = _states()
+    assert encoded['quantized'].dtype == torch.int8
+    for (key, value), scale in zip(client.items(), encoded['scales']):
+        assert torch.allclose(scale, (value - reference[key]).abs().max() / 127)
+        assert (result[key] - value).abs().max() <= scale / 2 + 1e-6
+
+
+def test_topk_with_full_ratio_is_exact_and_partial_keeps_largest():
+    _, result, client = _decode("topk", topk_ratio=1.0)
+    for key, value in client.items():
+        torch.testing.assert_close(result[key], value)
+
+    encoded, result, client = _decode("topk", topk_ratio=0.1)
+    reference, _ = _states()
+    aggregator = FlatAggregator(reference, "cpu")
+    delta = aggregator.flatten(client) - aggregator.flatten(reference)
+    kept = encoded['indices'].long()
+    assert len(kept) == int(aggregator.size * 0.1)
+    assert delta[kept].abs().min() >= delta.abs().sort(descending=True).values[len(kept) - 1]
+    applied = aggregator.flatten(result) - aggregator.flatten(reference)
+    torch.testing.assert_close(applied[kept], delta[kept])
+    mask = torch.ones(aggregator.size, dtype=torch.bool)
+    mask[kept] = False
+    assert torch.count_nonzero(applied[mask].abs() > 1e-6) == 0
+
+
+def test_weighted_decode_matches_plain_aggregation():
+    reference, client = _states()
+    plain = FlatAggregator(reference, "cpu")
+    plain.add(reference, 1.0)
+    plain.add(client, 3.0)
+
+    aggregator = FlatAggregator(reference, "cpu")
+    codec = UpdateCodec("topk", aggregator, topk_ratio=1.0)
+    flat_reference = aggregator.flatten(reference)
+    aggregator.add(reference, 1.0)
+    codec.decode_into(codec.encode(client, flat_reference), flat_reference, 3.0)
+    for key, value in plain.result().items():
+        torch.testing.assert_close(aggregator.result()[key], value)
+
+
+@pytest.mark.parametrize("name", ["none", "zstd"])
+def test_unknown_codec_rejected(name):
+    reference, _ = _states()
+    with pytest.raises(ValueError):
+        UpdateCodec(name, FlatAggregator(reference, "cpu"))
@@ -0,0 +1,50 @@
+import hashlib
+import pytest
+from merkle import MerkleTree, root_from_proof
+from sphincs import SPHINCSPlus
+
+
+def _digests(count: int) -> list:
+    return [hashlib.sha256(bytes([i])).digest() for i in range(count)]
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 5, 8, 9])
+def test_every_proof_recovers_the_root(count):
+    digests = _digests(count)
+    tree = MerkleTree(digests)
+    for i, digest in enumerate(digests):
+        assert root_from_proof(digest, tree.proof(i)) == tree.root
+
+
+def test_proof_rejects_other_leaf_and_tampering():
+    digests = _digests(5)
+    tree = MerkleTree(digests)
+    proof = tree.proof(2)
+    assert root_from_proof(digests[3], proof) != tree.root
+
+    tampered = bytearray(proof)
+    tampered[-1] ^= 1
+    assert root_from_proof(digests[2], bytes(tampered)) != tree.root
+    assert root_from_proof(digests[2], proof[:-32]) is None
+    assert root_from_proof(digests[2], proof + bytes(32)) is None
+
+
+def test_root_binds_leaf_count():
+    """只有一个叶子的树与把同一摘要放在更大树中的证明不能互换"""
+    digests = _digests(4)
+    assert MerkleTree(digests[:1]).root != MerkleTree(digests).root
+    assert root_from_proof(digests[0], MerkleTree(digests).proof(0)) != MerkleTree(digests[:1]).root
+
+
+def test_batch_sign_verify_round_trip():
+    sphincs = SPHINCSPlus("fedsign-128")
+    public_key, private_key = sphincs.keygen()
+    messages = [f"client {i}".encode() for i in range(5)]
+    handles = sphincs.sign_batch(messages, private_key)
+
+    assert len({signature for signature, _ in handles}) == 1
+    assert sphincs.verify_batch(messages, handles, public_key) == [True] * len(messages)
+
+    swapped = [messages[1], messages[0]] + messages[2:]
+    assert sphincs.verify_batch(swapped, handles, public_key) == [False, False, True, True, True]
+    sphincs.close()
@@ -0,0 +1,69 @@
+import struct
+import pytest
+from sphincs import SPHINCSPlus
+from sphincs_params import PARAMETER_SETS
+
+MESSAGE = b"client update"
+
+
+@pytest.fixture(scope="module", params=sorted(PARAMETER_SETS))
+def signed(request):
+    """每个参数集只生成一次密钥并签名一次（s参数集的签名较慢）"""
+    sphincs = SPHINCSPlus(request.param)
+    public_key, private_key = sphincs.keygen()
+    signature = sphincs.sign(MESSAGE, private_key)
+    yield sphincs, public_key, signature
+    sphincs.close()
+
+
+def test_sign_verify_round_trip(signed):
+    sphincs, public_key, signature = signed
+    assert len(signature) == sphincs.signature_size()
+    assert sphincs.verify(MESSAGE, signature, public_key)
+
+
+def test_verify_rejects_other_message(signed):
+    sphincs, public_key, signature = signed
+    assert not sphincs.verify(b"other update", signature, public_key)
+
+
+def test_verify_rejects_tampered_auth_path(signed):
+    sphincs, public_key, signature = signed
+    tampered = bytearray(signature)
+    tampered[-1] ^= 1
+    assert not sphincs.verify(MESSAGE, bytes(tampered), public_key)
+
+
+def test_verify_rejects_moved_leaf_index(signed):
+    sphincs, public_key, signature = signed
+    n = sphincs.n
+    tree_idx, leaf_idx = struct.unpack(">QI", signature[n:n + 12])
+    moved = signature[:n] + struct.pack(">QI", tree_idx, leaf_idx ^ 1) + signature[n + 12:]
+    assert not sphincs.verify(MESSAGE, moved, public_key)
+
+
+def test_position_is_derived_from_message(signed):
+    sphincs, public_key, signature = signed
+    n = sphincs.n
+    rand, pk_seed, root = signature[:n], public_key[:n], public_key[n:]
+    _, tree_idx, leaf_idx = sphincs._h_msg(rand, pk_seed, root, sphincs.digest(MESSAGE))
+    assert struct.unpack(">QI", signature[n:n + 12]) == (tree_idx, leaf_idx)
+    # 复用诚实签名的R签其他消息时位置随消息变化，伪造者不能沿用该签名的超树路径
+    positions = {sphincs._h_msg(rand, pk_seed, root, sphincs.digest(bytes([i])))[1:] for i in range(8)}
+    assert len(positions) > 1
+
+
+def test_exported_nodes_import_and_reject_corruption():
+    sphincs = SPHINCSPlus("fedsign-128")
+    public_key, private_key = sphincs.keygen()
+    nodes = sphincs.export_nodes(public_key)
+    sphincs.close()
+
+    fresh = SPHINCSPlus("fedsign-128")
+    corrupted = list(nodes)
+    corrupted[3] = bytes([corrupted[3][0] ^ 1]) + corrupted[3][1:]
+    assert not fresh.import_nodes(public_key, corrupted)
+    assert not fresh.import_nodes(public_key, nodes[:-1])
+    assert fresh.import_nodes(public_key, nodes)
+    assert fresh.verify(MESSAGE, fresh.sign(MESSAGE, private_key), public_key)
+    fresh.close()
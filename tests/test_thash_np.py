@@ -0,0 +1,73 @@
+import os
+import hashlib
+import numpy as np
+import pytest
+from fors import FORS
+from hypertree import Hypertree
+from sphincs import SPHINCSPlus
+from sphincs_params import SphincsParams
+from thash import ADRS, get_thash
+from thash_np import MIN_LANES, BatchTweakableHash, adrs_rows, set_rows_field
+
+
+def _reference(pk_seed: bytes, suffix: bytes) -> bytes:
+    prefix = pk_seed + bytes(64 - len(pk_seed) % 64)
+    return hashlib.sha256(prefix + suffix).digest()[:len(pk_seed)]
+
+
+@pytest.mark.parametrize("n", [16, 24, 32])
+@pytest.mark.parametrize("count", [MIN_LANES - 1, MIN_LANES])
+@pytest.mark.parametrize("length", [1, 48, 55, 56, 64, 96, 119, 120, 128])
+def test_hash_many_matches_hashlib(n, count, length):
+    """覆盖hashlib回退与向量化两条路径、单/双填充分组以及长度恰为64整数倍时的常量填充分组"""
+    pk_seed = os.urandom(n)
+    suffixes = np.frombuffer(os.urandom(count * length), dtype=np.uint8).reshape(count, length)
+    out = BatchTweakableHash(pk_seed).hash_many(suffixes)
+    assert out.shape == (count, n)
+    assert [bytes(row) for row in out] == [_reference(pk_seed, suffix.tobytes()) for suffix in suffixes]
+
+
+def test_chain_many_matches_tweakable_hash():
+    pk_seed = os.urandom(32)
+    count = MIN_LANES + 7
+    nodes = np.frombuffer(os.urandom(count * 32), dtype=np.uint8).reshape(count, 32)
+    rows = set_rows_field(adrs_rows(ADRS().set_layer(1).set_tree(5), count), 24, range(count))
+    rng = np.random.default_rng(0)
+    starts = rng.integers(0, 8, count)
+    steps = rng.integers(0, 8, count)
+
+    out = BatchTweakableHash(pk_seed).chain_many(nodes, rows, starts, steps)
+    th = get_thash(pk_seed)
+    for i in range(count):
+        adrs = ADRS(bytes(rows[i]))
+        assert bytes(out[i]) == th.chain(nodes[i].tobytes(), adrs, int(starts[i]), int(steps[i]))
+
+
+@pytest.mark.parametrize("name", ["fedsign-128", "sha2-128f"])
+def test_subtree_root_matches_hashlib(name):
+    params = SphincsParams(name)
+    sk_seed, pk_seed = os.urandom(params.n), os.urandom(params.n)
+    roots = [Hypertree(params, backend=backend).gen_root(sk_seed, pk_seed) for backend in ("hashlib", "numpy")]
+    assert roots[0] == roots[1]
+    leaves = [Hypertree(params, backend=backend).gen_leaves(sk_seed, pk_seed, 0, 3)
+              for backend in ("hashlib", "numpy")]
+    assert leaves[0] == leaves[1]
+
+
+def test_fors_matches_hashlib():
+    params = SphincsParams("sha2-128f")
+    sk_seed, pk_seed = os.urandom(params.n), os.urandom(params.n)
+    md = os.urandom((params.k * params.a + 7) // 8)
+    results = [FORS(params, backend).sign_with_pk(md, sk_seed, pk_seed, 9, 2) for backend in ("hashlib", "numpy")]
+    assert results[0] == results[1]
+
+
+@pytest.mark.parametrize("name", ["fedsign-128", "sha2-128f"])
+def test_numpy_signature_verifies_with_hashlib(name):
+    signer = SPHINCSPlus(name, backend="numpy")
+    verifier = SPHINCSPlus(name, backend="hashlib")
+    public_key, private_key = signer.keygen()
+    signature = signer.sign(b"client update", private_key)
+    assert verifier.verify(b"client update", signature, public_key)
+    signer.close()
+    verifier.close()
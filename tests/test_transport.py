@@ -0,0 +1,47 @@
+import torch
+from transport import ConnectionPool, UpdateListener
+
+
+def test_late_frame_from_previous_round_is_dropped():
+    listener = UpdateListener().start()
+    pool = ConnectionPool(listener.address, 2)
+    try:
+        pool.send_update(1, {'weight': torch.ones(3)}, {'round': 0}, round_idx=0)
+        # 第0轮等待client 0超时，之后它的旧帧才到达，紧接着是第1轮的新帧
+        assert set(listener.receive(2, timeout=0.2, round_idx=0, client_ids=[0, 1])) == {1}
+        pool.send_update(0, {'weight': torch.zeros(3)}, {'round': 0}, round_idx=0)
+        pool.send_update(0, {'weight': torch.full((3,), 2.0)}, {'round': 1}, round_idx=1)
+
+        messages = listener.receive(1, timeout=5, round_idx=1, client_ids=[0])
+        assert list(messages) == [0]
+        assert messages[0].meta['stats'] == {'round': 1}
+        assert torch.equal(messages[0].state_dict()['weight'], torch.full((3,), 2.0))
+        assert listener.stale_messages == 1
+        assert listener.receive(1, timeout=0.2, round_idx=2, client_ids=[0]) == {}
+    finally:
+        pool.close()
+        listener.close()
+
+
+def test_unexpected_client_does_not_count_toward_round():
+    listener = UpdateListener().start()
+    pool = ConnectionPool(listener.address, 1)
+    try:
+        pool.send_update(5, {'weight': torch.ones(2)}, round_idx=3)
+        pool.send_update(2, {'weight': torch.ones(2)}, round_idx=3)
+        assert list(listener.receive(1, timeout=5, round_idx=3, client_ids=[2])) == [2]
+        assert listener.stale_messages == 1
+    finally:
+        pool.close()
+        listener.close()
+
+
+def test_receive_returns_partial_result_on_timeout():
+    listener = UpdateListener().start()
+    pool = ConnectionPool(listener.address, 1)
+    try:
+        pool.send_update(0, {'weight': torch.ones(2)}, round_idx=0)
+        assert list(listener.receive(3, timeout=0.2, round_idx=0, client_ids=[0, 1, 2])) == [0]
+    finally:
+        pool.close()
+        listener.close()
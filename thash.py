@@ -0,0 +1,109 @@
+import struct
+import hashlib
+from functools import lru_cache
+
+_U32 = struct.Struct(">I")
+_U64 = struct.Struct(">Q")
+
+"""ADRS类型，与SPHINCS+规范一致"""
+WOTS_HASH = 0
+WOTS_PK = 1
+TREE = 2
+FORS_TREE = 3
+FORS_ROOTS = 4
+WOTS_PRF = 5
+FORS_PRF = 6
+
+
+class ADRS:
+    """32字节哈希地址，字段原地更新以便在循环中复用
+
+    布局: layer(4) | tree(12, 低8字节有效) | type(4) | keypair(4) | chain/height(4) | hash/index(4)
+    """
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes = None):
+        self.data = bytearray(32) if data is None else bytearray(data)
+
+    def copy(self) -> "ADRS":
+        return ADRS(self.data)
+
+    def set_layer(self, layer: int) -> "ADRS":
+        _U32.pack_into(self.data, 0, layer)
+        return self
+
+    def set_tree(self, tree: int) -> "ADRS":
+        _U64.pack_into(self.data, 8, tree)
+        return self
+
+    def set_type(self, addr_type: int) -> "ADRS":
+        """设置类型并清零其后的字段"""
+        _U32.pack_into(self.data, 16, addr_type)
+        self.data[20:32] = bytes(12)
+        return self
+
+    def set_keypair(self, keypair: int) -> "ADRS":
+        _U32.pack_into(self.data, 20, keypair)
+        return self
+
+    def set_chain(self, chain: int) -> "ADRS":
+        _U32.pack_into(self.data, 24, chain)
+        return self
+
+    def set_hash(self, hash_idx: int) -> "ADRS":
+        _U32.pack_into(self.data, 28, hash_idx)
+        return self
+
+    def set_tree_height(self, height: int) -> "ADRS":
+        _U32.pack_into(self.data, 24, height)
+        return self
+
+    def set_tree_index(self, index: int) -> "ADRS":
+        _U32.pack_into(self.data, 28, index)
+        return self
+
+
+class TweakableHash:
+    """以pk_seed为前缀的可调哈希，pk_seed填充为一个完整SHA-256分组后只吸收一次
+
+    输出截断为n = len(pk_seed)字节，n<32的参数集（如sha2-128*）与n=32共用同一实现
+    """
+
+    def __init__(self, pk_seed: bytes):
+        self.pk_seed = pk_seed
+        self.n = len(pk_seed)
+        self._state = hashlib.sha256(pk_seed + bytes(64 - len(pk_seed) % 64))
+
+    def thash(self, data: bytes, adrs: ADRS) -> bytes:
+        """T(PK.seed, ADRS, data)"""
+        h = self._state.copy()
+        h.update(adrs.data)
+        h.update(data)
+        return h.digest()[:self.n]
+
+    def chain(self, node: bytes, adrs: ADRS, chain_start: int, steps: int) -> bytes:
+        """沿哈希链迭代steps次，原地改写ADRS的hash字段（w<=256时只需改最低字节）"""
+        state = self._state
+        data = adrs.data
+        n = self.n
+        _U32.pack_into(data, 28, 0)
+        for i in range(chain_start, chain_start + steps):
+            data[31] = i
+            h = state.copy()
+            h.update(data)
+            h.update(node)
+            node = h.digest()[:n]
+        return node
+
+    def prf(self, sk_seed: bytes, adrs: ADRS) -> bytes:
+        """PRF(PK.seed, SK.seed, ADRS)，用于生成WOTS+/FORS私钥元素"""
+        h = self._state.copy()
+        h.update(adrs.data)
+        h.update(sk_seed)
+        return h.digest()[:self.n]
+
+
+@lru_cache(maxsize=32)
+def get_thash(pk_seed: bytes) -> TweakableHash:
+    """按pk_seed复用预计算的哈希状态"""
+    return TweakableHash(pk_seed)
@@ -0,0 +1,165 @@
+import hashlib
+import numpy as np
+from functools import lru_cache
+from thash import ADRS
+
+_K = np.array([
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2,
+], dtype=np.uint32)
+
+"""lanes少于该值时向量化的固定开销大于收益，逐条交给hashlib"""
+MIN_LANES = 256
+
+_IV = np.array([0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19],
+               dtype=np.uint32)
+
+
+def _rotr(x: np.ndarray, r: int) -> np.ndarray:
+    return (x >> np.uint32(r)) | (x << np.uint32(32 - r))
+
+
+def _schedule(words: np.ndarray) -> list:
+    """消息扩展：16个字(每个为一列lanes) -> 64个K[t]+W[t]，轮函数中少做一次加法"""
+    w = list(words)
+    for t in range(16, 64):
+        w15, w2 = w[t - 15], w[t - 2]
+        s0 = _rotr(w15, 7) ^ _rotr(w15, 18) ^ (w15 >> np.uint32(3))
+        s1 = _rotr(w2, 17) ^ _rotr(w2, 19) ^ (w2 >> np.uint32(10))
+        w.append(w[t - 16] + s0 + w[t - 7] + s1)
+    return [_K[t] + w[t] for t in range(64)]
+
+
+def _compress(state: np.ndarray, kw: list) -> np.ndarray:
+    """对所有lanes同时做一次SHA-256压缩，state形状(8, N)，kw为64个可广播到(N,)的K[t]+W[t]"""
+    a, b, c, d, e, f, g, h = state
+    for t in range(64):
+        s1 = _rotr(e, 6) ^ _rotr(e, 11) ^ _rotr(e, 25)
+        ch = g ^ (e & (f ^ g))
+        t1 = h + s1 + ch + kw[t]
+        s0 = _rotr(a, 2) ^ _rotr(a, 13) ^ _rotr(a, 22)
+        maj = (a & b) | (c & (a | b))
+        h, g, f, e, d, c, b, a = g, f, e, d + t1, c, b, a, t1 + s0 + maj
+    return state + np.stack([a, b, c, d, e, f, g, h])
+
+
+def _block_words(blocks: np.ndarray) -> np.ndarray:
+    """(N, 64)字节 -> (16, N)大端uint32"""
+    return np.ascontiguousarray(blocks.view(">u4").astype(np.uint32).T)
+
+
+@lru_cache(maxsize=16)
+def _padding_schedule(total_len: int) -> list:
+    """消息长度为64字节整数倍时最后一个填充分组是常量，其扩展结果只需计算一次"""
+    block = np.zeros((1, 64), dtype=np.uint8)
+    block[0, 0] = 0x80
+    block[0, 56:] = np.frombuffer((total_len * 8).to_bytes(8, "big"), dtype=np.uint8)
+    return _schedule(_block_words(block))
+
+
+def adrs_rows(adrs: ADRS, count: int) -> np.ndarray:
+    """把一个ADRS复制成(count, 32)的地址矩阵，各行再按需改写字段"""
+    return np.tile(np.frombuffer(bytes(adrs.data), dtype=np.uint8), (count, 1))
+
+
+def set_rows_field(rows: np.ndarray, offset: int, values) -> np.ndarray:
+    """按行写入ADRS中offset处的4字节大端字段（keypair=20, chain/height=24, hash/index=28）"""
+    values = np.asarray(values, dtype=">u4").reshape(-1, 1)
+    rows[:, offset:offset + 4] = np.broadcast_to(values, (len(rows), 1)).view(np.uint8)
+    return rows
+
+
+class BatchTweakableHash:
+    """NumPy多路SHA-256：pk_seed前缀分组的中间状态只算一次，每次调用对N条等长消息同步做压缩
+
+    结果与TweakableHash逐条计算完全一致（同样截断为n = len(pk_seed)字节）；
+    lanes越多（例如整棵子树所有WOTS+链）摊销越好
+    """
+
+    def __init__(self, pk_seed: bytes):
+        self.pk_seed = pk_seed
+        self.n = len(pk_seed)
+        prefix = pk_seed + bytes(64 - len(pk_seed) % 64)
+        self._prefix_len = len(prefix)
+        self._hashlib_state = hashlib.sha256(prefix)
+        self._midstate = None
+
+    def _get_midstate(self) -> np.ndarray:
+        """前缀分组压缩后的中间状态，首次走向量化路径时才计算"""
+        if self._midstate is None:
+            prefix = self.pk_seed + bytes(64 - len(self.pk_seed) % 64)
+            state = _IV.reshape(8, 1).copy()
+            for block in np.frombuffer(prefix, dtype=np.uint8).reshape(-1, 64):
+                state = _compress(state, _schedule(_block_words(block.reshape(1, 64))))
+            self._midstate = state
+        return self._midstate
+
+    def hash_many(self, suffixes: np.ndarray) -> np.ndarray:
+        """对(N, L)条消息计算SHA-256(prefix || suffix)，返回截断后的(N, n)"""
+        count, length = suffixes.shape
+        if count < MIN_LANES:
+            out = np.empty((count, 32), dtype=np.uint8)
+            for i, suffix in enumerate(suffixes):
+                h = self._hashlib_state.copy()
+                h.update(suffix.tobytes())
+                out[i] = np.frombuffer(h.digest(), dtype=np.uint8)
+            return out[:, :self.n]
+
+        total_len = self._prefix_len + length
+        state = np.repeat(self._get_midstate(), count, axis=1)
+
+        full_blocks = length // 64
+        data = np.ascontiguousarray(suffixes, dtype=np.uint8)
+        for i in range(full_blocks):
+            state = _compress(state, _schedule(_block_words(data[:, i * 64:(i + 1) * 64])))
+
+        tail = length - full_blocks * 64
+        if tail == 0:
+            state = _compress(state, _padding_schedule(total_len))
+        else:
+            pad_len = 64 if tail + 9 <= 64 else 128
+            padded = np.zeros((count, pad_len), dtype=np.uint8)
+            padded[:, :tail] = data[:, full_blocks * 64:]
+            padded[:, tail] = 0x80
+            padded[:, -8:] = np.frombuffer((total_len * 8).to_bytes(8, "big"), dtype=np.uint8)
+            for i in range(pad_len // 64):
+                state = _compress(state, _schedule(_block_words(padded[:, i * 64:(i + 1) * 64])))
+
+        return np.ascontiguousarray(state.T).astype(">u4").view(np.uint8).reshape(count, 32)[:, :self.n]
+
+    def thash_many(self, data: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """逐行T(PK.seed, ADRS_i, data_i)"""
+        return self.hash_many(np.concatenate([rows, data], axis=1))
+
+    def prf_many(self, sk_seed: bytes, rows: np.ndarray) -> np.ndarray:
+        """逐行PRF(PK.seed, SK.seed, ADRS_i)"""
+        seeds = np.tile(np.frombuffer(sk_seed, dtype=np.uint8), (len(rows), 1))
+        return self.hash_many(np.concatenate([rows, seeds], axis=1))
+
+    def chain_many(self, nodes: np.ndarray, rows: np.ndarray, starts, steps) -> np.ndarray:
+        """所有链同步前进：第s步只压缩尚未走完的lanes，各链从starts[i]开始走steps[i]步"""
+        nodes = np.array(nodes, dtype=np.uint8)
+        rows = np.array(rows, dtype=np.uint8)
+        starts = np.asarray(starts, dtype=np.int64)
+        steps = np.asarray(steps, dtype=np.int64)
+        rows[:, 28:31] = 0
+        max_steps = int(steps.max()) if len(steps) else 0
+        for s in range(max_steps):
+            active = np.nonzero(steps > s)[0]
+            rows[active, 31] = starts[active] + s
+            if len(active) == len(nodes):
+                nodes = self.thash_many(nodes, rows)
+            else:
+                nodes[active] = self.thash_many(nodes[active], rows[active])
+        return nodes
+
+
+@lru_cache(maxsize=32)
+def get_batch_thash(pk_seed: bytes) -> BatchTweakableHash:
+    return BatchTweakableHash(pk_seed)
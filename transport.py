@@ -0,0 +1,256 @@
+import json
+import queue
+import socket
+import struct
+import threading
+import time
+import torch
+from tensor_io import tensor_buffer
+
+MAGIC = b"FEDT"
+VERSION = 2
+MSG_UPDATE = 1
+MSG_ACK = 2
+
+"""帧头：magic、版本、消息类型、client_id、元数据长度、张量负载长度
+
+帧中不携带签名：本仿真中只有服务器持有签名私钥，训练线程/进程上传更新并报告上传前的摘要，
+服务器对该摘要签名，再针对收到的字节重新计算摘要来验证
+"""
+_HEADER = struct.Struct(">4sBBIIQ")
+_IOV_MAX = 512
+"""默认允许的最大帧体（元数据+张量负载）字节数，超过时拒绝而不按帧头分配内存"""
+MAX_FRAME_BYTES = 64 << 20
+
+
+def _send_buffers(sock: socket.socket, buffers: list) -> int:
+    """用sendmsg一次提交多个缓冲区（帧头、元数据、张量内存），不先拼接；处理部分发送"""
+    views = [memoryview(buf).cast("B") for buf in buffers if len(buf)]
+    total = sum(len(view) for view in views)
+    start = 0
+    while start < len(views):
+        sent = sock.sendmsg(views[start:start + _IOV_MAX])
+        while sent:
+            if sent >= len(views[start]):
+                sent -= len(views[start])
+                start += 1
+            else:
+                views[start] = views[start][sent:]
+                sent = 0
+    return total
+
+
+def _recv_into(sock: socket.socket, view: memoryview):
+    while len(view):
+        received = sock.recv_into(view)
+        if received == 0:
+            raise ConnectionError("连接已关闭")
+        view = view[received:]
+
+
+def send_message(sock: socket.socket, kind: int, client_id: int, meta: dict = None, buffers=()) -> int:
+    """发送一帧消息，返回发送的字节数"""
+    meta_bytes = json.dumps(meta or {}).encode("utf-8")
+    buffers = list(buffers)
+    payload_len = sum(len(buf) for buf in buffers)
+    header = _HEADER.pack(MAGIC, VERSION, kind, client_id, len(meta_bytes), payload_len)
+    return _send_buffers(sock, [header, meta_bytes, *buffers])
+
+
+def recv_message(sock: socket.socket, max_bytes: int = MAX_FRAME_BYTES) -> tuple:
+    """接收一帧消息，返回(Message, 接收字节数)；张量负载直接读入一块连续缓冲区
+
+    帧头声明的长度超过max_bytes时抛出ValueError，不为其分配缓冲区
+    """
+    header = bytearray(_HEADER.size)
+    _recv_into(sock, memoryview(header))
+    magic, version, kind, client_id, meta_len, payload_len = _HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("无效的传输帧")
+    if meta_len + payload_len > max_bytes:
+        raise ValueError(f"传输帧过大: {meta_len + payload_len} bytes，上限 {max_bytes} bytes")
+
+    body = bytearray(meta_len + payload_len)
+    _recv_into(sock, memoryview(body))
+    meta = json.loads(body[:meta_len].decode("utf-8"))
+    payload = memoryview(body)[meta_len:]
+    return Message(kind, client_id, meta, payload), _HEADER.size + len(body)
+
+
+def encode_state(state_dict: dict) -> tuple:
+    """state_dict -> (张量表, 零拷贝缓冲区列表)"""
+    table, buffers = [], []
+    for name, value in state_dict.items():
+        buf = tensor_buffer(value)
+        table.append([name, str(value.dtype).replace("torch.", ""), list(value.shape), len(buf)])
+        buffers.append(buf)
+    return table, buffers
+
+
+class Message:
+    def __init__(self, kind: int, client_id: int, meta: dict, payload: memoryview):
+        self.kind = kind
+        self.client_id = client_id
+        self.meta = meta
+        self.payload = payload
+
+    def state_dict(self) -> dict:
+        """按张量表把负载切回张量，共享接收缓冲区的内存"""
+        state_dict = {}
+        offset = 0
+        for name, dtype, shape, nbytes in self.meta.get("tensors", []):
+            dtype = getattr(torch, dtype)
+            count = nbytes // torch.empty((), dtype=dtype).element_size()
+            value = torch.frombuffer(self.payload, dtype=dtype, count=count, offset=offset) if count else \
+                torch.empty(0, dtype=dtype)
+            state_dict[name] = value.view(shape)
+            offset += nbytes
+        return state_dict
+
+
+class UpdateListener:
+    """服务器端监听器：每个持久连接一个接收线程，收到的更新放入队列并回ACK；无效或超过max_frame_bytes的帧直接断开连接"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, max_frame_bytes: int = MAX_FRAME_BYTES):
+        self.max_frame_bytes = max_frame_bytes
+        self._server = socket.create_server((host, port))
+        self.address = self._server.getsockname()
+        self._queue = queue.Queue()
+        self._threads = []
+        self._connections = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.messages = 0
+        self.bytes_received = 0
+        """丢弃的过期帧（其他轮次或非本轮客户端）数量"""
+        self.stale_messages = 0
+
+    def start(self) -> "UpdateListener":
+        thread = threading.Thread(target=self._accept_loop, name="transport-accept", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self._connections.append(conn)
+            thread = threading.Thread(target=self._serve, args=(conn,), name="transport-conn", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _serve(self, conn: socket.socket):
+        while not self._closed:
+            try:
+                message, nbytes = recv_message(conn, self.max_frame_bytes)
+            except ValueError as exc:
+                print(f"传输连接已断开: {exc}")
+                conn.close()
+                return
+            except (ConnectionError, OSError):
+                return
+            with self._lock:
+                self.messages += 1
+                self.bytes_received += nbytes
+            self._queue.put(message)
+            send_message(conn, MSG_ACK, message.client_id)
+
+    def receive(self, count: int, timeout: float = None, round_idx: int = None, client_ids=None) -> dict:
+        """等待count条更新，返回client_id -> Message；给出timeout(秒)时总共最多等待这么久，超时返回已收到的部分
+
+        给出round_idx/client_ids时只接受该轮、这些客户端的帧：上一轮超时后才到达的帧留在队列里，
+        在这里被取出丢弃，不会顶替本轮的更新
+        """
+        expected = None if client_ids is None else {int(client_id) for client_id in client_ids}
+        messages = {}
+        deadline = None if timeout is None else time.time() + timeout
+        while len(messages) < count:
+            try:
+                message = self._queue.get(timeout=None if deadline is None else max(0.0, deadline - time.time()))
+            except queue.Empty:
+                break
+            if (round_idx is not None and message.meta.get("round") != round_idx) or \
+                    (expected is not None and message.client_id not in expected):
+                with self._lock:
+                    self.stale_messages += 1
+                continue
+            messages[message.client_id] = message
+        return messages
+
+    def close(self):
+        self._closed = True
+        self._server.close()
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+class ConnectionPool:
+    """客户端到服务器的持久连接池，按需建立，最多size条，发送完一条更新后归还复用"""
+
+    def __init__(self, address: tuple, size: int = 4):
+        self.address = address
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._slots = threading.Semaphore(size)
+        self.messages = 0
+        self.bytes_sent = 0
+        self.latencies_ms = []
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> socket.socket:
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            sock = socket.create_connection(self.address)
+        except OSError:
+            self._slots.release()
+            raise
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _release(self, sock: socket.socket, healthy: bool = True):
+        if healthy:
+            self._idle.put(sock)
+        else:
+            sock.close()
+        self._slots.release()
+
+    def send_update(self, client_id: int, state_dict: dict, stats: dict = None, round_idx: int = None) -> tuple:
+        """发送一个客户端更新并等待ACK，返回(发送字节数, 往返延迟ms)；round_idx写入帧元数据，供服务器丢弃过期帧"""
+        table, buffers = encode_state(state_dict)
+        sock = self._acquire()
+        try:
+            start_time = time.time()
+            meta = {"tensors": table, "stats": stats or {}, "round": round_idx}
+            nbytes = send_message(sock, MSG_UPDATE, client_id, meta, buffers)
+            ack, _ = recv_message(sock)
+            latency_ms = (time.time() - start_time) * 1000
+        except (ConnectionError, OSError):
+            self._release(sock, healthy=False)
+            raise
+        self._release(sock)
+        if ack.kind != MSG_ACK:
+            raise ValueError("未收到ACK")
+
+        with self._lock:
+            self.messages += 1
+            self.bytes_sent += nbytes
+            self.latencies_ms.append(latency_ms)
+        return nbytes, latency_ms
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,97 @@
+import os
+import math
+import time
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from sphincs import SPHINCSPlus
+
+_worker_sphincs = None
+
+
+def _init_worker(security_level: int):
+    """进程池初始化：每个工作进程只构造一次SPHINCS+实例"""
+    global _worker_sphincs
+    _worker_sphincs = SPHINCSPlus(security_level)
+
+
+def _verify_items(sphincs: SPHINCSPlus, items: list) -> list:
+    results = []
+    for digest, signature, public_key in items:
+        start_time = time.time()
+        is_valid = sphincs.verify_digest(digest, signature, public_key)
+        results.append((is_valid, (time.time() - start_time) * 1000))
+    return results
+
+
+def _verify_chunk(items: list) -> list:
+    return _verify_items(_worker_sphincs, items)
+
+
+class VerifyPool:
+    """基于进程池的SPHINCS+并行批量验证，工作进程在多次调用间复用"""
+
+    def __init__(self, security_level: int = 128, workers: int = None, chunk_size: int = None):
+        self.security_level = security_level
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.chunk_size = chunk_size
+        self._executor = None
+        self._local_sphincs = None
+        self._local_executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # 进程池在训练线程和传输线程都已运行后才创建，fork多线程进程可能死锁，改用spawn
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=_init_worker, initargs=(self.security_level,))
+        return self._executor
+
+    def verify_many(self, items) -> list:
+        """并行验证(digest, signature, public_key)三元组，按输入顺序返回(is_valid, verify_time_ms)
+
+        只向工作进程传递32字节摘要，避免序列化整份模型权重
+        """
+        items = list(items)
+        if not items:
+            return []
+
+        if self.workers <= 1 or len(items) == 1:
+            if self._local_sphincs is None:
+                self._local_sphincs = SPHINCSPlus(self.security_level)
+            return _verify_items(self._local_sphincs, items)
+
+        chunk_size = self.chunk_size or max(1, math.ceil(len(items) / (self.workers * 4)))
+        executor = self._get_executor()
+        futures = [executor.submit(_verify_chunk, items[i:i + chunk_size])
+                   for i in range(0, len(items), chunk_size)]
+
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+    def submit(self, items) -> Future:
+        """异步验证一组三元组，立即返回Future，结果与verify_many相同
+
+        多进程时直接提交到进程池；单进程时在一个后台线程里验证，不阻塞调用方
+        """
+        items = list(items)
+        if self.workers > 1:
+            return self._get_executor().submit(_verify_chunk, items)
+        if self._local_executor is None:
+            self._local_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sphincs-verify")
+        return self._local_executor.submit(self.verify_many, items)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._local_executor is not None:
+            self._local_executor.shutdown()
+            self._local_executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
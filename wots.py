@@ -1,116 +1,164 @@
+import numpy as np
 from sphincs_params import SphincsParams
-import struct
-import hashlib
+from thash import ADRS, get_thash, WOTS_HASH, WOTS_PK, WOTS_PRF
+from thash_np import get_batch_thash, adrs_rows, set_rows_field
+
+HASH_BACKENDS = ("hashlib", "numpy")
 
 
 class WOTS:
-    def __init__(self, params: SphincsParams):
+    def __init__(self, params: SphincsParams, backend: str = "hashlib"):
+        """backend: 'hashlib'逐条哈希；'numpy'把一个密钥的所有链（或一组叶子的所有链）同步推进"""
+        if backend not in HASH_BACKENDS:
+            raise ValueError(f"未知的哈希后端: {backend}")
+        self.backend = backend
         self.params = params
         self.n = params.n
         self.w = params.w
         self.len = params.len
         self.len1 = params.len1
         self.len2 = params.len2
+        self.log_w = self.w.bit_length() - 1
 
-    def sign(self, msg: bytes, sk_seed: bytes, pk_seed: bytes, tree_idx: int, leaf_idx: int) -> bytes:
-        """生成WOTS+签名"""
-        msg_vals = self._chain_lengths(msg)
-        csum = 0
-        for val in msg_vals[:self.len1]:
-            csum += self.w - 1 - val
-
-        csum_vals = []
-        for _ in range(self.len2):
-            csum_vals.append(csum % self.w)
-            csum //= self.w
+    def _adrs(self, addr_type: int, tree_idx: int, leaf_idx: int, layer: int) -> ADRS:
+        return ADRS().set_layer(layer).set_tree(tree_idx).set_type(addr_type).set_keypair(leaf_idx)
 
-        sig = b""
-        for i in range(self.len):
-            if i < self.len1:
-                chain_len = msg_vals[i]
-            else:
-                chain_len = csum_vals[i - self.len1]
+    def _chain_rows(self, addr_type: int, tree_idx: int, leaf_indices, layer: int) -> np.ndarray:
+        """每个叶子的每条链一行ADRS，行序为(叶子, 链)"""
+        leaf_indices = np.asarray(leaf_indices, dtype=np.int64)
+        rows = adrs_rows(self._adrs(addr_type, tree_idx, 0, layer), len(leaf_indices) * self.len)
+        set_rows_field(rows, 20, np.repeat(leaf_indices, self.len))
+        set_rows_field(rows, 24, np.tile(np.arange(self.len), len(leaf_indices)))
+        return rows
 
-            sk = self.gen_sk(sk_seed, i, tree_idx, leaf_idx)
+    def _split(self, nodes: np.ndarray) -> list:
+        return [bytes(node) for node in nodes]
 
-            node = self.compute_chain(sk, chain_len, i, pk_seed, tree_idx, leaf_idx)
-            sig += node
+    def sign(self, msg: bytes, sk_seed: bytes, pk_seed: bytes, tree_idx: int, leaf_idx: int,
+             layer: int = 0) -> bytes:
+        """生成WOTS+签名"""
+        chain_lens = self._chain_lengths(msg)
+        if self.backend == "numpy":
+            bth = get_batch_thash(pk_seed)
+            sks = bth.prf_many(sk_seed, self._chain_rows(WOTS_PRF, tree_idx, [leaf_idx], layer))
+            rows = self._chain_rows(WOTS_HASH, tree_idx, [leaf_idx], layer)
+            return bth.chain_many(sks, rows, np.zeros(self.len), chain_lens).tobytes()
+
+        th = get_thash(pk_seed)
+        prf_adrs = self._adrs(WOTS_PRF, tree_idx, leaf_idx, layer)
+        hash_adrs = self._adrs(WOTS_HASH, tree_idx, leaf_idx, layer)
+
+        sig = []
+        for i in range(self.len):
+            sk = th.prf(sk_seed, prf_adrs.set_chain(i))
+            hash_adrs.set_chain(i)
+            sig.append(self._chain(th, hash_adrs, sk, 0, chain_lens[i]))
+
+        return b"".join(sig)
+
+    def gen_pks(self, sk_seed: bytes, pk_seed: bytes, tree_idx: int, leaf_indices, layer: int = 0) -> list:
+        """生成同一子树中多个叶子的压缩公钥；numpy后端把所有叶子的所有链作为lanes同步推进"""
+        leaf_indices = list(leaf_indices)
+        if self.backend != "numpy":
+            return [self.gen_pk(sk_seed, pk_seed, tree_idx, leaf_idx, layer) for leaf_idx in leaf_indices]
+        if not leaf_indices:
+            return []
+
+        bth = get_batch_thash(pk_seed)
+        sks = bth.prf_many(sk_seed, self._chain_rows(WOTS_PRF, tree_idx, leaf_indices, layer))
+        rows = self._chain_rows(WOTS_HASH, tree_idx, leaf_indices, layer)
+        ends = bth.chain_many(sks, rows, np.zeros(len(rows)), np.full(len(rows), self.w - 1))
+
+        pk_rows = adrs_rows(self._adrs(WOTS_PK, tree_idx, 0, layer), len(leaf_indices))
+        set_rows_field(pk_rows, 20, leaf_indices)
+        return self._split(bth.thash_many(ends.reshape(len(leaf_indices), self.len * self.n), pk_rows))
+
+    def gen_pk(self, sk_seed: bytes, pk_seed: bytes, tree_idx: int, leaf_idx: int, layer: int = 0) -> bytes:
+        """生成压缩后的WOTS+公钥（所有链走满w-1步）"""
+        if self.backend == "numpy":
+            return self.gen_pks(sk_seed, pk_seed, tree_idx, [leaf_idx], layer)[0]
+
+        th = get_thash(pk_seed)
+        prf_adrs = self._adrs(WOTS_PRF, tree_idx, leaf_idx, layer)
+        hash_adrs = self._adrs(WOTS_HASH, tree_idx, leaf_idx, layer)
+
+        nodes = []
+        for i in range(self.len):
+            sk = th.prf(sk_seed, prf_adrs.set_chain(i))
+            hash_adrs.set_chain(i)
+            nodes.append(self._chain(th, hash_adrs, sk, 0, self.w - 1))
 
-        return sig
+        return self._compress_pk(nodes, pk_seed, tree_idx, leaf_idx, layer)
 
-    def gen_sk(self, sk_seed: bytes, idx: int, tree_idx: int, leaf_idx: int) -> bytes:
+    def gen_sk(self, sk_seed: bytes, pk_seed: bytes, idx: int, tree_idx: int, leaf_idx: int,
+               layer: int = 0) -> bytes:
         """生成私钥元素"""
-        addr_bytes = struct.pack(">I", tree_idx) + struct.pack(">I", leaf_idx) + struct.pack(">H", idx)
-        return hashlib.sha256(sk_seed + b'\x00' + addr_bytes).digest()
+        adrs = self._adrs(WOTS_PRF, tree_idx, leaf_idx, layer).set_chain(idx)
+        return get_thash(pk_seed).prf(sk_seed, adrs)
 
     def compute_chain(self, start: bytes, steps: int, key_idx: int, pk_seed: bytes, tree_idx: int,
-                      leaf_idx: int) -> bytes:
-        """计算哈希链"""
-        node = start
-        for i in range(steps):
-            node = self._hash(node, i, key_idx, pk_seed, tree_idx, leaf_idx)
-        return node
-
-    def _hash(self, node: bytes, chain_index: int, key_index: int, pk_seed: bytes, tree_idx: int,
-              leaf_idx: int) -> bytes:
-        """链上的哈希函数"""
-        addr_bytes = struct.pack(">I", tree_idx) + struct.pack(">I", leaf_idx) + struct.pack(">H",
-                                                                                             key_index) + struct.pack(
-            ">H", chain_index)
-        return hashlib.sha256(node + pk_seed + addr_bytes).digest()
+                      leaf_idx: int, layer: int = 0, chain_start: int = 0) -> bytes:
+        """计算哈希链，从链上第chain_start个位置开始走steps步"""
+        adrs = self._adrs(WOTS_HASH, tree_idx, leaf_idx, layer).set_chain(key_idx)
+        return self._chain(get_thash(pk_seed), adrs, start, chain_start, steps)
 
-    def _chain_lengths(self, data: bytes) -> list:
-        """计算链长表示"""
+    def _chain(self, th, adrs: ADRS, node: bytes, chain_start: int, steps: int) -> bytes:
+        """在已设置好链地址的ADRS上迭代哈希链"""
+        return th.chain(node, adrs, chain_start, steps)
+
+    def _base_w(self, data: bytes, out_len: int) -> list:
+        """按log2(w)位一组将字节串转换为w进制数字"""
         vals = []
+        bits = 0
+        total = 0
         for byte in data:
-            vals.append(byte % self.w)
-            vals.append(byte // self.w)
-
-        while len(vals) < self.len1:
+            total = (total << 8) | byte
+            bits += 8
+            while bits >= self.log_w and len(vals) < out_len:
+                bits -= self.log_w
+                vals.append((total >> bits) & (self.w - 1))
+        while len(vals) < out_len:
             vals.append(0)
+        return vals
 
-        return vals[:self.len1]
-
-    def pk_from_sig(self, sig: bytes, msg: bytes, pk_seed: bytes, tree_idx: int, leaf_idx: int) -> bytes:
-        """从签名恢复WOTS+公钥"""
-
-        nodes = [sig[i * self.n: (i + 1) * self.n] for i in range(self.len)]
+    def _chain_lengths(self, data: bytes) -> list:
+        """计算链长表示（消息部分加校验和部分）"""
+        vals = self._base_w(data, self.len1)
 
-        msg_vals = self._chain_lengths(msg)
         csum = 0
-        for val in msg_vals[:self.len1]:
+        for val in vals:
             csum += self.w - 1 - val
 
-        csum_vals = []
         for _ in range(self.len2):
-            csum_vals.append(csum % self.w)
+            vals.append(csum % self.w)
             csum //= self.w
 
+        return vals
+
+    def pk_from_sig(self, sig: bytes, msg: bytes, pk_seed: bytes, tree_idx: int, leaf_idx: int,
+                    layer: int = 0) -> bytes:
+        """从签名恢复WOTS+公钥"""
+
+        chain_lens = self._chain_lengths(msg)
+        if self.backend == "numpy":
+            nodes = np.frombuffer(sig[:self.len * self.n], dtype=np.uint8).reshape(self.len, self.n)
+            rows = self._chain_rows(WOTS_HASH, tree_idx, [leaf_idx], layer)
+            ends = get_batch_thash(pk_seed).chain_many(nodes, rows, chain_lens,
+                                                        [self.w - 1 - length for length in chain_lens])
+            return self._compress_pk(self._split(ends), pk_seed, tree_idx, leaf_idx, layer)
+
+        nodes = [sig[i * self.n: (i + 1) * self.n] for i in range(self.len)]
+        th = get_thash(pk_seed)
+        hash_adrs = self._adrs(WOTS_HASH, tree_idx, leaf_idx, layer)
+
         wots_pk = []
         for i in range(self.len):
-            if i < self.len1:
-                steps_remaining = self.w - 1 - msg_vals[i]
-            else:
-                steps_remaining = self.w - 1 - csum_vals[i - self.len1]
-
-            node = nodes[i]
-            if steps_remaining > 0:
-                node = self.compute_chain(node, steps_remaining, i, pk_seed, tree_idx, leaf_idx)
-            wots_pk.append(node)
-
-        return self._l_tree(wots_pk, pk_seed, tree_idx, leaf_idx)
-
-    def _l_tree(self, nodes: list, pk_seed: bytes, tree_idx: int, leaf_idx: int) -> bytes:
-        """使用L-tree压缩公钥"""
-        while len(nodes) > 1:
-            new_nodes = []
-            for i in range(0, len(nodes), 2):
-                if i + 1 < len(nodes):
-                    combined = nodes[i] + nodes[i + 1]
-                    addr_bytes = struct.pack(">I", tree_idx) + struct.pack(">I", leaf_idx) + struct.pack(">H", i)
-                    new_nodes.append(hashlib.sha256(combined + pk_seed + addr_bytes).digest())
-                else:
-                    new_nodes.append(nodes[i])
-            nodes = new_nodes
-
-        return nodes[0]
+            hash_adrs.set_chain(i)
+            wots_pk.append(self._chain(th, hash_adrs, nodes[i], chain_lens[i], self.w - 1 - chain_lens[i]))
+
+        return self._compress_pk(wots_pk, pk_seed, tree_idx, leaf_idx, layer)
+
+    def _compress_pk(self, nodes: list, pk_seed: bytes, tree_idx: int, leaf_idx: int, layer: int = 0) -> bytes:
+        """用一次T_len可调哈希压缩全部链端点得到公钥（替代L-tree）"""
+        adrs = self._adrs(WOTS_PK, tree_idx, leaf_idx, layer)
+        return get_thash(pk_seed).thash(b"".join(nodes), adrs)